@@ -1,5 +1,4 @@
-﻿import eel
-import sys
+﻿import sys
 import os
 import time
 import re
@@ -7,12 +6,22 @@ import shutil
 import json
 import threading
 import queue
+import heapq
+import itertools
+import difflib
 import subprocess
+import sqlite3
+import errno
+import hashlib
+import importlib
+import importlib.util
+import functools
+import atexit
+import bisect
+import fnmatch
+from collections import deque
 from datetime import datetime
-from urllib.parse import quote
-from collections import OrderedDict
-import tkinter as tk 
-from tkinter import filedialog 
+from urllib.parse import quote, urlsplit
 import traceback
 
 # ===== EXE RESOURCE HANDLING =====
@@ -40,18 +49,132 @@ def normalize_windows_path(path):
     
     return path
 
+# ===== UI BRIDGE =====
+# Endpoints are collected here and only registered with Eel when the GUI starts,
+# so headless runs never import eel or tkinter.
+EXPOSED = {}
+
+def expose(func):
+    EXPOSED[func.__name__] = func
+    return func
+
+class UIEventBus:
+    """Collects frontend updates from any thread and delivers them in batches.
+
+    Log lines and toasts are numbered and kept in a bounded ring buffer; stats and
+    import progress are latest-wins. A flusher thread sends at most one batch per
+    interval through the sink, so workers never wait on the websocket, and a UI
+    that reconnects can fetch whatever it missed with backlog().
+    """
+    def __init__(self, capacity=1000, interval=0.25):
+        self.events = deque(maxlen=capacity)
+        self.interval = interval
+        self.seq = 0
+        self.sent = 0
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.sink = None
+        self.running = False
+        self.thread = None
+
+    def configure(self, config):
+        self.interval = max(0.05, float(config.get("ui_flush_ms", 250)) / 1000)
+        capacity = max(50, int(config.get("ui_backlog", 1000)))
+        if capacity != self.events.maxlen:
+            with self.lock:
+                self.events = deque(self.events, maxlen=capacity)
+
+    def publish(self, kind, *args):
+        with self.lock:
+            self.seq += 1
+            self.events.append((self.seq, kind, args))
+
+    def update(self, kind, payload):
+        with self.lock:
+            self.latest[kind] = payload
+
+    def start(self, sink):
+        self.sink = sink
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name="ui-events", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(self.interval * 4)
+        self.flush()
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            events = [[seq, kind, *args] for seq, kind, args in self.events if seq > self.sent]
+            if events and events[0][0] > self.sent + 1:
+                # The ring overflowed between flushes
+                self.latest["dropped"] = events[0][0] - self.sent - 1
+            latest, self.latest = self.latest, {}
+            self.sent = self.seq
+            seq = self.seq
+        if not (events or latest) or not self.sink:
+            return
+        try:
+            self.sink("js_events", {"seq": seq, "events": events, **latest})
+        except Exception:
+            # Frontend gone; it catches up through backlog() when it reconnects
+            pass
+
+    def backlog(self, since=0):
+        """Buffered events newer than since, and how many older ones the ring already dropped"""
+        with self.lock:
+            first = self.events[0][0] if self.events else self.seq + 1
+            return {"seq": self.seq, "dropped": max(0, first - since - 1),
+                    "events": [[seq, kind, *args] for seq, kind, args in self.events if seq > since]}
+
 # ===== CONFIGURATION =====
 CONFIG_FILE = "sorter_config.json"
-STATS = {'tv': 0, 'movies': 0, 'music': 0, 'other': 0}
+
+class StatCounters:
+    """Per-category move counters, safe to bump from any worker thread"""
+    def __init__(self, keys):
+        self.lock = threading.Lock()
+        self.values = dict.fromkeys(keys, 0)
+
+    def incr(self, key, n=1):
+        with self.lock:
+            if key not in self.values:
+                return False
+            self.values[key] += n
+            return True
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __iter__(self):
+        return iter(list(self.values))
+
+STATS = StatCounters(['tv', 'movies', 'music', 'other'])
 
 def load_config():
     defaults = {
         "monitor": "", "tv": "", "movie": "", "music": "", "other": "", 
-        "api_key": "", "acoustid_key": "", "use_ai_correction": True
+        "api_key": "", "acoustid_key": "", "use_ai_correction": True, "offline_mode": False,
+        "use_metadata_cache": True, "cache_ttl_days": 30, "cache_negative_ttl_hours": 24,
+        "cache_max_mb": 64, "library_rescan_minutes": 60,
+        "full_rescan_minutes": 30
     }
     
     config_path = os.path.abspath(CONFIG_FILE)
-    print(f"Loading config from: {config_path}")
+    # stderr, so it never mixes with the headless CLI's JSON output
+    print(f"Loading config from: {config_path}", file=sys.stderr)
     
     if os.path.exists(config_path):
         try:
@@ -92,54 +215,51 @@ def save_config_file(config_data):
         json.dump(config_copy, f, indent=4)
 
 # ===== LIBRARY & FFMPEG CHECKS =====
-MISSING_LIBS = []
-FFMPEG_AVAILABLE = False
+# Optional backends are imported on first use and probes run once, when first
+# asked, so start-up never pays for libraries or subprocesses a run does not need.
+REQUIRED_LIBS = ("watchdog", "requests")
+_OPTIONAL_MODULES = {}
+_OPTIONAL_LOCK = threading.Lock()
 
-def check_ffmpeg():
-    """Checks if ffmpeg is available in the system PATH"""
+def optional_module(name):
+    """Imports an optional dependency on first use; None if it is not installed"""
     try:
-        # Check if ffmpeg is in PATH
-        if shutil.which("ffmpeg"):
-            return True
-        # Fallback: try running it directly
-        subprocess.run(["ffmpeg", "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, shell=True)
+        return _OPTIONAL_MODULES[name]
+    except KeyError:
+        pass
+    with _OPTIONAL_LOCK:
+        if name not in _OPTIONAL_MODULES:
+            try:
+                _OPTIONAL_MODULES[name] = importlib.import_module(name)
+            except ImportError:
+                _OPTIONAL_MODULES[name] = None
+        return _OPTIONAL_MODULES[name]
+
+@functools.lru_cache(maxsize=None)
+def has_module(name):
+    """Whether a dependency is installed, without importing it"""
+    if name in sys.modules:
         return True
-    except:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
         return False
 
-FFMPEG_AVAILABLE = check_ffmpeg()
-
-try:
-    from watchdog.observers import Observer
-    from watchdog.events import FileSystemEventHandler
-except ImportError: 
-    MISSING_LIBS.append("watchdog")
-
-try:
-    import requests
-    REQUESTS_AVAILABLE = True
-except ImportError: 
-    MISSING_LIBS.append("requests")
-    REQUESTS_AVAILABLE = False
-
-try:
-    from tmdbv3api import TMDb, Search, TV, Movie, Episode
-    TMDB_AVAILABLE = True
-except ImportError: 
-    TMDB_AVAILABLE = False
-
-try:
-    import mutagen
-    from mutagen.easyid3 import EasyID3
-    MUTAGEN_AVAILABLE = True
-except ImportError: 
-    MUTAGEN_AVAILABLE = False
-
-try:
-    import acoustid
-    ACOUSTID_AVAILABLE = True
-except ImportError: 
-    ACOUSTID_AVAILABLE = False
+def missing_libs():
+    return [name for name in REQUIRED_LIBS if not has_module(name)]
+
+@functools.lru_cache(maxsize=None)
+def check_ffmpeg():
+    """Checks if ffmpeg is available in the system PATH (probed once, then cached)"""
+    if shutil.which("ffmpeg"):
+        return True
+    # Fallback: try running it directly, e.g. an ffmpeg.exe next to the app
+    try:
+        result = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL, timeout=10)
+        return result.returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
 
 # ===== UTILITY FUNCTIONS =====
 def safe_path_join(base, *paths):
@@ -152,7 +272,27 @@ def safe_path_join(base, *paths):
     except: 
         return None
 
+def is_inside(path, root):
+    """True if path is strictly below root, with symlinks resolved"""
+    try:
+        path, root = os.path.realpath(path), os.path.realpath(root)
+        return path != root and os.path.commonpath([path, root]) == root
+    except ValueError:
+        return False
+
 # ===== INTELLIGENT PARSER =====
+# Compiled once and shared by the parser, classifier and processor
+YEAR_PATTERN = re.compile(r'\b(19|20)\d{2}\b')
+TV_MARKER_PATTERN = re.compile(r'(s\d+|season)', re.IGNORECASE)
+EPISODE_PATTERNS = [
+    re.compile(r'(?:s|season)\s?(\d{1,2})\s?(?:e|x|episode)\s?(\d{1,2})', re.IGNORECASE),
+    re.compile(r'(\d{1,2})x(\d{1,2})', re.IGNORECASE)
+]
+PAREN_OR_BRACKET_PATTERN = re.compile(r'\((.*?)\)|\[.*?\]')
+PAREN_KEEP_PATTERN = re.compile(r'^(?:\d{4}|US|UK|Extended)$', re.IGNORECASE)
+SEPARATOR_TABLE = str.maketrans('._-', '   ')
+INVALID_NAME_CHARS = re.compile(r'[<>:"/\\|?*]')
+
 class IntelligentParser:
     def __init__(self):
         self.patterns = {
@@ -161,67 +301,856 @@ class IntelligentParser:
             "group": ["rarbg", "yify", "yts", "eztv", "psa", "tgx"],
             "edition": ["extended", "unrated", "directors cut", "remastered"]
         }
+        self.compile_patterns()
+
+    def compile_patterns(self):
+        """Builds the single junk-term alternation; call again after editing self.patterns"""
+        terms = sorted({t for category in self.patterns.values() for t in category}, key=len, reverse=True)
+        self.junk_pattern = re.compile(
+            r'\b(?:' + '|'.join(re.escape(t) for t in terms) + r')\b', re.IGNORECASE)
+
+    def is_tv(self, filename):
+        return TV_MARKER_PATTERN.search(filename) is not None
+
+    @staticmethod
+    def _paren_handler(match):
+        content = match.group(1)
+        if content is None:
+            return ""
+        return f" ({content})" if PAREN_KEEP_PATTERN.match(content) else ""
 
     def clean_filename_aggressive(self, filename):
-        name = os.path.splitext(filename)[0]
-        name = name.replace('.', ' ').replace('_', ' ').replace('-', ' ')
+        name = os.path.splitext(filename)[0].translate(SEPARATOR_TABLE)
         
         # Stop at Year
-        year_match = re.search(r'\b(19|20)\d{2}\b', name)
+        year_match = YEAR_PATTERN.search(name)
         if year_match: 
             name = name[:year_match.end()]
             
-        # Strip patterns
-        for category in self.patterns.values():
-            for term in category:
-                name = re.sub(rf'\b{term}\b', '', name, flags=re.IGNORECASE)
-        
-        # Parentheses logic
-        def paren_handler(match):
-            content = match.group(1)
-            keep = [r'^\d{4}$', r'^US$', r'^UK$', r'^Extended$']
-            if any(re.match(p, content, re.IGNORECASE) for p in keep):
-                return f" ({content})"
-            return ""
-        
-        name = re.sub(r'\((.*?)\)', paren_handler, name)
-        name = re.sub(r'\[.*?\]', '', name)
-        return re.sub(r'\s+', ' ', name).strip()
+        # Strip junk terms, then parentheses (keeping years/regions) and brackets in one pass
+        name = self.junk_pattern.sub('', name)
+        name = PAREN_OR_BRACKET_PATTERN.sub(self._paren_handler, name)
+        return ' '.join(name.split())
+
+# ===== METRICS =====
+# Upper bounds in seconds; fine at the low end for API calls, wide at the top for copies and stability waits
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+PROVIDER_NAMES = {
+    "api.tvmaze.com": "tvmaze",
+    "api.themoviedb.org": "tmdb",
+    "musicbrainz.org": "musicbrainz",
+    "api.acoustid.org": "acoustid",
+}
+METRIC_HELP = {
+    "mediasorter_stage_seconds": ("histogram", "Time spent handling one item, per pipeline stage"),
+    "mediasorter_stage_errors_total": ("counter", "Items whose handler raised, per pipeline stage"),
+    "mediasorter_stability_wait_seconds": ("histogram", "Time from tracking a file until it was stable"),
+    "mediasorter_stage_workers": ("gauge", "Worker threads per pipeline stage"),
+    "mediasorter_stage_busy_workers": ("gauge", "Worker threads currently handling an item"),
+    "mediasorter_stage_busy_seconds_total": ("counter", "Summed handler time; rate() over workers is utilisation"),
+    "mediasorter_stage_queue_depth": ("gauge", "Items waiting in each stage's queue"),
+    "mediasorter_tracked_files": ("gauge", "Files waiting for their download to finish"),
+    "mediasorter_spilled_files": ("gauge", "Queued files spilled to the journal beyond the queue capacity"),
+    "mediasorter_api_requests_total": ("counter", "HTTP responses per metadata provider and status code"),
+    "mediasorter_api_errors_total": ("counter", "Failed calls per provider: transport errors, 429s and 5xx"),
+    "mediasorter_api_request_seconds": ("histogram", "HTTP response time per metadata provider"),
+    "mediasorter_api_throttle_seconds_total": ("counter", "Time spent waiting on the per-host rate limit"),
+    "mediasorter_moved_bytes_total": ("counter", "Bytes moved, by method (rename or copy)"),
+    "mediasorter_move_seconds": ("histogram", "Time per file move, by method"),
+    "mediasorter_fingerprint_seconds": ("histogram", "Time per fpcalc run"),
+    "mediasorter_cache_lookups_total": ("counter", "Metadata and fingerprint cache lookups by result"),
+    "mediasorter_circuit_open": ("gauge", "1 while a provider's circuit breaker is failing calls fast"),
+    "mediasorter_circuit_rejections_total": ("counter", "Calls failed fast by an open circuit or offline mode"),
+    "mediasorter_ingest_events_total": ("counter", "Watcher and scan paths by outcome: queued, ignored, excluded, debounced"),
+}
+
+class Histogram:
+    """Fixed-bucket latency histogram, cheap enough to observe on every call"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimated by interpolating inside the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return round(lower + (self.buckets[i] - lower) * (rank - seen) / n, 6)
+            seen += n
+        return self.buckets[-1]
+
+class Metrics:
+    """Process-wide counters and histograms keyed by name and labels.
+
+    Gauges are not stored: collectors registered with register() are asked for
+    (name, labels, value) samples whenever the metrics are read, so queue depths
+    and worker counts are always current.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def register(self, collector):
+        with self.lock:
+            self.collectors.append(collector)
+
+    def unregister(self, collector):
+        with self.lock:
+            if collector in self.collectors:
+                self.collectors.remove(collector)
+
+    def _collect(self):
+        with self.lock:
+            collectors = list(self.collectors)
+        samples = []
+        for collector in collectors:
+            try:
+                samples.extend((name, tuple(sorted(labels.items())), value)
+                               for name, labels, value in collector())
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+        return samples
+
+    def snapshot(self):
+        """JSON-friendly view for the GUI: totals plus p50/p95/p99 per histogram"""
+        samples = self._collect()
+        with self.lock:
+            counters = [(name, labels, value) for (name, labels), value in self.counters.items()]
+            histograms = [(name, labels, {"count": h.count, "sum": round(h.sum, 3),
+                                          **{f"p{round(q * 100)}": h.quantile(q) for q in (0.5, 0.95, 0.99)}})
+                          for (name, labels), h in self.histograms.items()]
+        result = {"time": time.time(), "counters": {}, "gauges": {}, "histograms": {}}
+        for name, labels, value in counters:
+            result["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for name, labels, value in samples:
+            kind = "counters" if METRIC_HELP.get(name, ("gauge",))[0] == "counter" else "gauges"
+            result[kind].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for name, labels, summary in histograms:
+            result["histograms"].setdefault(name, []).append(dict(summary, labels=dict(labels)))
+        return result
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)"""
+        samples = self._collect()
+        with self.lock:
+            series = [(name, labels, [("", labels, value)]) for (name, labels), value in self.counters.items()]
+            for (name, labels), h in self.histograms.items():
+                lines, cumulative = [], 0
+                for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(("_bucket", labels + (("le", str(bound)),), cumulative))
+                lines.append(("_sum", labels, round(h.sum, 6)))
+                lines.append(("_count", labels, h.count))
+                series.append((name, labels, lines))
+        series.extend((name, labels, [("", labels, value)]) for name, labels, value in samples)
+        out = []
+        for name in sorted({s[0] for s in series}):
+            kind, text = METRIC_HELP.get(name, ("untyped", name))
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            for _, _, lines in sorted((s for s in series if s[0] == name), key=lambda s: s[1]):
+                for suffix, labels, value in lines:
+                    label_text = ",".join(f'{k}="{self._escape(v)}"' for k, v in labels)
+                    out.append(f"{name}{suffix}{{{label_text}}} {value}" if label_text else f"{name}{suffix} {value}")
+        return "\n".join(out) + "\n"
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class MetricsExporter:
+    """Serves METRICS at http://<metrics_host>:<metrics_port>/metrics and/or rewrites metrics_file.
+
+    The file is replaced atomically every metrics_interval seconds, so it can be
+    picked up by node_exporter's textfile collector.
+    """
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.server = None
+        self.writer = None
+        self.file = None
+        self.interval = 15.0
+        self.stop_event = threading.Event()
+
+    def configure(self, config):
+        """Starts whichever outputs config asks for; safe to call again after a config change"""
+        self.interval = max(1.0, float(config.get("metrics_interval", 15)))
+        self.file = config.get("metrics_file") or None
+        port = int(config.get("metrics_port") or 0)
+        if port and self.server is None:
+            try:
+                self._serve(config.get("metrics_host", "127.0.0.1"), port)
+            except OSError as e:
+                print(f"Metrics endpoint unavailable on port {port}: {e}")
+        if self.file and self.writer is None:
+            self.stop_event.clear()
+            self.writer = threading.Thread(target=self._write_loop, name="metrics-file", daemon=True)
+            self.writer.start()
+
+    def _serve(self, host, port):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+
+    def write(self):
+        if not self.file:
+            return
+        tmp = f"{self.file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.metrics.render())
+            os.replace(tmp, self.file)
+        except OSError as e:
+            print(f"Metrics file error: {e}")
+
+    def _write_loop(self):
+        while not self.stop_event.wait(self.interval):
+            self.write()
+        self.writer = None
+
+    def close(self):
+        self.stop_event.set()
+        self.write()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+METRICS = Metrics()
+EXPORTER = MetricsExporter(METRICS)
+atexit.register(EXPORTER.close)
+
+# ===== HTTP SESSIONS & RATE LIMITING =====
+# Requests per second and burst size per host, following each provider's published limits
+RATE_LIMITS = {
+    "musicbrainz.org": (1.0, 1),
+    "api.tvmaze.com": (2.0, 20),
+    "api.themoviedb.org": (20.0, 20),
+    "api.acoustid.org": (3.0, 3),
+}
+DEFAULT_RATE_LIMIT = (5.0, 5)
+USER_AGENT = "MediaSorter/1.0"
+# Base URL per provider; api_endpoints in the config points one elsewhere, e.g. a local mirror or a benchmark stub
+DEFAULT_ENDPOINTS = {
+    "tvmaze": "http://api.tvmaze.com",
+    "tmdb": "https://api.themoviedb.org/3",
+    "musicbrainz": "https://musicbrainz.org",
+    "acoustid": "https://api.acoustid.org",
+}
+API_ENDPOINTS = dict(DEFAULT_ENDPOINTS)
+
+def configure_endpoints(config):
+    """Applies api_endpoints overrides; a new host inherits the provider's rate limit and metrics name"""
+    overrides = config.get("api_endpoints") or {}
+    for provider, default in DEFAULT_ENDPOINTS.items():
+        url = (overrides.get(provider) or default).rstrip("/")
+        API_ENDPOINTS[provider] = url
+        host, default_host = urlsplit(url).hostname, urlsplit(default).hostname
+        if host != default_host:
+            RATE_LIMITS.setdefault(host, RATE_LIMITS.get(default_host, DEFAULT_RATE_LIMIT))
+            PROVIDER_NAMES.setdefault(host, provider)
+
+class TokenBucket:
+    """Thread-safe token bucket; callers reserve a slot and sleep until it comes up"""
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token and returns how many seconds the caller must wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Pushes every pending and future slot back, e.g. after a Retry-After"""
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+class HttpClient:
+    """Shared keep-alive sessions (one per host) with proactive per-host rate limiting"""
+    def __init__(self, limits, pool_size=8, timeout=10):
+        self.limits = limits
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.sessions = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def session_for(self, host):
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                requests = optional_module("requests")
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                # tmdbv3api sets no timeout of its own, so a dead host would hang its calls indefinitely
+                send = adapter.send
+                adapter.send = lambda request, timeout=None, **kw: send(request, timeout=timeout or self.timeout, **kw)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["User-Agent"] = USER_AGENT
+                # A response hook also sees calls made through the session by other libraries (tmdbv3api)
+                session.hooks["response"].append(self._record)
+                self.sessions[host] = session
+            return session
+
+    def bucket_for(self, host):
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(*self.limits.get(host, DEFAULT_RATE_LIMIT))
+            return bucket
+
+    def admit(self, host):
+        """Fails fast with MetadataUnavailable while the host's circuit is open, else waits for a rate-limit slot"""
+        BREAKERS.check(host)
+        self.throttle(host)
+
+    def throttle(self, host):
+        wait = self.bucket_for(host).reserve()
+        if wait > 0:
+            METRICS.inc("mediasorter_api_throttle_seconds_total", wait, provider=PROVIDER_NAMES.get(host, host))
+            time.sleep(wait)
+
+    @staticmethod
+    def _record(response, *args, **kwargs):
+        host = urlsplit(response.url).hostname
+        provider = PROVIDER_NAMES.get(host, host)
+        status = response.status_code
+        METRICS.inc("mediasorter_api_requests_total", provider=provider, status=str(status))
+        METRICS.observe("mediasorter_api_request_seconds", response.elapsed.total_seconds(), provider=provider)
+        if status == 429 or status >= 500:
+            METRICS.inc("mediasorter_api_errors_total", provider=provider, reason=str(status))
+        # A 429 means the provider is up, just busy
+        BREAKERS.record(host, status < 500)
+
+    def _request(self, method, url, **kwargs):
+        host = urlsplit(url).hostname
+        self.admit(host)
+        try:
+            return getattr(self.session_for(host), method)(url, **kwargs)
+        except Exception as e:
+            METRICS.inc("mediasorter_api_errors_total", provider=PROVIDER_NAMES.get(host, host),
+                        reason=type(e).__name__)
+            BREAKERS.record(host, False)
+            raise
+
+    def get(self, url, headers=None, timeout=5):
+        return self._request("get", url, headers=headers, timeout=timeout)
+
+    def post(self, url, data=None, headers=None, timeout=10):
+        return self._request("post", url, data=data, headers=headers, timeout=timeout)
+
+    def backoff(self, url, response, attempt):
+        """Honours Retry-After on a 429 by pausing the host's bucket instead of sleeping here"""
+        try:
+            delay = float(response.headers.get("Retry-After", ""))
+        except ValueError:
+            delay = (attempt + 1) * 2
+        self.bucket_for(urlsplit(url).hostname).pause(min(delay, 60))
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+HTTP = HttpClient(RATE_LIMITS)
+
+# ===== CIRCUIT BREAKERS =====
+class CircuitBreaker:
+    """Stops calling a provider that keeps failing, so lookups fail in microseconds instead of timeouts.
+
+    closed: calls go through and their outcomes are kept for window seconds; once
+    at least min_calls were made and error_rate of them failed, it opens. open:
+    every call fails fast for cooldown seconds. half-open: one probe call is let
+    through; success closes the breaker, failure reopens it with the cooldown
+    doubled (up to max_cooldown).
+    """
+    def __init__(self, name, window=60.0, min_calls=5, error_rate=0.5, cooldown=30.0, max_cooldown=600.0):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.base_cooldown = self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.outcomes = deque()
+        self.opened_until = 0.0
+        self.probe_started = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        now = time.monotonic()
+        with self.lock:
+            if self.state == "closed":
+                return True
+            # A probe that never reported back (e.g. its thread died) must not wedge the breaker
+            if self.state == "half-open" and now - self.probe_started < self.base_cooldown:
+                return False
+            if self.state == "open" and now < self.opened_until:
+                return False
+            self.state, self.probe_started = "half-open", now
+            return True
+
+    def due(self):
+        """True unless the breaker is open and its cooldown has not run out"""
+        with self.lock:
+            return self.state != "open" or time.monotonic() >= self.opened_until
+
+    def record(self, ok):
+        now = time.monotonic()
+        with self.lock:
+            if self.state == "half-open":
+                if ok:
+                    self.state, self.cooldown = "closed", self.base_cooldown
+                    self.outcomes.clear()
+                else:
+                    self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                    self._open(now)
+                return
+            if self.state == "open":
+                return
+            self.outcomes.append((now, ok))
+            while self.outcomes and self.outcomes[0][0] < now - self.window:
+                self.outcomes.popleft()
+            failures = sum(1 for _, good in self.outcomes if not good)
+            if len(self.outcomes) >= self.min_calls and failures >= self.error_rate * len(self.outcomes):
+                self._open(now)
+
+    def _open(self, now):
+        self.state, self.opened_until = "open", now + self.cooldown
+        self.outcomes.clear()
+        print(f"Circuit open for {self.name}: failing lookups fast for {self.cooldown:.0f}s")
+
+    def status(self):
+        with self.lock:
+            failures = sum(1 for _, good in self.outcomes if not good)
+            return {"state": self.state, "calls": len(self.outcomes), "failures": failures,
+                    "retry_in": round(max(0.0, self.opened_until - time.monotonic()))
+                    if self.state == "open" else 0}
+
+class CircuitBreakers:
+    """One CircuitBreaker per metadata provider, plus offline_mode which treats every provider as down"""
+    def __init__(self):
+        self.config = {}
+        self.settings = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def configure(self, config):
+        self.config = config
+        try:
+            settings = {"min_calls": int(config.get("circuit_min_calls", 5)),
+                        "error_rate": float(config.get("circuit_error_rate", 0.5)),
+                        "cooldown": float(config.get("circuit_cooldown_seconds", 30))}
+        except (TypeError, ValueError) as e:
+            print(f"Invalid circuit breaker settings: {e}")
+            return
+        with self.lock:
+            if settings != self.settings:
+                self.settings = settings
+                self.breakers.clear()
+
+    @property
+    def offline(self):
+        return bool(self.config.get("offline_mode", False))
+
+    def get(self, host):
+        provider = PROVIDER_NAMES.get(host, host)
+        with self.lock:
+            breaker = self.breakers.get(provider)
+            if breaker is None:
+                breaker = self.breakers[provider] = CircuitBreaker(provider, **self.settings)
+            return breaker
+
+    def check(self, host):
+        """Raises MetadataUnavailable if host must not be called right now"""
+        if self.offline or not self.get(host).allow():
+            provider = PROVIDER_NAMES.get(host, host)
+            METRICS.inc("mediasorter_circuit_rejections_total", provider=provider)
+            raise MetadataUnavailable(f"{provider} is {'offline' if self.offline else 'unavailable'}")
+
+    def record(self, host, ok):
+        self.get(host).record(ok)
+
+    def available(self):
+        """True when lookups may be tried again: online and no breaker still cooling down"""
+        with self.lock:
+            breakers = list(self.breakers.values())
+        return not self.offline and all(b.due() for b in breakers)
+
+    def status(self):
+        with self.lock:
+            breakers = list(self.breakers.values())
+        return {"offline": self.offline, "providers": {b.name: b.status() for b in breakers}}
+
+    def samples(self):
+        with self.lock:
+            breakers = list(self.breakers.values())
+        return [("mediasorter_circuit_open", {"provider": b.name}, int(b.state == "open")) for b in breakers]
+
+BREAKERS = CircuitBreakers()
+METRICS.register(BREAKERS.samples)
+
+# ===== REQUEST COALESCING =====
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers for the same key wait and share its result"""
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = SingleFlight._Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+# ===== METADATA CACHE =====
+CACHE_FILE = "metadata_cache.db"
+
+class MetadataUnavailable(Exception):
+    """Raised by a lookup when the provider could not be reached; such results are never cached"""
+
+class MetadataCache:
+    """Persistent provider lookup cache keyed by provider + normalized query.
+
+    Positive and negative (no match) results get separate TTLs and the table is
+    trimmed least-recently-used first once it grows past max_mb.
+    """
+    def __init__(self, path, ttl_days=30, negative_ttl_hours=24, max_mb=64):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.negative_ttl = negative_ttl_hours * 3600
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.conn = None
+        self.total_bytes = 0
+        self.touched = {}
+        self.hits = 0
+        self.misses = 0
+        # Providers this thread could not reach since it last asked
+        self.local = threading.local()
+
+    def configure(self, config):
+        self.enabled = bool(config.get("use_metadata_cache", True))
+        try:
+            self.ttl = float(config.get("cache_ttl_days", 30)) * 86400
+            self.negative_ttl = float(config.get("cache_negative_ttl_hours", 24)) * 3600
+            self.max_bytes = int(float(config.get("cache_max_mb", 64)) * 1024 * 1024)
+        except (TypeError, ValueError) as e:
+            print(f"Invalid cache settings: {e}")
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(os.path.abspath(self.path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, provider TEXT NOT NULL, value TEXT, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+            self.conn.commit()
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        return self.conn
+
+    @staticmethod
+    def make_key(provider, query):
+        normalized = ' '.join(str(query).split()).lower()
+        return f"{provider}:{normalized}"
+
+    def get(self, provider, query):
+        """Returns (found, value); value is None for a cached negative result"""
+        key = self.make_key(provider, query)
+        now = time.time()
+        with self.lock:
+            try:
+                row = self._connect().execute(
+                    "SELECT value, expires FROM cache WHERE key=?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Cache read error: {e}")
+                row = None
+            if row is None or row[1] < now:
+                self.misses += 1
+                return False, None
+            # Access times are flushed with the next write instead of one commit per hit
+            self.touched[key] = now
+            if len(self.touched) >= 200:
+                self._flush_touched()
+            self.hits += 1
+        return True, (json.loads(row[0]) if row[0] is not None else None)
+
+    def put(self, provider, query, value):
+        key = self.make_key(provider, query)
+        payload = json.dumps(value) if value else None
+        now = time.time()
+        expires = now + (self.ttl if payload is not None else self.negative_ttl)
+        size = len(key) + (len(payload) if payload else 0)
+        with self.lock:
+            try:
+                conn = self._connect()
+                old = conn.execute("SELECT size FROM cache WHERE key=?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, provider, value, expires, accessed, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (key, provider, payload, expires, now, size))
+                self.total_bytes += size - (old[0] if old else 0)
+                self.touched.pop(key, None)
+                self._flush_touched()
+                if self.total_bytes > self.max_bytes:
+                    self._evict()
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Cache write error: {e}")
+
+    def _flush_touched(self):
+        if self.touched:
+            conn = self._connect()
+            conn.executemany("UPDATE cache SET accessed=? WHERE key=?",
+                             [(t, k) for k, t in self.touched.items()])
+            conn.commit()
+            self.touched.clear()
+
+    def _evict(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+        target = self.max_bytes * 0.9
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total > target:
+            doomed = []
+            for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed"):
+                if total <= target:
+                    break
+                doomed.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM cache WHERE key=?", doomed)
+        self.total_bytes = total
+
+    def get_or_fetch(self, provider, query, fetch):
+        """Serves a lookup from the cache, calling fetch() and storing its result on a miss.
+
+        Concurrent misses for the same key are coalesced so only one request goes out.
+        """
+        if self.enabled:
+            found, value = self.get(provider, query)
+            if found:
+                return value
+        try:
+            return IN_FLIGHT.do(self.make_key(provider, query),
+                                lambda: self._fetch_and_store(provider, query, fetch))
+        except MetadataUnavailable:
+            self.note_unavailable(provider)
+            return None
+
+    def note_unavailable(self, provider):
+        self.local.unavailable = getattr(self.local, "unavailable", set()) | {provider}
+
+    def take_unavailable(self):
+        """Providers whose lookups failed in this thread since the last call (a provider down, or offline)"""
+        missed = getattr(self.local, "unavailable", set())
+        self.local.unavailable = set()
+        return sorted(missed)
+
+    def _fetch_and_store(self, provider, query, fetch):
+        if self.enabled:
+            # Another caller may have stored the result between our miss and taking the lead
+            found, value = self.get(provider, query)
+            if found:
+                return value
+        value = fetch() or None
+        if self.enabled:
+            self.put(provider, query, value)
+        return value
+
+    def stats(self):
+        with self.lock:
+            try:
+                conn = self._connect()
+                self._flush_touched()
+                now = time.time()
+                rows = conn.execute(
+                    "SELECT provider, COUNT(*), SUM(value IS NULL), SUM(expires < ?) "
+                    "FROM cache GROUP BY provider", (now,)).fetchall()
+            except sqlite3.Error as e:
+                return {"error": str(e)}
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(r[1] for r in rows),
+            "negative": sum(r[2] or 0 for r in rows),
+            "expired": sum(r[3] or 0 for r in rows),
+            "size_mb": round(self.total_bytes / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0,
+            "providers": {r[0]: r[1] for r in rows},
+            "coalesced": IN_FLIGHT.shared,
+            "enabled": self.enabled
+        }
+
+    def purge(self, mode="all"):
+        """Deletes 'all', 'expired' or 'negative' entries, or every entry of one provider"""
+        with self.lock:
+            conn = self._connect()
+            self.touched.clear()
+            if mode == "all":
+                cur = conn.execute("DELETE FROM cache")
+            elif mode == "expired":
+                cur = conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+            elif mode == "negative":
+                cur = conn.execute("DELETE FROM cache WHERE value IS NULL")
+            else:
+                cur = conn.execute("DELETE FROM cache WHERE provider=?", (mode,))
+            conn.commit()
+            self.total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if mode == "all":
+                conn.execute("VACUUM")
+            return cur.rowcount
+
+IN_FLIGHT = SingleFlight()
+METADATA_CACHE = MetadataCache(CACHE_FILE)
 
 # ===== FREE API LAYER =====
 class FreeMetadataAPIs:
     @staticmethod
     def _safe_get(url, headers=None, retries=3):
-        if not REQUESTS_AVAILABLE: 
+        """Returns parsed JSON, {} when the provider has no match (404) or None if unreachable"""
+        if not has_module("requests"): 
             return None
         for i in range(retries):
             try:
-                res = requests.get(url, headers=headers, timeout=5)
+                res = HTTP.get(url, headers=headers, timeout=5)
                 if res.status_code == 200: 
                     return res.json()
+                if res.status_code == 404:
+                    return {}
                 if res.status_code == 429: 
-                    time.sleep((i + 1) * 2)
+                    HTTP.backoff(url, res, i)
+            except MetadataUnavailable:
+                # Circuit open or offline: no point retrying
+                return None
             except: 
                 time.sleep(1)
         return None
 
     @staticmethod
     def tv_maze_search(query):
-        url = f"http://api.tvmaze.com/singlesearch/shows?q={quote(query)}"
+        return METADATA_CACHE.get_or_fetch(
+            "tvmaze", query, lambda: FreeMetadataAPIs._tv_maze_fetch(query))
+
+    @staticmethod
+    def _tv_maze_fetch(query):
+        url = f"{API_ENDPOINTS['tvmaze']}/singlesearch/shows?q={quote(query)}"
         data = FreeMetadataAPIs._safe_get(url)
+        if data is None:
+            raise MetadataUnavailable(url)
         if data:
             return {
                 "name": data.get("name"), 
-                "year": data.get("premiered", "")[:4]
+                "year": (data.get("premiered") or "")[:4]
             }
         return None
 
     @staticmethod
     def musicbrainz_search(query):
-        headers = {"User-Agent": "MediaSorter/1.0"}
-        url = f"https://musicbrainz.org/ws/2/recording/?query={quote(query)}&fmt=json"
-        data = FreeMetadataAPIs._safe_get(url, headers)
-        if data and data.get("recordings"):
+        return METADATA_CACHE.get_or_fetch(
+            "musicbrainz", query, lambda: FreeMetadataAPIs._musicbrainz_fetch(query))
+
+    @staticmethod
+    def _musicbrainz_fetch(query):
+        url = f"{API_ENDPOINTS['musicbrainz']}/ws/2/recording/?query={quote(query)}&fmt=json"
+        data = FreeMetadataAPIs._safe_get(url)
+        if data is None:
+            raise MetadataUnavailable(url)
+        if data.get("recordings"):
             rec = data["recordings"][0]
             return {
                 "title": rec.get("title"),
@@ -229,318 +1158,2470 @@ class FreeMetadataAPIs:
             }
         return None
 
-# ===== MEDIA CLASSIFIER =====
-class MediaClassifier:
-    def __init__(self, config):
-        self.config = config
-        self.parser = IntelligentParser()
-        self.tmdb_key = config.get("api_key")
-        self.acoustid_key = config.get("acoustid_key")
-        
-        self.use_tmdb = False
-        if TMDB_AVAILABLE and self.tmdb_key:
-            try:
-                self.tmdb = TMDb()
-                self.tmdb.api_key = self.tmdb_key
-                self.tmdb.language = 'en'
-                self.search = Search()
-                self.episode_api = Episode()
-                self.use_tmdb = True
-            except Exception as e:
-                print(f"TMDB init failed: {e}")
+# ===== ACOUSTID =====
+FINGERPRINT_FILE = "fingerprints.db"
 
-    def sanitize(self, name):
-        name = str(name).strip()
-        name = re.sub(r'[<>:"/\\|?*]', '', name)
-        return name.rstrip('.')
+class FingerprintCache:
+    """Chromaprint fingerprints keyed by (size, mtime, partial hash), so fpcalc runs once per file version"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+        self.hits = 0
+        self.misses = 0
 
-    def get_tv_details(self, filename):
-        clean_name = self.parser.clean_filename_aggressive(filename)
-        
-        season, episode = "01", "01"
-        patterns = [
-            r'(?:s|season)\s?(\d{1,2})\s?(?:e|x|episode)\s?(\d{1,2})',
-            r'(\d{1,2})x(\d{1,2})'
-        ]
-        
-        found_ep = False
-        for p in patterns:
-            match = re.search(p, filename, re.IGNORECASE)
-            if match:
-                season = f"{int(match.group(1)):02d}"
-                episode = f"{int(match.group(2)):02d}"
-                clean_name = re.sub(match.group(0), '', clean_name, flags=re.IGNORECASE).strip()
-                found_ep = True
-                break
-        
-        series_name, year, ep_title = clean_name, "", ""
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(os.path.abspath(self.path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, partial TEXT NOT NULL, "
+                "duration REAL NOT NULL, fingerprint TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (size, mtime_ns, partial))")
+            self.conn.commit()
+        return self.conn
 
-        if self.config.get("use_ai_correction", True):
-            tv_data = FreeMetadataAPIs.tv_maze_search(series_name)
-            if tv_data:
-                series_name = tv_data.get("name", series_name)
-                year = tv_data.get("year", "")
+    @staticmethod
+    def key(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns, partial_hash(path, st.st_size)
 
-        if self.use_tmdb:
-            try:
-                results = self.search.tv_shows({"query": series_name})
-                if results:
-                    show = results[0]
-                    series_name = show.name
-                    if not year and hasattr(show, 'first_air_date') and show.first_air_date:
-                        year = show.first_air_date[:4]
-                    if found_ep:
-                        try:
-                            det = self.episode_api.details(show.id, int(season), int(episode))
-                            if hasattr(det, 'name'): 
-                                ep_title = det.name
-                        except: 
-                            pass
-            except: 
-                pass
+    def get(self, key):
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT duration, fingerprint FROM fingerprints WHERE size=? AND mtime_ns=? AND partial=?",
+                key).fetchone()
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row
 
+    def put(self, key, duration, fingerprint):
+        with self.lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)",
+                         (*key, duration, fingerprint, time.time()))
+            conn.commit()
+
+class AcoustIDClient:
+    """Fingerprints audio (through FingerprintCache) and looks it up on AcoustID in batches.
+
+    Lookups arriving within WINDOW seconds of each other - e.g. from parallel
+    identify workers on an album - share one multi-fingerprint request of up to
+    BATCH_SIZE entries. Results go through the metadata cache like every other
+    provider, so a known fingerprint never reaches the network again.
+    """
+    BATCH_SIZE = 20
+    WINDOW = 0.25
+
+    class _Lookup:
+        def __init__(self, duration, fingerprint):
+            self.duration = duration
+            self.fingerprint = fingerprint
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self, cache, workers=2):
+        self.cache = cache
+        self.cond = threading.Condition()
+        self.pending = []
+        self.requests = 0
+        self.batched = 0
+        self.workers = workers
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+    def configure(self, config):
+        """fingerprint_workers bounds the fpcalc process pool; 0 runs fpcalc in the calling thread"""
+        self.workers = max(0, int(config.get("fingerprint_workers", 2)))
+
+    def _compute(self, path):
+        if self.workers:
+            with self.pool_lock:
+                if self.pool is None:
+                    from concurrent.futures import ProcessPoolExecutor
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                pool = self.pool
+            try:
+                return pool.submit(_fingerprint_file, path).result()
+            except Exception as e:
+                if type(e).__name__ != "BrokenProcessPool":
+                    raise
+                # A worker died (or processes are unavailable here); start over with a fresh pool later
+                with self.pool_lock:
+                    if self.pool is pool:
+                        self.pool = None
+        return _fingerprint_file(path)
+
+    def close(self):
+        with self.pool_lock:
+            pool, self.pool = self.pool, None
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def fingerprint(self, path):
+        """Returns (duration, fingerprint), computing it with fpcalc only on a cache miss"""
+        key = FingerprintCache.key(path)
+        row = self.cache.get(key)
+        if row:
+            return row[0], row[1]
+        started = time.monotonic()
+        duration, fp = self._compute(path)
+        METRICS.observe("mediasorter_fingerprint_seconds", time.monotonic() - started)
+        self.cache.put(key, duration, fp)
+        return duration, fp
+
+    def cached_match(self, path):
+        """Results for a file whose fingerprint and lookup are both cached, without fpcalc or network; else None"""
+        row = self.cache.get(FingerprintCache.key(path))
+        if not row:
+            return None
+        found, results = METADATA_CACHE.get("acoustid", self._query(row[0], row[1]))
+        return [tuple(r) for r in results or []] if found else None
+
+    @staticmethod
+    def _query(duration, fp):
+        return f"{int(duration)}:{hashlib.blake2b(fp.encode(), digest_size=16).hexdigest()}"
+
+    def match(self, apikey, path):
+        """Like acoustid.match: a list of (score, recording_id, title, artist), best first"""
+        duration, fp = self.fingerprint(path)
+        results = METADATA_CACHE.get_or_fetch("acoustid", self._query(duration, fp),
+                                              lambda: self._lookup(apikey, duration, fp))
+        return [tuple(r) for r in results or []]
+
+    def _lookup(self, apikey, duration, fingerprint):
+        call = AcoustIDClient._Lookup(duration, fingerprint)
+        with self.cond:
+            self.pending.append(call)
+            batch = None
+            if len(self.pending) == 1:
+                # First in: wait briefly for company, then send whatever has gathered
+                self.cond.wait_for(lambda: len(self.pending) >= self.BATCH_SIZE, self.WINDOW)
+                batch, self.pending = self.pending, []
+            elif len(self.pending) >= self.BATCH_SIZE:
+                self.cond.notify_all()
+        # Late arrivals can push a batch past the limit before the leader wakes
+        for i in range(0, len(batch or []), self.BATCH_SIZE):
+            self._send(apikey, batch[i:i + self.BATCH_SIZE])
+        call.done.wait(60)
+        if call.error is not None or not call.done.is_set():
+            raise MetadataUnavailable(f"AcoustID lookup failed: {call.error}")
+        return call.result
+
+    def _send(self, apikey, batch):
+        data = {"client": apikey, "format": "json", "meta": "recordings"}
+        if len(batch) == 1:
+            data.update(duration=int(batch[0].duration), fingerprint=batch[0].fingerprint)
+        else:
+            for i, call in enumerate(batch):
+                data[f"duration.{i}"] = int(call.duration)
+                data[f"fingerprint.{i}"] = call.fingerprint
+        url = f"{API_ENDPOINTS['acoustid']}/v2/lookup"
+        error = None
+        try:
+            for attempt in range(3):
+                res = HTTP.post(url, data=data)
+                if res.status_code == 429:
+                    HTTP.backoff(url, res, attempt)
+                    continue
+                body = res.json()
+                if body.get("status") != "ok":
+                    raise MetadataUnavailable(body.get("error", {}).get("message", res.status_code))
+                break
+            else:
+                raise MetadataUnavailable("rate limited")
+            self.requests += 1
+            self.batched += len(batch)
+            if len(batch) == 1:
+                groups = {0: body.get("results", [])}
+            else:
+                groups = {int(g.get("index", -1)): g.get("results", []) for g in body.get("fingerprints", [])}
+            parse = optional_module("acoustid").parse_lookup_result
+            for i, call in enumerate(batch):
+                call.result = [list(r) for r in parse({"status": "ok", "results": groups.get(i, [])})
+                               if r[2] or r[3]] or None
+        except Exception as e:
+            error = e
+        for call in batch:
+            call.error = error
+            call.done.set()
+
+    def stats(self):
+        return {"fingerprint_hits": self.cache.hits, "fingerprint_misses": self.cache.misses,
+                "lookup_requests": self.requests, "fingerprints_looked_up": self.batched}
+
+def _fingerprint_file(path):
+    """Runs fpcalc on path; module level so the process pool can pickle it"""
+    duration, fp = optional_module("acoustid").fingerprint_file(path)
+    return duration, fp.decode("ascii") if isinstance(fp, bytes) else fp
+
+ACOUSTID = AcoustIDClient(FingerprintCache(FINGERPRINT_FILE))
+atexit.register(ACOUSTID.close)
+METRICS.register(lambda: [
+    ("mediasorter_cache_lookups_total", {"cache": "metadata", "result": "hit"}, METADATA_CACHE.hits),
+    ("mediasorter_cache_lookups_total", {"cache": "metadata", "result": "miss"}, METADATA_CACHE.misses),
+    ("mediasorter_cache_lookups_total", {"cache": "fingerprint", "result": "hit"}, ACOUSTID.cache.hits),
+    ("mediasorter_cache_lookups_total", {"cache": "fingerprint", "result": "miss"}, ACOUSTID.cache.misses),
+])
+
+# ===== LIBRARY INDEX =====
+LIBRARY_INDEX_FILE = "library_index.db"
+TITLE_YEAR_PATTERN = re.compile(r'^(.*?)\s*\((\d{4})\)$')
+YEAR_SUFFIX_PATTERN = re.compile(r'^(.*?)\s+((?:19|20)\d{2})$')
+TITLE_DROP_PATTERN = re.compile(r"['.]")
+TITLE_SPLIT_PATTERN = re.compile(r'[^0-9a-z]+')
+# Words that tell titles apart however similar the rest is: numbers, roman numerals, region tags (US, UK)
+DISTINGUISHING_TOKEN = re.compile(r'^(?:\d+|[ivxlcdm]+|[a-z]{1,2})$')
+
+def normalize_title(name):
+    """Lowercases and strips punctuation so 'Marvel's Agents of S.H.I.E.L.D.' matches 'marvels agents of shield'"""
+    name = TITLE_DROP_PATTERN.sub('', str(name).lower())
+    return ' '.join(TITLE_SPLIT_PATTERN.sub(' ', name).split())
+
+def split_title_year(name):
+    """'Show (2005)' or 'Show 2005' -> ('Show', '2005')"""
+    match = TITLE_YEAR_PATTERN.match(name) or YEAR_SUFFIX_PATTERN.match(name)
+    return (match.group(1), match.group(2)) if match else (name, "")
+
+class LibraryIndex:
+    """Memory-resident view of the destination libraries, persisted between runs.
+
+    Built with os.scandir and updated as Processor moves files in, it answers
+    "does this path exist" without touching the (often network) disk and resolves
+    titles against existing Show (Year), Movie (Year) and artist folders before any
+    API is called. Negative answers are trusted; moves refuse to clobber a file that
+    appeared behind the index's back, so a stale index can only cost a retry.
+    """
+    MAX_DEPTH = 4
+    CATEGORIES = ("tv", "movie", "music", "other")
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = None
+        self.roots = {}
+        self.files = set()
+        self.dirs = set()
+        self.titles = {"tv": {}, "movie": {}, "music": {}}
+        self.ready = False
+        self.scanning = False
+        self.scanned_at = 0
+
+    def configure(self, config, rescan_minutes=None):
+        roots = {c: os.path.normcase(os.path.abspath(config[c])) for c in self.CATEGORIES if config.get(c)}
+        if rescan_minutes is None:
+            rescan_minutes = float(config.get("library_rescan_minutes", 60))
+        with self.lock:
+            changed = roots != self.roots
+            self.roots = roots
+            if not self.ready:
+                self._load()
+            stale = time.time() - self.scanned_at > rescan_minutes * 60
+        if (changed or stale) and roots and not self.scanning:
+            self.scanning = True
+            threading.Thread(target=self.refresh, name="library-scan", daemon=True).start()
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(os.path.abspath(self.path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS entries (path TEXT PRIMARY KEY, is_dir INTEGER NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.conn.commit()
+        return self.conn
+
+    def _load(self):
+        try:
+            conn = self._connect()
+            for path, is_dir in conn.execute("SELECT path, is_dir FROM entries"):
+                self._add_entry(path, bool(is_dir))
+            row = conn.execute("SELECT value FROM meta WHERE key='scanned_at'").fetchone()
+            self.scanned_at = float(row[0]) if row else 0
+            self.ready = self.scanned_at > 0
+        except sqlite3.Error as e:
+            print(f"Library index load error: {e}")
+
+    def refresh(self):
+        """Rescans every configured root with os.scandir and replaces the index"""
+        try:
+            files, dirs, stats = set(), set(), {}
+            for root in set(self.roots.values()):
+                if os.path.isdir(root):
+                    dirs.add(root)
+                    self._scan(root, 0, files, dirs, stats)
+            with self.lock:
+                self.files, self.dirs = set(), set()
+                self.titles = {"tv": {}, "movie": {}, "music": {}}
+                for d in dirs:
+                    self._add_entry(d, True)
+                for f in files:
+                    self._add_entry(f, False)
+                self.scanned_at = time.time()
+                self.ready = True
+                conn = self._connect()
+                conn.execute("DELETE FROM entries")
+                conn.executemany("INSERT OR REPLACE INTO entries (path, is_dir) VALUES (?, ?)",
+                                 [(d, 1) for d in dirs] + [(f, 0) for f in files])
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scanned_at', ?)",
+                             (str(self.scanned_at),))
+                conn.commit()
+            # Duplicate detection then covers everything already in the library, not just what was sorted
+            HASH_INDEX.seed(stats)
+            print(f"Library index: {len(files)} files, {len(dirs)} folders")
+        except Exception as e:
+            print(f"Library scan error: {e}")
+        finally:
+            self.scanning = False
+
+    def _scan(self, folder, depth, files, dirs, stats):
+        if depth >= self.MAX_DEPTH:
+            return
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    path = os.path.normcase(entry.path)
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.add(path)
+                        self._scan(entry.path, depth + 1, files, dirs, stats)
+                    elif not entry.name.endswith('.partial'):
+                        files.add(path)
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                            stats[entry.path] = (st.st_size, st.st_mtime)
+                        except OSError:
+                            pass
+        except OSError:
+            pass
+
+    def _add_entry(self, path, is_dir):
+        (self.dirs if is_dir else self.files).add(path)
+        parent = os.path.dirname(path)
+        for category, root in self.roots.items():
+            if parent != root or category not in self.titles:
+                continue
+            # Titles come from show/artist folders and from movie files or folders
+            if is_dir:
+                name = os.path.basename(path)
+            elif category == "movie":
+                name = os.path.splitext(os.path.basename(path))[0]
+            else:
+                continue
+            title, year = split_title_year(name)
+            self.titles[category][normalize_title(title)] = (title, year)
+
+    def _persist(self, rows):
+        try:
+            conn = self._connect()
+            conn.executemany("INSERT OR REPLACE INTO entries (path, is_dir) VALUES (?, ?)", rows)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Library index write error: {e}")
+
+    def exists(self, path):
+        key = os.path.normcase(path)
+        with self.lock:
+            if not self.ready or not self._covered(key):
+                return os.path.exists(path)
+            if key in self.files or key in self.dirs:
+                # Re-check hits so a file deleted from the library is not reported forever
+                if os.path.exists(path):
+                    return True
+                self.files.discard(key)
+                return False
+            return False
+
+    def ensure_dir(self, folder):
+        """makedirs that skips the filesystem entirely for folders the index already knows"""
+        key = os.path.normcase(folder)
+        with self.lock:
+            if self.ready and key in self.dirs:
+                return
+        os.makedirs(folder, exist_ok=True)
+        self.add(folder, is_dir=True)
+
+    def forget_dir(self, folder):
+        with self.lock:
+            self.dirs.discard(os.path.normcase(folder))
+
+    def add(self, path, is_dir=False):
+        """Records a new library file or folder (and its parents up to the root)"""
+        key = os.path.normcase(path)
+        rows = []
+        with self.lock:
+            if not self._covered(key):
+                return
+            current, current_is_dir = key, is_dir
+            while current not in self.dirs and current not in self.roots.values():
+                self._add_entry(current, current_is_dir)
+                rows.append((current, int(current_is_dir)))
+                parent = os.path.dirname(current)
+                if parent == current:
+                    break
+                current, current_is_dir = parent, True
+        if rows:
+            self._persist(rows)
+
+    def _covered(self, key):
+        return any(key == root or key.startswith(root + os.sep) for root in self.roots.values())
+
+    def match_title(self, category, name, cutoff=0.9):
+        """Returns (title, year) of an existing library folder matching name, or None.
+
+        Exact normalized matches win; otherwise the closest fuzzy match above cutoff,
+        provided the years agree whenever both sides have one and no number, roman
+        numeral or region tag differs ('The Office US' is not 'The Office UK',
+        'Rocky III' is not 'Rocky II').
+        """
+        title, year = split_title_year(name)
+        key = normalize_title(title)
+        if not key:
+            return None
+        with self.lock:
+            titles = self.titles.get(category, {})
+            hit = titles.get(key)
+            if hit and (not year or not hit[1] or hit[1] == year):
+                return hit
+            if category == "movie" and not year:
+                return None
+            for candidate in difflib.get_close_matches(key, list(titles), n=3, cutoff=cutoff):
+                if any(DISTINGUISHING_TOKEN.match(t) for t in set(key.split()) ^ set(candidate.split())):
+                    continue
+                hit = titles[candidate]
+                if (not year or not hit[1] or hit[1] == year) and (category != "movie" or hit[1] == year):
+                    return hit
+        return None
+
+    def stats(self):
+        with self.lock:
+            return {"files": len(self.files), "folders": len(self.dirs),
+                    "shows": len(self.titles["tv"]), "movies": len(self.titles["movie"]),
+                    "artists": len(self.titles["music"]), "ready": self.ready,
+                    "scanning": self.scanning}
+
+LIBRARY = LibraryIndex(LIBRARY_INDEX_FILE)
+
+# ===== MEDIA CLASSIFIER =====
+ARTIST_TITLE_PATTERN = re.compile(r'^\s*(?:\d{1,3}[\s._-]+)?(.+?)\s+-\s+(.+?)\s*$')
+
+class MusicResolver:
+    """Identifies a music file by asking the cheapest sources first.
+
+    Tiers run in cost order - embedded tags, cached fingerprint results, the local
+    library, fpcalc + AcoustID, and finally a MusicBrainz text search - and each
+    raises a confidence score. Resolution stops as soon as the score reaches
+    music_confidence, so well-tagged files never get fingerprinted.
+    """
+    def __init__(self, config, parser, acoustid_key=None):
+        self.config = config
+        self.parser = parser
+        self.acoustid_key = acoustid_key
+        self.threshold = float(config.get("music_confidence", 0.75))
+        self.tiers = [self._tags, self._cached, self._library, self._fingerprint, self._musicbrainz]
+        self.counts = {tier.__name__.strip("_"): 0 for tier in self.tiers}
+
+    def resolve(self, file_path):
+        info = {"artist": None, "title": None, "album": None, "track": "", "disc": "",
+                "confidence": 0.0, "source": None}
+        # A bare name (e.g. from the parser tester) can only be matched by name
+        tiers = self.tiers if os.path.exists(file_path) else [self._library, self._musicbrainz]
+        for tier in tiers:
+            if info["confidence"] >= self.threshold:
+                break
+            try:
+                if tier(file_path, info):
+                    info["source"] = tier.__name__.strip("_")
+                    self.counts[info["source"]] += 1
+            except Exception as e:
+                print(f"Music {tier.__name__.strip('_')} error: {e}")
+        return info
+
+    @staticmethod
+    def _tags(file_path, info):
+        mutagen = optional_module("mutagen")
+        if not mutagen:
+            return False
+        f = mutagen.File(file_path, easy=True)
+        if not f:
+            return False
+        first = lambda key: (f.get(key) or [""])[0].strip()
+        info["artist"] = first('artist') or None
+        info["title"] = first('title') or None
+        info["album"] = first('album') or None
+        tr, dn = first('tracknumber'), first('discnumber')
+        if tr: 
+            info["track"] = tr.split('/')[0].zfill(2)
+        if dn: 
+            info["disc"] = dn.split('/')[0]
+        if not (info["artist"] and info["title"]):
+            return False
+        info["confidence"] = 0.6 + (0.15 if info["album"] else 0) + (0.1 if info["track"] else 0)
+        return True
+
+    def _cached(self, file_path, info):
+        if not self.acoustid_key:
+            return False
+        return self._apply_acoustid(ACOUSTID.cached_match(file_path), info)
+
+    def _library(self, file_path, info):
+        artist, title = info["artist"], info["title"]
+        if not artist:
+            m = ARTIST_TITLE_PATTERN.match(os.path.splitext(os.path.basename(file_path))[0].replace('_', ' '))
+            if not m:
+                return False
+            artist, title = m.group(1), info["title"] or m.group(2)
+        local = LIBRARY.match_title("music", artist)
+        if not local:
+            return False
+        # A known artist folder confirms tags, or makes an 'Artist - Title' file name trustworthy
+        from_tags = info["artist"] is not None
+        info["artist"], info["title"] = local[0], title
+        info["confidence"] = info["confidence"] + 0.15 if from_tags else max(info["confidence"], 0.75)
+        return True
+
+    def _fingerprint(self, file_path, info):
+        if not (self.acoustid_key and check_ffmpeg() and optional_module("acoustid")):
+            return False
+        if BREAKERS.offline:
+            # The lookup would be refused anyway, so don't pay for fpcalc; _cached covers known files
+            METADATA_CACHE.note_unavailable("acoustid")
+            return False
+        return self._apply_acoustid(ACOUSTID.match(self.acoustid_key, file_path), info)
+
+    @staticmethod
+    def _apply_acoustid(results, info):
+        for score, _, title, artist in results or []:
+            if score > 0.8 and score > info["confidence"]:
+                info["artist"] = artist or info["artist"]
+                info["title"] = title or info["title"]
+                info["confidence"] = score
+                return True
+        return False
+
+    def _musicbrainz(self, file_path, info):
+        if info["artist"] or not self.config.get("use_ai_correction", True):
+            return False
+        clean = self.parser.clean_filename_aggressive(os.path.basename(file_path))
+        mb = FreeMetadataAPIs.musicbrainz_search(clean)
+        if not mb:
+            return False
+        info["title"], info["artist"] = mb.get("title") or info["title"], mb.get("artist") or None
+        info["confidence"] = 0.5
+        return True
+
+class MediaClassifier:
+    def __init__(self, config):
+        self.config = config
+        self.parser = IntelligentParser()
+        self.tmdb_key = config.get("api_key")
+        self.acoustid_key = config.get("acoustid_key")
+        configure_endpoints(config)
+        self.tmdb_host = urlsplit(API_ENDPOINTS["tmdb"]).hostname
+        BREAKERS.configure(config)
+        METADATA_CACHE.configure(config)
+        ACOUSTID.configure(config)
+        self.music = MusicResolver(config, self.parser, self.acoustid_key)
+        
+        self.use_tmdb = False
+        tmdbv3api = optional_module("tmdbv3api") if self.tmdb_key else None
+        if tmdbv3api:
+            try:
+                # Search/Episode share the session TMDb installs on the class
+                self.tmdb = tmdbv3api.TMDb(session=HTTP.session_for(self.tmdb_host))
+                self.tmdb.api_key = self.tmdb_key
+                self.tmdb.language = 'en'
+                # Its request cache calls requests.request() directly: no timeout, no pooling, no metrics hook
+                # or circuit breaker. Lookups are cached in METADATA_CACHE instead.
+                self.tmdb.cache = False
+                self.search = tmdbv3api.Search()
+                self.episode_api = tmdbv3api.Episode()
+                # tmdbv3api keeps its base URL per instance
+                for api in (self.search, self.episode_api):
+                    api._base = API_ENDPOINTS["tmdb"]
+                self.use_tmdb = True
+            except Exception as e:
+                print(f"TMDB init failed: {e}")
+
+    def _tmdb_call(self, call, *args):
+        """Runs a tmdbv3api call; network failures count against TMDB's circuit breaker"""
+        HTTP.admit(self.tmdb_host)
+        try:
+            return call(*args)
+        except OSError as e:
+            # requests' connection errors and timeouts; HTTP responses are counted by the session hook
+            BREAKERS.record(self.tmdb_host, False)
+            raise MetadataUnavailable(f"TMDB: {e}")
+
+    # TMDB results are reduced to plain dicts so they can live in the metadata cache
+    def _tmdb_tv_search(self, series_name):
+        def fetch():
+            results = self._tmdb_call(self.search.tv_shows, series_name)
+            if not results:
+                return None
+            show = results[0]
+            return {"id": show.id, "name": show.name,
+                    "year": (getattr(show, 'first_air_date', None) or "")[:4]}
+        return METADATA_CACHE.get_or_fetch("tmdb_tv", series_name, fetch)
+
+    def _tmdb_episode_title(self, show_id, season, episode):
+        def fetch():
+            det = self._tmdb_call(self.episode_api.details, show_id, int(season), int(episode))
+            name = getattr(det, 'name', None)
+            return {"name": name} if name else None
+        data = METADATA_CACHE.get_or_fetch("tmdb_episode", f"{show_id} {int(season)} {int(episode)}", fetch)
+        return data["name"] if data else ""
+
+    def _tmdb_movie_search(self, name, year):
+        def fetch():
+            results = self._tmdb_call(lambda: self.search.movies(name, year=year or None))
+            if not results:
+                return None
+            m = results[0]
+            return {"title": m.title, "year": (getattr(m, 'release_date', None) or "")[:4]}
+        return METADATA_CACHE.get_or_fetch("tmdb_movie", f"{name} {year}", fetch)
+
+    def sanitize(self, name):
+        name = str(name).strip()
+        name = INVALID_NAME_CHARS.sub('', name)
+        return name.rstrip('.')
+
+    def _parse_tv(self, filename):
+        """Splits a TV file name into (series, season, episode, found_ep) without any lookup"""
+        clean_name = self.parser.clean_filename_aggressive(filename)
+        for p in EPISODE_PATTERNS:
+            match = p.search(filename)
+            if match:
+                clean_name = re.sub(re.escape(match.group(0)), '', clean_name, flags=re.IGNORECASE).strip()
+                return clean_name, f"{int(match.group(1)):02d}", f"{int(match.group(2)):02d}", True
+        return clean_name, "01", "01", False
+
+    def _resolve_show(self, series_name, episodes):
+        """Returns (series_name, year, TMDB show or None); episodes says whether episode titles are wanted"""
+        year, show = "", None
+
+        # An existing show folder wins: no show lookup, and new episodes land next to the old ones
+        local = LIBRARY.match_title("tv", series_name)
+        if local:
+            series_name, year = local
+        elif self.config.get("use_ai_correction", True):
+            tv_data = FreeMetadataAPIs.tv_maze_search(series_name)
+            if tv_data:
+                series_name = tv_data.get("name", series_name)
+                year = tv_data.get("year", "")
+
+        if self.use_tmdb and (episodes or not local):
+            try:
+                show = self._tmdb_tv_search(series_name)
+                if show and not local:
+                    series_name = show["name"]
+                    if not year and show.get("year"):
+                        year = show["year"]
+            except: 
+                show = None
+        return series_name, year, show
+
+    def _episode_title(self, show, season, episode):
+        if not show:
+            return ""
+        try:
+            return self._tmdb_episode_title(show["id"], season, episode)
+        except: 
+            return ""
+
+    def get_tv_details(self, filename):
+        series_name, season, episode, found_ep = self._parse_tv(filename)
+        series_name, year, show = self._resolve_show(series_name, found_ep)
+        ep_title = self._episode_title(show, season, episode) if found_ep else ""
         return self.sanitize(series_name), year, season, episode, self.sanitize(ep_title)
 
-    def get_movie_details(self, filename):
+    def _parse_movie(self, filename):
         clean_name = self.parser.clean_filename_aggressive(filename)
         year = ""
         
-        year_match = re.search(r'\b(19|20)\d{2}\b', clean_name)
+        year_match = YEAR_PATTERN.search(clean_name)
         if year_match:
             year = year_match.group()
             clean_name = clean_name.replace(year, '').strip(" ()")
+        return clean_name, year
+
+    def _resolve_movie(self, clean_name, year):
+        local = LIBRARY.match_title("movie", f"{clean_name} ({year})" if year else clean_name)
+        if local:
+            return self.sanitize(local[0]), local[1]
+
+        if self.use_tmdb:
+            try:
+                m = self._tmdb_movie_search(clean_name, year)
+                if m:
+                    clean_name = m["title"]
+                    if m.get("year"): 
+                        year = m["year"]
+            except: 
+                pass
+            
+        return self.sanitize(clean_name), year
+
+    def get_movie_details(self, filename):
+        return self._resolve_movie(*self._parse_movie(filename))
+
+    def get_music_details(self, file_path):
+        info = self.music.resolve(file_path)
+        filename = os.path.basename(file_path)
+        artist = info["artist"] or "Unknown Artist"
+        title = info["title"] or os.path.splitext(filename)[0]
+        album = info["album"] or "Unknown Album"
+        return self.sanitize(artist), self.sanitize(album), self.sanitize(title), info["track"], info["disc"]
+
+    def classify_batch(self, paths, music=True):
+        """Identifies many files with one metadata resolution per release.
+
+        All names are parsed first and grouped by normalised show title or movie
+        title and year; each group is looked up once and the answer fanned out to
+        its files, so an import costs one lookup per distinct title rather than
+        one per file. Music is resolved per file, tags first, with the files of
+        a batch resolved concurrently so that ACOUSTID can gather their
+        fingerprints into shared lookups; music=False leaves music out.
+
+        Returns {path: details} where details has a "category" of tv, movie or
+        music and that category's fields, or an "error" if its lookup failed.
+        Details worked out without a provider that could not be reached list
+        it under "unavailable".
+        """
+        results, shows, movies, tracks = {}, {}, {}, []
+        for path in paths:
+            filename = os.path.basename(path)
+            if os.path.splitext(filename)[1].lower() in MUSIC_EXTENSIONS:
+                if music:
+                    tracks.append(path)
+            elif self.parser.is_tv(filename):
+                series_name, season, episode, found_ep = self._parse_tv(filename)
+                shows.setdefault(normalize_title(series_name), []).append(
+                    (path, series_name, season, episode, found_ep))
+            else:
+                clean_name, year = self._parse_movie(filename)
+                movies.setdefault((normalize_title(clean_name), year), []).append((path, clean_name, year))
+
+        for members in shows.values():
+            METADATA_CACHE.take_unavailable()
+            try:
+                name, year, show = self._resolve_show(members[0][1], any(m[4] for m in members))
+                name = self.sanitize(name)
+            except Exception as e:
+                results.update((m[0], {"category": "tv", "error": str(e)}) for m in members)
+                continue
+            missed = METADATA_CACHE.take_unavailable()
+            for path, _, season, episode, found_ep in members:
+                title = self._episode_title(show, season, episode) if found_ep else ""
+                results[path] = {"category": "tv", "name": name, "year": year, "season": season,
+                                 "episode": episode, "episode_title": self.sanitize(title),
+                                 "unavailable": sorted(set(missed).union(METADATA_CACHE.take_unavailable()))}
+
+        for members in movies.values():
+            METADATA_CACHE.take_unavailable()
+            try:
+                name, year = self._resolve_movie(members[0][1], members[0][2])
+            except Exception as e:
+                results.update((m[0], {"category": "movie", "error": str(e)}) for m in members)
+                continue
+            unavailable = METADATA_CACHE.take_unavailable()
+            results.update((m[0], {"category": "movie", "name": name, "year": year,
+                                   "unavailable": unavailable}) for m in members)
+
+        if len(tracks) > 1:
+            # One after another, each AcoustID lookup would wait out the batching window alone
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(min(len(tracks), AcoustIDClient.BATCH_SIZE)) as pool:
+                results.update(zip(tracks, pool.map(self._music_batch_details, tracks)))
+        else:
+            results.update((path, self._music_batch_details(path)) for path in tracks)
+        return results
+
+    def _music_batch_details(self, path):
+        METADATA_CACHE.take_unavailable()
+        try:
+            artist, album, title, track, disc = self.get_music_details(path)
+            return {"category": "music", "artist": artist, "album": album, "title": title,
+                    "track": track, "disc": disc, "unavailable": METADATA_CACHE.take_unavailable()}
+        except Exception as e:
+            return {"category": "music", "error": str(e)}
+
+# ===== MOVE ENGINE =====
+class MoveEngine:
+    """Moves files by atomic rename on the same device, otherwise by a chunked copy.
+
+    Cross-device copies use copy_file_range/sendfile where the OS has them, write
+    to a hidden .partial name next to the target, are verified, and only then are
+    renamed into place and the source removed. An interrupted copy never leaves a
+    half-written file under the final name.
+    """
+    VERIFY_MODES = ("none", "size", "hash")
+    KERNEL_COPY_FALLBACK = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+    def __init__(self, verify="size", chunk_mb=64):
+        self.verify = verify if verify in self.VERIFY_MODES else "size"
+        self.chunk_size = max(1, int(chunk_mb)) * 1024 * 1024
+
+    def move(self, src, dst, progress=None, overwrite=False):
+        """Moves src to dst; progress(copied, total) is called per chunk.
+
+        dst must not exist unless overwrite is set, in which case it is replaced atomically.
+        """
+        started = time.monotonic()
+        size = os.path.getsize(src)
+        if self._same_device(src, os.path.dirname(dst)):
+            try:
+                self._place(src, dst, overwrite)
+                self._record("rename", size, started)
+                return dst
+            except OSError as e:
+                # ERROR_NOT_SAME_DEVICE on Windows, e.g. across a junction
+                if e.errno != errno.EXDEV and getattr(e, 'winerror', None) != 17:
+                    raise
+        tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.{os.getpid()}.partial")
+        try:
+            digest = self._copy(src, tmp, progress)
+            shutil.copystat(src, tmp)
+            self._check(src, tmp, digest)
+            self._place(tmp, dst, overwrite)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        os.remove(src)
+        self._record("copy", size, started)
+        return dst
+
+    @staticmethod
+    def _record(method, size, started):
+        METRICS.inc("mediasorter_moved_bytes_total", size, method=method)
+        METRICS.observe("mediasorter_move_seconds", time.monotonic() - started, method=method)
+
+    @staticmethod
+    def _place(src, dst, overwrite):
+        """Renames src to dst, raising FileExistsError instead of silently clobbering dst"""
+        if overwrite:
+            os.replace(src, dst)
+        elif os.name == 'nt':
+            os.rename(src, dst)
+        else:
+            # POSIX rename overwrites, so link + unlink gives an atomic no-clobber rename
+            try:
+                os.link(src, dst)
+            except FileExistsError:
+                raise
+            except OSError:
+                if os.path.exists(dst):
+                    raise FileExistsError(errno.EEXIST, "Target exists", dst)
+                os.rename(src, dst)
+                return
+            os.unlink(src)
+
+    @staticmethod
+    def _same_device(src, dst_dir):
+        try:
+            return os.stat(src).st_dev == os.stat(dst_dir).st_dev
+        except OSError:
+            return False
+
+    def _copy(self, src, dst, progress):
+        total = os.path.getsize(src)
+        hasher = hashlib.blake2b() if self.verify == "hash" else None
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            copied = 0
+            # Hashing needs the bytes in user space, so kernel-side copies are skipped in that mode
+            if hasher is None:
+                copied = self._kernel_copy(fsrc.fileno(), fdst.fileno(), total, progress)
+            if copied < total:
+                fsrc.seek(copied)
+                fdst.seek(copied)
+                self._buffered_copy(fsrc, fdst, copied, total, hasher, progress)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        return hasher.hexdigest() if hasher else None
+
+    def _kernel_copy(self, in_fd, out_fd, total, progress):
+        """Copies as much as the kernel will do for us; returns the byte count copied"""
+        if hasattr(os, 'copy_file_range'):
+            copy = lambda offset, count: os.copy_file_range(in_fd, out_fd, count, offset, offset)
+        elif hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+            copy = lambda offset, count: os.sendfile(out_fd, in_fd, offset, count)
+        else:
+            return 0
+        copied = 0
+        while copied < total:
+            try:
+                n = copy(copied, min(self.chunk_size, total - copied))
+            except OSError as e:
+                if copied == 0 and e.errno in self.KERNEL_COPY_FALLBACK:
+                    return 0
+                raise
+            if n == 0:
+                break
+            copied += n
+            if progress:
+                progress(copied, total)
+        return copied
+
+    def _buffered_copy(self, fsrc, fdst, copied, total, hasher, progress):
+        buf = bytearray(min(self.chunk_size, 8 * 1024 * 1024))
+        view = memoryview(buf)
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            fdst.write(view[:n])
+            if hasher:
+                hasher.update(view[:n])
+            copied += n
+            if progress:
+                progress(copied, total)
+
+    def _check(self, src, tmp, digest):
+        if self.verify == "none":
+            return
+        if os.path.getsize(src) != os.path.getsize(tmp):
+            raise IOError(f"Size mismatch after copying {os.path.basename(src)}")
+        if digest is not None and digest != file_digest(tmp):
+            raise IOError(f"Checksum mismatch after copying {os.path.basename(src)}")
+
+def file_digest(path, chunk_size=8 * 1024 * 1024):
+    hasher = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+# ===== DUPLICATE DETECTION =====
+HASH_INDEX_FILE = "library_hashes.db"
+HASH_BLOCK = 1024 * 1024
+
+def partial_hash(path, size=None, block=HASH_BLOCK):
+    """Hashes the size plus the head, middle and tail blocks; small files are hashed whole"""
+    size = os.path.getsize(path) if size is None else size
+    hasher = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        if size <= 3 * block:
+            hasher.update(f.read())
+        else:
+            for offset in (0, size // 2 - block // 2, size - block):
+                f.seek(offset)
+                hasher.update(f.read(block))
+    return hasher.hexdigest()
+
+class HashIndex:
+    """Persisted size/partial/full hashes of library files, refreshed when size or mtime changes.
+
+    Seeded with sizes from each library scan; a file's hashes are only computed
+    once an incoming file of the same size needs comparing against it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(os.path.abspath(self.path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            # The index is rebuilt by library scans, so an older layout (partial required) is just dropped
+            columns = {row[1]: row[3] for row in self.conn.execute("PRAGMA table_info(files)")}
+            if columns.get("partial"):
+                self.conn.execute("DROP TABLE files")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, "
+                "partial TEXT, full TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_files_size ON files(size)")
+            self.conn.commit()
+        return self.conn
+
+    def hashes(self, path, need_full=False):
+        """Returns (size, partial, full) for path, reusing stored hashes while the file is unchanged"""
+        st = os.stat(path)
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT size, mtime, partial, full FROM files WHERE path=?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime and row[2]:
+            partial, full = row[2], row[3]
+        else:
+            partial, full = partial_hash(path, st.st_size), None
+        if need_full and full is None:
+            full = partial if st.st_size <= 3 * HASH_BLOCK else file_digest(path)
+        self.record(path, st.st_size, st.st_mtime, partial, full)
+        return st.st_size, partial, full
+
+    def record(self, path, size, mtime, partial, full=None):
+        with self.lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO files (path, size, mtime, partial, full) VALUES (?, ?, ?, ?, ?)",
+                         (path, size, mtime, partial, full))
+            conn.commit()
+
+    def forget(self, path):
+        with self.lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM files WHERE path=?", (path,))
+            conn.commit()
+
+    def seed(self, stats):
+        """Replaces the index with the files of a library scan ({path: (size, mtime)}), keeping
+        the hashes of files that did not change"""
+        with self.lock:
+            try:
+                conn = self._connect()
+                known = {r[0]: r[1:] for r in conn.execute("SELECT path, size, mtime, partial, full FROM files")}
+                rows = []
+                for path, (size, mtime) in stats.items():
+                    row = known.get(path)
+                    hashes = row[2:] if row and row[0] == size and row[1] == mtime else (None, None)
+                    rows.append((path, size, mtime) + tuple(hashes))
+                conn.execute("DELETE FROM files")
+                conn.executemany("INSERT INTO files (path, size, mtime, partial, full) VALUES (?, ?, ?, ?, ?)", rows)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Hash index write error: {e}")
+
+    def has_size(self, size):
+        with self.lock:
+            return self._connect().execute(
+                "SELECT 1 FROM files WHERE size=? LIMIT 1", (size,)).fetchone() is not None
+
+    def candidates(self, size, partial):
+        """Files of this size whose partial hash matches or has not been computed yet"""
+        with self.lock:
+            return [r[0] for r in self._connect().execute(
+                "SELECT path FROM files WHERE size=? AND (partial=? OR partial IS NULL)", (size, partial))]
+
+class DuplicateDetector:
+    """Decides what happens when an incoming file collides with, or duplicates, library content.
+
+    Policies: 'aside' moves incoming files identical to something already in the
+    library to the duplicates folder and suffixes different files; 'skip' deletes
+    identical files instead; 'replace' sets identical files aside but overwrites a
+    different file at the target; 'suffix' always adds _1, _2, ...
+    """
+    POLICIES = ("aside", "skip", "replace", "suffix")
+
+    def __init__(self, index, policy="aside", exists=os.path.exists, aside_folder=""):
+        self.index = index
+        self.policy = policy if policy in self.POLICIES else "aside"
+        self.exists = exists
+        self.aside_folder = aside_folder
+
+    def resolve(self, src, target):
+        """Returns (action, path): 'move' to path, 'replace' the file at path, 'skip' as a copy of
+        path, or 'in place' when src already is the file at path (e.g. importing the library onto itself)"""
+        if self._same_file(src, target):
+            return "in place", target
+        if self.policy == "suffix":
+            return "move", self.free_name(target)
+        if self.exists(target):
+            if self.same_content(src, target):
+                return "skip", target
+            if self.policy == "replace":
+                return "replace", target
+            return "move", self.free_name(target)
+        existing = self.find_copy(src)
+        if existing:
+            return "skip", existing
+        return "move", target
+
+    def same_content(self, a, b):
+        size_a, size_b = os.path.getsize(a), os.path.getsize(b)
+        if size_a != size_b:
+            return False
+        if self.index.hashes(b)[1] != partial_hash(a, size_a):
+            return False
+        return self.index.hashes(b, need_full=True)[2] == self._full(a, size_a)
+
+    def find_copy(self, src):
+        """Finds a library file with the same content as src via the hash index"""
+        size = os.path.getsize(src)
+        if not self.index.has_size(size):
+            return None
+        partial = partial_hash(src, size)
+        for path in self.index.candidates(size, partial):
+            # The library itself is indexed: src must not count as its own copy
+            if self._same_file(src, path):
+                continue
+            try:
+                if self.index.hashes(path)[1] != partial:
+                    continue
+                if self.index.hashes(path, need_full=True)[2] == self._full(src, size):
+                    return path
+            except OSError:
+                self.index.forget(path)
+        return None
+
+    def remember(self, path):
+        """Adds a newly moved library file to the index"""
+        try:
+            self.index.hashes(path)
+        except OSError as e:
+            print(f"Hash index error: {e}")
+
+    @staticmethod
+    def _same_file(a, b):
+        try:
+            return os.path.samefile(a, b)
+        except OSError:
+            return False
+
+    @staticmethod
+    def _full(path, size):
+        return partial_hash(path, size) if size <= 3 * HASH_BLOCK else file_digest(path)
+
+    def free_name(self, target, exists=None):
+        exists = exists or self.exists
+        base, extension = os.path.splitext(target)
+        c = 1
+        while exists(target):
+            target = f"{base}_{c}{extension}"
+            c += 1
+        return target
+
+def duplicates_folder(config):
+    """Where the 'aside' policy puts duplicate downloads: duplicates_folder, else Duplicates in the monitor folder"""
+    folder = config.get("duplicates_folder") or (
+        os.path.join(config["monitor"], "Duplicates") if config.get("monitor") else "")
+    return os.path.abspath(folder) if folder else ""
+
+HASH_INDEX = HashIndex(HASH_INDEX_FILE)
+
+# ===== PROCESSOR =====
+MUSIC_EXTENSIONS = frozenset(['.mp3', '.flac', '.wav', '.aac', '.ogg', '.m4a'])
+VIDEO_EXTENSIONS = frozenset(['.mkv', '.mp4', '.avi', '.mov', '.wmv', '.m4v'])
+IGNORED_EXTENSIONS = frozenset(['.txt', '.nfo', '.jpg', '.png', '.exe', '.url', '.db', '.part', '.tmp', '.crdownload'])
+# Left behind in a download folder once its media has moved; removed by cleanup
+JUNK_EXTENSIONS = frozenset(['.txt', '.nfo', '.jpg', '.png', '.url', '.exe', '.srt'])
+# Present while a downloader is still writing
+PARTIAL_EXTENSIONS = frozenset(['.part', '.tmp', '.crdownload', '.!qb'])
+
+class Processor:
+    def __init__(self, config, log_callback, update_stat_callback):
+        self.config = config
+        self.log = log_callback
+        self.update_stat = update_stat_callback
+        self.classifier = MediaClassifier(config)
+        self.mover = MoveEngine(config.get("move_verify", "size"), config.get("copy_chunk_mb", 64))
+        self.journal = None
+        self.library = LIBRARY
+        self.library.configure(config)
+        EXPORTER.configure(config)
+        self.duplicates = DuplicateDetector(HASH_INDEX, config.get("duplicate_policy", "aside"),
+                                            exists=self.library.exists, aside_folder=duplicates_folder(config))
+
+    def process_file(self, file_path):
+        plan = self.identify(file_path)
+        return self.move(plan) if plan else False
+
+    def _record(self, file_path, state, reason=None, **fields):
+        if self.journal:
+            self.journal.mark(file_path, state, reason, **fields)
+
+    def identify(self, file_path):
+        """Classifies a file and works out its destination.
+
+        Returns a plan dict (source, target, category) or None if the file is
+        ignored, unclassifiable or has nowhere to go.
+        """
+        return self.identify_batch([file_path])[0][1]
+
+    def identify_batch(self, paths):
+        """identify() for many files at once, looking metadata up once per release; returns [(path, plan)]"""
+        wanted = []
+        for file_path in paths:
+            if not os.path.exists(file_path): 
+                self._record(file_path, "gone", "File disappeared before identification")
+                continue
+            ext = os.path.splitext(file_path)[1].lower()
+            # Ignore non-media files
+            if ext in IGNORED_EXTENSIONS: 
+                self._record(file_path, "skipped", f"Ignored file type {ext}")
+                continue
+            wanted.append(file_path)
+        try:
+            details = self.classifier.classify_batch([p for p in wanted if self._destination(p)])
+        except Exception as e:
+            details = {p: {"error": str(e)} for p in wanted}
+        plans = {p: self._plan(p, details.get(p)) for p in wanted}
+        return [(p, plans.get(p)) for p in paths]
+
+    def _destination(self, file_path):
+        """The library folder a lookup would sort this file into; empty means it goes to 'other' as is"""
+        filename = os.path.basename(file_path)
+        ext = os.path.splitext(filename)[1].lower()
+        if ext in MUSIC_EXTENSIONS:
+            return self.config.get("music", "")
+        if ext in VIDEO_EXTENSIONS:
+            return self.config.get("tv" if self.classifier.parser.is_tv(filename) else "movie", "")
+        return ""
+
+    def prefetch(self, paths):
+        """Looks up video releases ahead of identify(), e.g. while swept files wait to become stable.
+
+        Results only survive in the metadata cache, so this does nothing with the
+        cache off; music is left alone as its tiers read the (maybe growing) file.
+        """
+        if self.config.get("use_metadata_cache", True):
+            self.classifier.classify_batch([p for p in paths if self._destination(p)], music=False)
+
+    def _plan(self, file_path, details):
+        filename = os.path.basename(file_path)
+        ext = os.path.splitext(filename)[1].lower()
+        final_path, log_cat, dest_root = None, "other", None
+
+        try:
+            if details and "error" in details:
+                raise MetadataUnavailable(details["error"])
+            category = details["category"] if details else None
+            if details and details.get("unavailable") and self.config.get("metadata_refresh", False):
+                # Sorting now would file it under parser guesses; wait for the provider instead
+                waiting = ", ".join(details["unavailable"])
+                self.log(f"Deferred until {waiting} can be reached: {filename}", "warning")
+                self._record(file_path, "deferred", f"Waiting for {waiting}")
+                return None
+
+            # MUSIC
+            if category == "music":
+                dest_root = self.config.get("music", "")
+                art, alb, tit = details["artist"], details["album"], details["title"]
+                trk, dsc = details["track"], details["disc"]
+                prefix = f"{dsc}-{trk}" if (trk and dsc and dsc != '1') else (trk if trk else "")
+                new_name = f"{prefix} - {tit}{ext}" if prefix else f"{art} - {tit}{ext}"
+                if dsc and dsc != "1":
+                    final_path = safe_path_join(dest_root, art, alb, f"Disc {dsc}", new_name)
+                else:
+                    final_path = safe_path_join(dest_root, art, alb, new_name)
+                log_cat = "music"
+
+            # VIDEO
+            elif category == "tv":
+                dest_root = self.config.get("tv", "")
+                nm, yr, s, e, t = (details["name"], details["year"], details["season"],
+                                   details["episode"], details["episode_title"])
+                folder = f"{nm} ({yr})" if yr else nm
+                season_folder = f"Season {s}"
+                new_name = f"{nm} - S{s}E{e} - {t}{ext}" if t else f"{nm} - S{s}E{e}{ext}"
+                final_path = safe_path_join(dest_root, folder, season_folder, new_name)
+                log_cat = "tv"
+            elif category == "movie":
+                dest_root = self.config.get("movie", "")
+                nm, yr = details["name"], details["year"]
+                new_name = f"{nm} ({yr}){ext}" if yr else f"{nm}{ext}"
+                final_path = safe_path_join(dest_root, new_name)
+                log_cat = "movies"
+
+            # Fallback
+            if not final_path:
+                dest_root = self.config.get("other", "")
+                log_cat = "other"
+                if dest_root:
+                    final_path = safe_path_join(dest_root, filename)
+
+            if final_path:
+                self._record(file_path, "identified", category=log_cat, target=final_path)
+                return {"source": file_path, "target": final_path, "category": log_cat}
+            self.log(f"No destination for: {filename}", "warning")
+            self._record(file_path, "skipped", "No destination folder configured")
+
+        except Exception as e:
+            self.log(f"Error processing {filename}: {str(e)}", "error")
+            self._record(file_path, "failed", f"Identification error: {e}")
+        
+        return None
+
+    def move(self, plan):
+        """Moves a file to the target chosen by identify()"""
+        file_path, final_path = plan["source"], plan["target"]
+        try:
+            self._record(file_path, "moving", target=final_path)
+            target_dir = os.path.dirname(final_path)
+            self.library.ensure_dir(target_dir)
+            
+            for attempt in range(2):
+                # Handle duplicates
+                action, final_path = self.duplicates.resolve(file_path, plan["target"])
+                if action == "in place":
+                    self.log(f"Already in place: {os.path.basename(final_path)}", "info")
+                    self._record(file_path, "done", "Already at its target", target=final_path)
+                    return True
+                if action == "skip":
+                    self._drop_duplicate(file_path, final_path)
+                    return True
+                try:
+                    self.mover.move(file_path, final_path, self._progress_logger(final_path),
+                                    overwrite=(action == "replace"))
+                    break
+                except FileExistsError:
+                    # Something appeared in the library behind the index's back; resolve again
+                    self.library.add(final_path)
+                    if attempt:
+                        raise
+                except FileNotFoundError:
+                    if os.path.exists(file_path) and not os.path.isdir(target_dir):
+                        # Folder deleted since it was indexed
+                        self.library.forget_dir(target_dir)
+                        self.library.ensure_dir(target_dir)
+                        if not attempt:
+                            continue
+                    raise
+            self.library.add(final_path)
+            self.duplicates.remember(final_path)
+            self.log(f"{'Replaced' if action == 'replace' else 'Moved'}: {os.path.basename(final_path)}", "success")
+            self._record(file_path, "done", target=final_path)
+            self.update_stat(plan["category"])
+            return True
+        except Exception as e:
+            self.log(f"Error processing {os.path.basename(file_path)}: {str(e)}", "error")
+            self._record(file_path, "failed", f"Move error: {e}")
+        return False
+
+    def identify_release(self, folder, members):
+        """Identifies the files of a release folder (season pack, album) together.
+
+        Returns a release plan (source folder, category, files: a plan per file)
+        or None if none of the files has anywhere to go.
+        """
+        plans = [plan for _, plan in self.identify_batch(sorted(members)) if plan]
+        if not plans:
+            return None
+        return {"source": folder, "category": plans[0]["category"], "files": plans}
+
+    def _drop_duplicate(self, file_path, copy):
+        """Deletes a download identical to library file copy under 'skip', else sets it aside"""
+        name, same_as = os.path.basename(file_path), os.path.basename(copy)
+        if self.duplicates.policy == "skip":
+            os.remove(file_path)
+            self.log(f"Duplicate deleted: {name} (same as {same_as})", "warning")
+            self._record(file_path, "done", f"Duplicate of {copy}, deleted")
+            return
+        folder = self.duplicates.aside_folder
+        if not folder or is_inside(file_path, folder):
+            self.log(f"Duplicate left in place: {name} (same as {same_as})", "warning")
+            self._record(file_path, "skipped", f"Duplicate of {copy}")
+            return
+        os.makedirs(folder, exist_ok=True)
+        target = self.duplicates.free_name(os.path.join(folder, name), exists=os.path.exists)
+        self.mover.move(file_path, target)
+        self.log(f"Duplicate set aside: {name} (same as {same_as})", "warning")
+        self._record(file_path, "done", f"Duplicate of {copy}, set aside", target=target)
+
+    def move_release(self, plan):
+        """Moves a release, as one folder rename when it can; returns the folder left to clean up"""
+        folder, plans = plan["source"], plan["files"]
+        target_dir = self._rename_target(folder, plans)
+        if target_dir:
+            started = time.monotonic()
+            total = sum(os.path.getsize(p["source"]) for p in plans)
+            try:
+                for p in plans:
+                    self._record(p["source"], "moving", target=p["target"])
+                self.library.ensure_dir(os.path.dirname(target_dir))
+                for name in os.listdir(folder):
+                    if os.path.splitext(name)[1].lower() in JUNK_EXTENSIONS:
+                        os.remove(os.path.join(folder, name))
+                os.rename(folder, target_dir)
+            except OSError as e:
+                self.log(f"Release rename failed, moving files one by one: {e}", "warning")
+            else:
+                self._finish_release(folder, target_dir, plans)
+                self.mover._record("rename", total, started)
+                self.log(f"Moved release: {os.path.basename(target_dir)} ({len(plans)} files)", "success")
+                return None
+        moved = [self.move(p) for p in plans]
+        return folder if any(moved) else None
+
+    def _finish_release(self, folder, target_dir, plans):
+        """Gives each file of a renamed release folder its final name"""
+        expected = set()
+        for p in plans:
+            staged = os.path.join(target_dir, os.path.basename(p["source"]))
+            try:
+                if staged != p["target"]:
+                    self.mover._place(staged, p["target"], False)
+                expected.add(os.path.basename(p["target"]))
+                self.library.add(p["target"])
+                self.duplicates.remember(p["target"])
+                self._record(p["source"], "done", target=p["target"])
+                self.update_stat(p["category"])
+            except OSError as e:
+                self.log(f"Error processing {os.path.basename(p['source'])}: {str(e)}", "error")
+                self._record(p["source"], "failed", f"Move error: {e}")
+        # Anything that landed in the folder after it was checked goes back to be processed on its own
+        try:
+            for name in os.listdir(target_dir):
+                if name not in expected:
+                    os.makedirs(folder, exist_ok=True)
+                    os.rename(os.path.join(target_dir, name), os.path.join(folder, name))
+        except OSError as e:
+            print(f"Release cleanup error: {e}")
+
+    def _rename_target(self, folder, plans):
+        """The library folder a release can be renamed to as a whole, or None if it has to move file by file"""
+        target_dir = os.path.dirname(plans[0]["target"])
+        sources = [os.path.basename(p["source"]) for p in plans]
+        names = [os.path.basename(p["target"]) for p in plans]
+        if len(set(names)) != len(names) or any(os.path.dirname(p["target"]) != target_dir for p in plans):
+            return None
+        if any(os.path.dirname(os.path.abspath(p["source"])) != os.path.abspath(folder) for p in plans):
+            return None
+        # A final name that is another file's current name would collide inside the renamed folder
+        if any(name in sources and name != source for source, name in zip(sources, names)):
+            return None
+        try:
+            for name in os.listdir(folder):
+                if name not in sources and (os.path.splitext(name)[1].lower() not in JUNK_EXTENSIONS
+                                            or os.path.isdir(os.path.join(folder, name))):
+                    return None
+        except OSError:
+            return None
+        if os.path.lexists(target_dir):
+            return None
+        for p in plans:
+            if self.duplicates.resolve(p["source"], p["target"]) != ("move", p["target"]):
+                return None
+        parent = os.path.dirname(target_dir)
+        while not os.path.isdir(parent) and os.path.dirname(parent) != parent:
+            parent = os.path.dirname(parent)
+        return target_dir if self.mover._same_device(folder, parent) else None
+
+    def discard_partials(self, target):
+        """Removes .partial copies of target an interrupted move left behind"""
+        folder = os.path.dirname(target or "")
+        prefix = f".{os.path.basename(target or '')}."
+        # A copy this process is still writing (say, for a mass import) is not leftover
+        live = f".{os.getpid()}.partial"
+        try:
+            for name in os.listdir(folder):
+                if name.startswith(prefix) and name.endswith('.partial') and not name.endswith(live):
+                    os.remove(os.path.join(folder, name))
+        except OSError:
+            pass
+
+    def _progress_logger(self, target, min_size=1024 ** 3):
+        """Logs copy progress in 25% steps, only for files large enough for it to matter"""
+        state = {"next": 25}
+        def report(copied, total):
+            if total < min_size:
+                return
+            pct = copied * 100 // total
+            if pct >= state["next"] and pct < 100:
+                self.log(f"Copying {os.path.basename(target)}: {pct}%", "info")
+                state["next"] = pct - pct % 25 + 25
+        return report
+
+# ===== WORK JOURNAL =====
+JOURNAL_FILE = "journal.db"
+
+class WorkJournal:
+    """Durable per-file state (SQLite WAL) so sorting resumes where it stopped after a crash.
+
+    States: discovered -> stable -> identified -> moving -> done, or failed / skipped /
+    gone / deferred (held back until a metadata provider is reachable) with a reason.
+    Every transition is also appended to a per-file history. Each entry belongs to
+    whoever last touched it (the watch pipeline or a mass import), and only its
+    owner picks it up again.
+    """
+    ACTIVE = ("discovered", "stable", "identified", "moving")
+    TERMINAL = ("done", "failed", "skipped", "gone", "deferred")
+
+    def __init__(self, path, retention_days=30):
+        self.path = path
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(os.path.abspath(self.path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, state TEXT NOT NULL, reason TEXT, category TEXT, "
+                "target TEXT, attempts INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL, "
+                "owner TEXT NOT NULL DEFAULT 'watch')")
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(files)")]
+            if "owner" not in columns:
+                self.conn.execute("ALTER TABLE files ADD COLUMN owner TEXT NOT NULL DEFAULT 'watch'")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_files_state ON files(state)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, state TEXT NOT NULL, "
+                "reason TEXT, at REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_path ON history(path)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS spill ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT UNIQUE NOT NULL, priority INTEGER NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_spill_priority ON spill(priority, seq)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS imports ("
+                "folder TEXT PRIMARY KEY, state TEXT NOT NULL, started REAL NOT NULL, updated REAL NOT NULL)")
+            self._prune()
+            self.conn.commit()
+        return self.conn
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_days * 86400
+        self.conn.execute("DELETE FROM files WHERE state IN ('done', 'skipped', 'gone') AND updated < ?", (cutoff,))
+        self.conn.execute("DELETE FROM history WHERE at < ?", (cutoff,))
+
+    def mark(self, path, state, reason=None, category=None, target=None, owner="watch"):
+        now = time.time()
+        with self.lock:
+            try:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT INTO files (path, state, reason, category, target, attempts, updated, owner) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET "
+                    "state=excluded.state, reason=excluded.reason, "
+                    "category=COALESCE(excluded.category, files.category), "
+                    "target=COALESCE(excluded.target, files.target), "
+                    "attempts=files.attempts + excluded.attempts, updated=excluded.updated, "
+                    "owner=excluded.owner",
+                    (path, state, reason, category, target, 1 if state == "discovered" else 0, now, owner))
+                conn.execute("INSERT INTO history (path, state, reason, at) VALUES (?, ?, ?, ?)",
+                             (path, state, reason, now))
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Journal write error: {e}")
+
+    def state(self, path):
+        """Returns (state, updated) for path, or None if it was never seen"""
+        with self.lock:
+            try:
+                return self._connect().execute(
+                    "SELECT state, updated FROM files WHERE path=?", (path,)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Journal read error: {e}")
+                return None
+
+    def pending(self, owner="watch"):
+        """Unfinished entries of owner from earlier runs as (path, state, category, target)"""
+        marks = ','.join('?' * len(self.ACTIVE))
+        with self.lock:
+            return self._connect().execute(
+                f"SELECT path, state, category, target FROM files WHERE state IN ({marks}) AND owner=? "
+                "ORDER BY updated", (*self.ACTIVE, owner)).fetchall()
+
+    def deferred(self, limit=500, owner="watch"):
+        """Files of owner held back for a metadata refresh, oldest first"""
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT path FROM files WHERE state='deferred' AND owner=? ORDER BY updated LIMIT ?",
+                (owner, limit)).fetchall()
+        return [r[0] for r in rows]
+
+    def history(self, path, limit=50):
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT state, reason, at FROM history WHERE path=? ORDER BY id DESC LIMIT ?",
+                (path, limit)).fetchall()
+        return [{"state": st, "reason": reason, "at": datetime.fromtimestamp(at).strftime("%Y-%m-%d %H:%M:%S")}
+                for st, reason, at in rows]
+
+    def summary(self, recent=20):
+        with self.lock:
+            conn = self._connect()
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM files GROUP BY state").fetchall())
+            failed = conn.execute(
+                "SELECT path, reason, updated FROM files WHERE state='failed' ORDER BY updated DESC LIMIT ?",
+                (recent,)).fetchall()
+        return {
+            "counts": counts,
+            "pending": sum(counts.get(st, 0) for st in self.ACTIVE),
+            "recent_failures": [{"path": p, "reason": r,
+                                 "at": datetime.fromtimestamp(u).strftime("%Y-%m-%d %H:%M:%S")}
+                                for p, r, u in failed]
+        }
+
+    # Overflow storage for PriorityWorkQueue
+    def spill(self, path, priority):
+        with self.lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO spill (path, priority) VALUES (?, ?)", (path, priority))
+            conn.commit()
+
+    def unspill(self, limit):
+        """Removes and returns up to limit spilled (path, priority) pairs, best priority first"""
+        with self.lock:
+            conn = self._connect()
+            rows = conn.execute("SELECT seq, path, priority FROM spill ORDER BY priority, seq LIMIT ?",
+                                (limit,)).fetchall()
+            conn.executemany("DELETE FROM spill WHERE seq=?", [(r[0],) for r in rows])
+            conn.commit()
+        return [(r[1], r[2]) for r in rows]
+
+    def clear_spill(self):
+        with self.lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM spill")
+            conn.commit()
+
+    # Mass import jobs, so one cut short by a crash or shutdown can be resumed
+    def import_state(self, folder, state):
+        now = time.time()
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO imports (folder, state, started, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(folder) DO UPDATE SET state=excluded.state, updated=excluded.updated",
+                (folder, state, now, now))
+            conn.commit()
+
+    def unfinished_imports(self):
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT folder FROM imports WHERE state IN ('running', 'paused') ORDER BY updated DESC").fetchall()
+        return [r[0] for r in rows]
+
+JOURNAL = WorkJournal(JOURNAL_FILE)
+
+# ===== CORE LOGIC =====
+class PriorityWorkQueue:
+    """queue.Queue-compatible priority queue: lowest value first, FIFO within a priority.
+
+    With a capacity, producers may block for room (backpressure). A better-priority
+    item arriving at a full queue displaces the worst queued one; whatever still
+    does not fit spills to the journal on disk and is read back as room frees up.
+    Priority 0 (interactive) always gets in.
+    """
+    def __init__(self, key=None, capacity=0, spill=None):
+        self.key = key or (lambda item: 0)
+        self.capacity = capacity
+        self.spill = spill
+        self.spilled = 0
+        self.heap = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+
+    def _full(self):
+        return self.capacity and len(self.heap) >= self.capacity
+
+    def put(self, item, block=True, timeout=None, priority=None):
+        prio = self.key(item) if priority is None else priority
+        with self.cond:
+            if self._full() and prio > 0:
+                if block:
+                    self.cond.wait_for(lambda: not self._full(), timeout)
+                if self._full():
+                    worst = max(self.heap)
+                    if self.spill is None:
+                        raise queue.Full
+                    if worst[0] > prio:
+                        self.heap.remove(worst)
+                        heapq.heapify(self.heap)
+                        self._spill(worst[2], worst[0])
+                    else:
+                        self._spill(item, prio)
+                        return False
+            heapq.heappush(self.heap, (prio, next(self.seq), item))
+            self.cond.notify_all()
+        return True
+
+    def _spill(self, item, prio):
+        self.spill.spill(item, prio)
+        self.spilled += 1
+
+    def get(self, timeout=None):
+        with self.cond:
+            if self.spilled and len(self.heap) < max(1, self.capacity // 2):
+                self._refill()
+            if not self.cond.wait_for(lambda: self.heap, timeout):
+                raise queue.Empty
+            item = heapq.heappop(self.heap)[2]
+            self.cond.notify_all()
+            return item
+
+    def _refill(self):
+        rows = self.spill.unspill(max(1, self.capacity - len(self.heap)))
+        self.spilled = max(0, self.spilled - len(rows))
+        if not rows:
+            self.spilled = 0
+        for path, prio in rows:
+            heapq.heappush(self.heap, (prio, next(self.seq), path))
+
+    def task_done(self):
+        pass
+
+    def qsize(self):
+        return len(self.heap) + self.spilled
+
+class ProcessingQueue:
+    """Admits new files into the pipeline and records their progress in the work journal.
+
+    Each file gets a priority from its source (interactive, watch, heartbeat,
+    sweep), with small music files promoted to new-arrival priority. Files already
+    in flight this session are ignored, and files that finished within the last
+    300 seconds are not re-queued.
+    """
+    SOURCE_PRIORITIES = {"interactive": 0, "watch": 1, "heartbeat": 2, "sweep": 3}
+
+    def __init__(self, journal=None, config=None):
+        config = config or {}
+        self.lock = threading.Lock()
+        self.journal = journal or JOURNAL
+        self.priorities = dict(self.SOURCE_PRIORITIES)
+        self.priorities.update(config.get("source_priorities") or {})
+        self.small_file = float(config.get("small_file_mb", 50)) * 1024 * 1024
+        self.in_flight = {}
+        # Whatever was spilled last run is still 'discovered' in the journal and comes back via resume
+        self.journal.clear_spill()
+        self.queue = PriorityWorkQueue(capacity=int(config.get("queue_capacity", 5000)), spill=self.journal)
+
+    def _priority(self, file_path, source):
+        prio = self.priorities.get(source, self.priorities["sweep"])
+        watch = self.priorities["watch"]
+        if prio > watch and os.path.splitext(file_path)[1].lower() in MUSIC_EXTENSIONS:
+            try:
+                if os.path.getsize(file_path) <= self.small_file:
+                    prio = watch
+            except OSError:
+                pass
+        return prio
+
+    def add_file(self, file_path, source="watch", block=False, timeout=None):
+        """Queues a file; blocking producers wait up to timeout for room before spilling to disk"""
+        prio = self._priority(file_path, source)
+        with self.lock:
+            if file_path in self.in_flight:
+                return False
+            current = self.journal.state(file_path)
+            if current and current[0] in WorkJournal.TERMINAL and time.time() - current[1] < 300: 
+                return False
+            self.in_flight[file_path] = prio
+        self.journal.mark(file_path, "discovered")
+        self.queue.put(file_path, block=block, timeout=timeout, priority=prio)
+        return True
+
+    def requeue(self, file_path, source="sweep"):
+        """Puts a file recovered from the journal back in the queue without blocking"""
+        if not self.claim(file_path, source):
+            return False
+        self.queue.put(file_path, block=False, priority=self.in_flight.get(file_path))
+        return True
+
+    def claim(self, file_path, source="sweep"):
+        """Marks a file recovered from the journal as in flight; False if it already is"""
+        prio = self._priority(file_path, source)
+        with self.lock:
+            if file_path in self.in_flight:
+                return False
+            self.in_flight[file_path] = prio
+            return True
+
+    def priority(self, file_path):
+        return self.in_flight.get(file_path, self.priorities["sweep"])
+
+    def mark(self, file_path, state, reason=None, **fields):
+        if state in WorkJournal.TERMINAL:
+            with self.lock:
+                self.in_flight.pop(file_path, None)
+        self.journal.mark(file_path, state, reason, **fields)
+
+class IngestFilter:
+    """Decides whether a path seen by the watcher or a scan is worth queueing at all.
+
+    Ignored extensions (plus ignore_extensions), paths inside the library folders
+    or the duplicates folder and file names matching exclude_patterns are dropped
+    before they reach the queue, using extension sets and library roots normalised
+    once up front. The watcher also drops repeat events for a path within
+    debounce_ms, and rate-limits the tracker touches from a download's stream of
+    modify events.
+    """
+    TOUCH_INTERVAL = 0.5
+
+    def __init__(self, config):
+        extra = {e.lower() if e.startswith('.') else f".{e.lower()}" for e in config.get("ignore_extensions") or []}
+        self.ignored = IGNORED_EXTENSIONS | PARTIAL_EXTENSIONS | extra
+        self.patterns = [p.lower() for p in config.get("exclude_patterns") or []]
+        # Trailing separator, so /media/tv does not also exclude /media/tv-downloads
+        self.roots = tuple(os.path.join(os.path.normcase(os.path.abspath(config[key])), '')
+                           for key in ("tv", "movie", "music", "other") if config.get(key))
+        if duplicates_folder(config):
+            self.roots += (os.path.join(os.path.normcase(duplicates_folder(config)), ''),)
+        self.debounce = float(config.get("debounce_ms", 1000)) / 1000
+        self.recent = {}
+        self.touched = {}
+        self.pruned = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reason(self, path):
+        """None if path should be queued, else 'ignored' (file type) or 'excluded' (location or name)"""
+        name = os.path.basename(path)
+        if os.path.splitext(name)[1].lower() in self.ignored:
+            return "ignored"
+        key = os.path.normcase(path if os.path.isabs(path) else os.path.abspath(path))
+        # Anti-loop: never pick up what was just sorted into the library
+        if key.startswith(self.roots):
+            return "excluded"
+        if self.patterns and any(fnmatch.fnmatchcase(name.lower(), p) for p in self.patterns):
+            return "excluded"
+        return None
+
+    def accept(self, path):
+        """Applies the rules and, for watcher events, the debounce; records the outcome"""
+        result = self.reason(path)
+        if result is None:
+            now = time.monotonic()
+            with self.lock:
+                last = self.recent.get(path)
+                if last is not None and now - last < self.debounce:
+                    result = "debounced"
+                else:
+                    self.recent[path] = now
+                    self._prune(now)
+        METRICS.inc("mediasorter_ingest_events_total", result=result or "queued")
+        return result is None
+
+    def touch_due(self, path):
+        """False for a modify event arriving right after the last one passed on for path"""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.touched.get(path, 0) < self.TOUCH_INTERVAL:
+                return False
+            self.touched[path] = now
+            self._prune(now)
+        return True
+
+    def _prune(self, now):
+        if now - self.pruned < 60:
+            return
+        self.pruned = now
+        horizon = max(self.debounce, self.TOUCH_INTERVAL)
+        for seen in (self.recent, self.touched):
+            for path in [p for p, at in seen.items() if now - at > horizon]:
+                del seen[path]
+
+class CompletionTracker:
+    """Tracks many in-progress files from one thread and releases each once it stops changing.
+
+    Pending files sit in a timer heap and are checked in batches by (size, mtime).
+    Filesystem modify events push a file's settle deadline back and close-after-write
+    events trigger an early check, so polling is only the fallback and no worker
+    thread ever sleeps waiting on a download.
+
+    A tracked directory (a release folder) is one entry: it is complete once no
+    file in it is a partial download and its file count, total size and newest
+    mtime stop changing. Events for files inside it count as changes to it. A
+    directory still changing after max_wait seconds is handed to on_overdue.
+    A partial file renamed to its final name (finished()) marks the download as
+    done, so it only waits CLOSE_SETTLE to confirm instead of the full settle time.
+    """
+    CLOSE_SETTLE = 1.0
+    MAX_POLL = 30.0
+    BATCH = 500
+
+    def __init__(self, on_complete, settle=3.0, on_gone=None, on_overdue=None, max_wait=1800.0):
+        self.on_complete = on_complete
+        self.on_gone = on_gone
+        self.on_overdue = on_overdue
+        self.max_wait = max_wait
+        self.settle = settle
+        self.pending = {}
+        # Final names of renamed partial downloads -> when the rename was seen
+        self.renamed = {}
+        self.heap = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="completion-tracker", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if getattr(self, "thread", None):
+            self.thread.join(timeout)
+
+    def track(self, path):
+        now = time.monotonic()
+        with self.cond:
+            if path in self.pending:
+                return
+            # [signature, last change, poll interval, tracked since]
+            self.pending[path] = [None, now, self.settle, now]
+            self._schedule(path, now)
+
+    def touch(self, path):
+        """A write was seen on path: restart its settle period"""
+        with self.cond:
+            entry = self.pending.get(self._owner(path))
+            if entry:
+                entry[1] = time.monotonic()
+                entry[2] = self.settle
+
+    def closed(self, path):
+        """The writer closed path: check it shortly instead of waiting out the full settle time"""
+        with self.cond:
+            owner = self._owner(path)
+            if owner:
+                self._schedule(owner, time.monotonic() + self.CLOSE_SETTLE)
+
+    def finished(self, path):
+        """A downloader renamed its partial file to path: the download is complete"""
+        now = time.monotonic()
+        with self.cond:
+            for stale in [p for p, at in self.renamed.items() if now - at > 60]:
+                del self.renamed[stale]
+            self.renamed[path] = now
+            owner = self._owner(path)
+            if owner:
+                self._schedule(owner, now + self.CLOSE_SETTLE)
+
+    def _renamed_into(self, path):
+        """Consumes finished() hints for path or any file inside it"""
+        prefix = path + os.sep
+        hits = [p for p in self.renamed if p == path or p.startswith(prefix)]
+        for p in hits:
+            del self.renamed[p]
+        return bool(hits)
+
+    def _owner(self, path):
+        """The pending entry covering path: path itself or a tracked folder above it"""
+        while path not in self.pending:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+        return path
+
+    def discard(self, path):
+        with self.cond:
+            tracked = self.pending.pop(path, None) is not None
+        if tracked and self.on_gone:
+            self.on_gone(path)
+
+    def count(self):
+        return len(self.pending)
+
+    def _schedule(self, path, due):
+        heapq.heappush(self.heap, (due, next(self.seq), path))
+        self.cond.notify()
+
+    def _run(self):
+        while self.running:
+            with self.cond:
+                now = time.monotonic()
+                batch = []
+                while self.heap and self.heap[0][0] <= now and len(batch) < self.BATCH:
+                    batch.append(heapq.heappop(self.heap)[2])
+                if not batch:
+                    wait = self.heap[0][0] - now if self.heap else None
+                    self.cond.wait(min(wait, 1.0) if wait is not None else 1.0)
+                    continue
+            # Stat outside the lock so event callbacks are never blocked on slow disks
+            for path in batch:
+                self._check(path)
+
+    @staticmethod
+    def _signature(path):
+        st = os.stat(path)
+        if not os.path.isdir(path):
+            return (st.st_size, st.st_mtime)
+        size, latest, count = 0, st.st_mtime, 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                if os.path.splitext(name)[1].lower() in PARTIAL_EXTENSIONS:
+                    # Still downloading: a signature that never matches the previous one
+                    return (size, time.monotonic(), -1)
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                size, latest, count = size + st.st_size, max(latest, st.st_mtime), count + 1
+        return (size, latest, count)
+
+    def _check(self, path):
+        try:
+            sig = self._signature(path)
+        except OSError:
+            with self.cond:
+                tracked = self.pending.pop(path, None) is not None
+            if tracked and self.on_gone:
+                self.on_gone(path)
+            return
+        now = time.monotonic()
+        with self.cond:
+            entry = self.pending.get(path)
+            if entry is None:
+                return
+            if sig != entry[0]:
+                overdue = self.on_overdue and len(sig) == 3 and now - entry[3] > self.max_wait
+                if overdue:
+                    del self.pending[path]
+                else:
+                    if entry[0] is not None:
+                        # Still growing: back off so long downloads cost fewer stats
+                        entry[2] = min(entry[2] * 2, self.MAX_POLL)
+                    entry[0], entry[1] = sig, now
+                    if sig[-1] != -1 and self.renamed and self._renamed_into(path):
+                        entry[1] = now - self.settle + self.CLOSE_SETTLE
+                        self._schedule(path, now + self.CLOSE_SETTLE)
+                    else:
+                        self._schedule(path, now + entry[2])
+            else:
+                overdue = None
+        if overdue:
+            self.on_overdue(path)
+            return
+        with self.cond:
+            entry = self.pending.get(path)
+            if entry is None or sig != entry[0]:
+                return
+            if sig[0] == 0:
+                # Placeholder created by the downloader, nothing written yet
+                self._schedule(path, now + self.settle)
+                return
+            ready_at = entry[1] + self.settle
+            if now < ready_at:
+                self._schedule(path, ready_at)
+                return
+        if not self._unlocked(path):
+            with self.cond:
+                if path in self.pending:
+                    self._schedule(path, now + self.settle)
+            return
+        with self.cond:
+            if self.pending.pop(path, None) is None:
+                return
+        self.on_complete(path)
+
+    @staticmethod
+    def _unlocked(path):
+        # Windows refuses the open while a downloader still holds the file
+        paths = [path]
+        if os.path.isdir(path):
+            paths = [os.path.join(root, name) for root, _, files in os.walk(path) for name in files]
+        try:
+            for p in paths:
+                with open(p, 'ab'):
+                    pass
+            return True
+        except OSError:
+            return False
+
+class PipelineStage:
+    """A queue drained by its own worker threads; whatever the handler returns goes to the next stage.
+
+    The thread count can be changed while running with resize(): extra threads are
+    started at once, surplus ones exit after their current item. Completed work is
+    counted (weighted by weight(item), e.g. bytes for moves) for the auto-scaler.
+    """
+    def __init__(self, name, handler, workers=1, input_queue=None, next_stage=None,
+                 min_workers=None, max_workers=None, weight=None):
+        self.name = name
+        self.handler = handler
+        self.min_workers = max(1, min_workers or workers)
+        self.max_workers = max(self.min_workers, max_workers or workers)
+        self.num_workers = min(max(workers, self.min_workers), self.max_workers)
+        self.queue = input_queue if input_queue is not None else queue.Queue()
+        self.next_stage = next_stage
+        self.weight = weight
+        self.threads = []
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+        self.running = False
+        self.busy = 0
+        self.done = 0
+        self.work = 0
+        self.busy_time = 0.0
+        self.latency = 0.0
+
+    def start(self):
+        self.running = True
+        self.resize(self.num_workers)
+
+    def resize(self, workers):
+        """Sets the thread count within [min_workers, max_workers]"""
+        with self.lock:
+            self.num_workers = min(max(workers, self.min_workers), self.max_workers)
+            while self.running and len(self.threads) < self.num_workers:
+                t = threading.Thread(target=self._loop, name=f"{self.name}-{next(self.ids)}", daemon=True)
+                self.threads.append(t)
+                t.start()
+            return self.num_workers
+
+    def stop(self, timeout=10):
+        """Stops the workers and waits up to timeout seconds for them to finish their current item"""
+        self.running = False
+        deadline = time.monotonic() + timeout
+        for t in list(self.threads):
+            if t is not threading.current_thread():
+                t.join(max(0, deadline - time.monotonic()))
+        alive = [t for t in self.threads if t.is_alive()]
+        if alive:
+            print(f"{self.name} stage: {len(alive)} worker(s) still busy at shutdown")
+        return not alive
+
+    def put(self, item):
+        self.queue.put(item)
 
-        if self.use_tmdb:
-            try:
-                results = self.search.movies({"query": clean_name, "year": year if year else None})
-                if results:
-                    m = results[0]
-                    clean_name = m.title
-                    if hasattr(m, 'release_date') and m.release_date: 
-                        year = m.release_date[:4]
-            except: 
-                pass
-            
-        return self.sanitize(clean_name), year
+    def samples(self):
+        """Gauge samples for METRICS: thread count, busy threads, handler time and queue depth"""
+        labels = {"stage": self.name}
+        with self.lock:
+            workers, busy, busy_time = self.num_workers, self.busy, self.busy_time
+        return [("mediasorter_stage_workers", labels, workers),
+                ("mediasorter_stage_busy_workers", labels, busy),
+                ("mediasorter_stage_busy_seconds_total", labels, round(busy_time, 3)),
+                ("mediasorter_stage_queue_depth", labels, self.queue.qsize())]
 
-    def get_music_details(self, file_path):
-        filename = os.path.basename(file_path)
-        artist, title, album = "Unknown Artist", os.path.splitext(filename)[0], "Unknown Album"
-        track, disc = "", ""
+    def _retire(self):
+        with self.lock:
+            if len(self.threads) > self.num_workers:
+                self.threads.remove(threading.current_thread())
+                return True
+        return False
 
-        # Try AcoustID - Only if key exists AND ffmpeg is installed
-        if ACOUSTID_AVAILABLE and self.acoustid_key and FFMPEG_AVAILABLE:
+    def _loop(self):
+        while self.running and not self._retire():
             try:
-                results = acoustid.match(self.acoustid_key, file_path)
-                for score, _, t_m, a_m in results:
-                    if score > 0.8:
-                        artist, title = a_m, t_m
-                        break
-            except Exception as e:
-                print(f"AcoustID error: {e}")
-
-        # Try mutagen
-        if MUTAGEN_AVAILABLE:
+                item = self.queue.get(timeout=1)
+            except queue.Empty: 
+                continue
+            with self.lock:
+                self.busy += 1
+            started = time.monotonic()
+            weight = 1
             try:
-                f = mutagen.File(file_path, easy=True)
-                if f:
-                    artist = f.get('artist', [artist])[0]
-                    album = f.get('album', [album])[0]
-                    title = f.get('title', [title])[0]
-                    tr = f.get('tracknumber', [''])[0]
-                    if tr: 
-                        track = tr.split('/')[0].zfill(2)
-                    dn = f.get('discnumber', [''])[0]
-                    if dn: 
-                        disc = dn.split('/')[0]
+                if self.weight:
+                    weight = self.weight(item)
+                result = self.handler(item)
+                if result is not None and self.next_stage:
+                    self.next_stage.put(result)
             except Exception as e:
-                print(f"Mutagen error: {e}")
+                METRICS.inc("mediasorter_stage_errors_total", stage=self.name)
+                print(f"{self.name} stage error: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                METRICS.observe("mediasorter_stage_seconds", elapsed, stage=self.name)
+                with self.lock:
+                    self.busy -= 1
+                    self.done += 1
+                    self.work += weight
+                    self.busy_time += elapsed
+                    # Exponentially weighted so the UI shows recent latency, not the session average
+                    self.latency = elapsed if self.done == 1 else 0.8 * self.latency + 0.2 * elapsed
+                self.queue.task_done()
+        with self.lock:
+            if threading.current_thread() in self.threads and not self.running:
+                self.threads.remove(threading.current_thread())
 
-        # Fallback to MusicBrainz
-        if artist == "Unknown Artist" and self.config.get("use_ai_correction", True):
-            clean = self.parser.clean_filename_aggressive(filename)
-            mb = FreeMetadataAPIs.musicbrainz_search(clean)
-            if mb: 
-                title, artist = mb.get("title", title), mb.get("artist", artist)
+class StageScaler:
+    """Grows and shrinks pipeline stages between their bounds.
 
-        return self.sanitize(artist), self.sanitize(album), self.sanitize(title), track, disc
+    Every interval each stage is sampled. A stage with a backlog and every worker
+    busy gets another worker. If the extra worker does not raise throughput (work
+    per second, bytes for moves) by at least GAIN the stage is saturated - the
+    destination disk, the API rate limit or the CPU is the bottleneck - so the
+    worker is taken back and the stage holds for HOLD seconds. Workers idle for
+    idle_seconds with nothing queued are retired down to the minimum.
+    """
+    GAIN = 1.1
+    HOLD = 60.0
 
-# ===== PROCESSOR =====
-class Processor:
-    def __init__(self, config, log_callback, update_stat_callback):
-        self.config = config
-        self.log = log_callback
-        self.update_stat = update_stat_callback
-        self.classifier = MediaClassifier(config)
+    def __init__(self, stages, interval=2.0, idle_seconds=30.0):
+        self.stages = stages
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.state = {}
+        self.running = False
+        self.thread = None
 
-    def process_file(self, file_path):
-        if not os.path.exists(file_path): 
-            return False
-        
-        filename = os.path.basename(file_path)
-        ext = os.path.splitext(filename)[1].lower()
-        
-        # Ignore non-media files
-        ignore_exts = ['.txt', '.nfo', '.jpg', '.png', '.exe', '.url', '.db', '.part', '.tmp', '.crdownload']
-        if ext in ignore_exts: 
-            return False
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="stage-scaler", daemon=True)
+        self.thread.start()
 
-        final_path, log_cat, dest_root = None, "other", None
+    def stop(self, timeout=5):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout)
 
-        try:
-            # MUSIC
-            if ext in ['.mp3', '.flac', '.wav', '.aac', '.ogg', '.m4a']:
-                dest_root = self.config.get("music", "")
-                if dest_root:
-                    art, alb, tit, trk, dsc = self.classifier.get_music_details(file_path)
-                    prefix = f"{dsc}-{trk}" if (trk and dsc and dsc != '1') else (trk if trk else "")
-                    new_name = f"{prefix} - {tit}{ext}" if prefix else f"{art} - {tit}{ext}"
-                    if dsc and dsc != "1":
-                        final_path = safe_path_join(dest_root, art, alb, f"Disc {dsc}", new_name)
-                    else:
-                        final_path = safe_path_join(dest_root, art, alb, new_name)
-                    log_cat = "music"
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            for stage in self.stages:
+                if stage.max_workers > stage.min_workers:
+                    try:
+                        self._tick(stage)
+                    except Exception as e:
+                        print(f"Scaler error ({stage.name}): {e}")
 
-            # VIDEO
-            elif ext in ['.mkv', '.mp4', '.avi', '.mov', '.wmv', '.m4v']:
-                is_tv = bool(re.search(r'(s\d+|season)', filename, re.IGNORECASE))
-                if is_tv:
-                    dest_root = self.config.get("tv", "")
-                    if dest_root:
-                        nm, yr, s, e, t = self.classifier.get_tv_details(filename)
-                        folder = f"{nm} ({yr})" if yr else nm
-                        season_folder = f"Season {s}"
-                        new_name = f"{nm} - S{s}E{e} - {t}{ext}" if t else f"{nm} - S{s}E{e}{ext}"
-                        final_path = safe_path_join(dest_root, folder, season_folder, new_name)
-                        log_cat = "tv"
-                else:
-                    dest_root = self.config.get("movie", "")
-                    if dest_root:
-                        nm, yr = self.classifier.get_movie_details(filename)
-                        new_name = f"{nm} ({yr}){ext}" if yr else f"{nm}{ext}"
-                        final_path = safe_path_join(dest_root, new_name)
-                        log_cat = "movies"
+    def _tick(self, stage):
+        now = time.monotonic()
+        st = self.state.setdefault(stage.name, {"work": stage.work, "at": now, "idle_since": None,
+                                                "before": None, "hold_until": 0, "saturated": False})
+        with stage.lock:
+            work, busy, workers = stage.work, stage.busy, stage.num_workers
+        rate = (work - st["work"]) / max(now - st["at"], 1e-6)
+        st["work"], st["at"] = work, now
+        backlog = stage.queue.qsize()
 
-            # Fallback
-            if not final_path:
-                dest_root = self.config.get("other", "")
-                log_cat = "other"
-                if dest_root:
-                    final_path = safe_path_join(dest_root, filename)
+        # Judge the previous scale-up once it has had a full interval to show an effect
+        if st["before"] is not None:
+            before, st["before"] = st["before"], None
+            if rate < before * self.GAIN and backlog:
+                stage.resize(workers - 1)
+                st["hold_until"] = now + self.HOLD
+                st["saturated"] = True
+                return
 
-            # Move file
-            if final_path:
-                os.makedirs(os.path.dirname(final_path), exist_ok=True)
-                
-                # Handle duplicates
-                base, extension = os.path.splitext(final_path)
-                c = 1
-                while os.path.exists(final_path):
-                    final_path = f"{base}_{c}{extension}"
-                    c += 1
-                
-                shutil.move(file_path, final_path)
-                self.log(f"Moved: {os.path.basename(final_path)}", "success")
-                self.update_stat(log_cat)
-                return True
-            else:
-                self.log(f"No destination for: {filename}", "warning")
+        if backlog and busy >= workers:
+            st["idle_since"] = None
+            if workers < stage.max_workers and now >= st["hold_until"]:
+                st["saturated"] = False
+                if rate > 0:
+                    st["before"] = rate
+                stage.resize(workers + 1)
+        elif not backlog and busy < workers:
+            st["idle_since"] = st["idle_since"] or now
+            if workers > stage.min_workers and now - st["idle_since"] >= self.idle_seconds:
+                stage.resize(workers - 1)
+                st["idle_since"] = now
+        else:
+            st["idle_since"] = None
 
-        except Exception as e:
-            self.log(f"Error processing {filename}: {str(e)}", "error")
-        
-        return False
+    def saturated(self, stage):
+        return self.state.get(stage.name, {}).get("saturated", False)
 
-# ===== CORE LOGIC =====
-class ProcessingQueue:
-    def __init__(self, max_cache=2000):
-        self.queue = queue.Queue(maxsize=5000)
-        self.lock = threading.Lock()
-        self.processed = OrderedDict()
-        self.max_cache = max_cache
+class WorkerPool:
+    """Runs queued files through independent stages: stability -> identify -> move -> cleanup.
 
-    def add_file(self, file_path):
-        with self.lock:
-            if file_path in self.processed:
-                if time.time() - self.processed[file_path] < 300: 
-                    return False
-                else: 
-                    del self.processed[file_path]
-            
-            if len(self.processed) > self.max_cache:
-                while len(self.processed) > self.max_cache * 0.9: 
-                    self.processed.popitem(last=False)
-            
-            try:
-                self.queue.put(file_path, block=False)
-                self.processed[file_path] = time.time()
-                return True
-            except queue.Full: 
-                return False
+    Each stage has its own queue and thread count, so slow API lookups or a long
+    stability wait never hold up moves of files that are already identified.
 
-class WorkerPool:
-    def __init__(self, processor, queue_manager, num_workers=2):
+    Files in a subfolder of the monitor folder travel as one release: the folder
+    is waited on once, its files are identified together and it is moved as a
+    whole. A release still changing after release_max_wait falls back to per-file.
+    """
+    # (min, max) threads per stage; a single number in stage_workers pins the stage to that size
+    DEFAULT_STAGE_WORKERS = {"stability": (1, 1), "identify": (1, 6), "move": (1, 4), "cleanup": (1, 1)}
+
+    def __init__(self, processor, queue_manager, stage_workers=None):
         self.processor = processor
         self.queue_manager = queue_manager
-        self.num_workers = num_workers
-        self.workers = []
+        sizes = dict(self.DEFAULT_STAGE_WORKERS)
+        sizes.update(stage_workers or processor.config.get("stage_workers") or {})
+        sizes = {k: self._bounds(v) for k, v in sizes.items()}
+
+        def stage(name, handler, **kwargs):
+            low, high = sizes[name]
+            return PipelineStage(name, handler, low, min_workers=low, max_workers=high, **kwargs)
+
+        # Identified and completed files keep their admission priority in later stages
+        priority = queue_manager.priority
+        self.cleanup_stage = stage("cleanup", self._cleanup)
+        self.move_stage = stage("move", self._move, next_stage=self.cleanup_stage, weight=self._move_weight,
+                                input_queue=PriorityWorkQueue(lambda plan: self._priority(
+                                    [p["source"] for p in plan.get("files", [plan])])))
+        self.identify_stage = stage("identify", self._identify, next_stage=self.move_stage,
+                                    input_queue=PriorityWorkQueue(lambda item: self._priority(
+                                        item[1] if isinstance(item, tuple) else [item])))
+        # The stability stage only hands files to the tracker, which releases them when complete
+        self.tracker = CompletionTracker(self._on_stable, float(processor.config.get("stable_seconds", 3)),
+                                         on_gone=self._on_gone, on_overdue=self._on_overdue,
+                                         max_wait=float(processor.config.get("release_max_wait", 1800)))
+        self.release_folders = processor.config.get("release_folders", True)
+        # Release folder -> files admitted into it that are waiting for it to complete
+        self.releases = {}
+        self.overdue = set()
+        self.release_lock = threading.Lock()
+        self.max_tracked = int(processor.config.get("max_tracked_files", 2000))
+        self.stability_stage = stage("stability", self._admit, input_queue=queue_manager.queue)
+        self.stages = [self.stability_stage, self.identify_stage, self.move_stage, self.cleanup_stage]
+        self.scaler = StageScaler(self.stages, idle_seconds=float(processor.config.get("scale_idle_seconds", 30)))
+        self.tracked_at = {}
         self.running = False
 
+    @staticmethod
+    def _bounds(value):
+        if isinstance(value, (list, tuple)):
+            low, high = (int(value[0]), int(value[-1]))
+        else:
+            low = high = int(value)
+        low = max(1, low)
+        return low, max(low, high)
+
+    def _priority(self, paths):
+        return min(self.queue_manager.priority(p) for p in paths)
+
+    @staticmethod
+    def _move_weight(plan):
+        size = 0
+        for p in plan.get("files", [plan]):
+            try:
+                size += os.path.getsize(p["source"])
+            except OSError:
+                pass
+        return max(1, size)
+
     def start(self):
         self.running = True
-        for _ in range(self.num_workers):
-            t = threading.Thread(target=self._loop, daemon=True)
-            t.start()
-            self.workers.append(t)
+        self.tracker.start()
+        for stage in self.stages:
+            stage.start()
+        self.scaler.start()
+        METRICS.register(self._samples)
 
     def stop(self): 
         self.running = False
+        METRICS.unregister(self._samples)
+        self.scaler.stop()
+        self.tracker.stop()
+        # Signal every stage before joining any, so they all wind down together
+        for stage in self.stages:
+            stage.running = False
+        for stage in self.stages:
+            stage.stop()
 
-    def _loop(self):
-        while self.running:
-            try:
-                path = self.queue_manager.queue.get(timeout=1)
-                if self._stable(path):
-                    if self.processor.process_file(path):
-                        self._cleanup(os.path.dirname(path))
-                self.queue_manager.queue.task_done()
-            except queue.Empty: 
-                continue
-            except Exception as e:
-                print(f"Worker error: {e}")
+    def status(self):
+        status = {stage.name: {"workers": stage.num_workers, "min": stage.min_workers,
+                               "max": stage.max_workers, "busy": stage.busy,
+                               "queued": stage.queue.qsize(), "done": stage.done,
+                               "latency_ms": round(stage.latency * 1000),
+                               "saturated": self.scaler.saturated(stage)}
+                  for stage in self.stages}
+        status["stability"]["pending"] = self.tracker.count()
+        status["stability"]["spilled"] = self.queue_manager.queue.spilled
+        return status
 
-    def _stable(self, path, timeout=30):
-        start = time.time()
-        last_size, stable_count = -1, 0
-        while time.time() - start < timeout:
-            if not os.path.exists(path): 
-                return False
-            try:
-                size = os.path.getsize(path)
-                if size == last_size and size > 0: 
-                    stable_count += 1
-                else: 
-                    stable_count = 0
-                last_size = size
-                if stable_count >= 3:
-                    # Try to open to check if locked
-                    with open(path, 'ab'): 
-                        pass
-                    return True
-            except: 
-                stable_count = 0
-            time.sleep(1)
-        return False
+    def _samples(self):
+        samples = [sample for stage in self.stages for sample in stage.samples()]
+        samples.append(("mediasorter_tracked_files", {}, self.tracker.count()))
+        samples.append(("mediasorter_spilled_files", {}, self.queue_manager.queue.spilled))
+        return samples
+
+    def _release_dir(self, path):
+        """The top-level subfolder of the monitor folder that path is in, or None"""
+        root = self.processor.config.get("monitor")
+        if not root or not self.release_folders:
+            return None
+        parts = os.path.relpath(path, root).split(os.sep)
+        if len(parts) < 2 or parts[0] == os.pardir:
+            return None
+        folder = os.path.join(root, parts[0])
+        return None if folder in self.overdue else folder
+
+    def _admit(self, path):
+        folder = self._release_dir(path)
+        if folder:
+            with self.release_lock:
+                members = self.releases.setdefault(folder, set())
+                joined = bool(members)
+                members.add(path)
+            if joined:
+                # Another file of a release already waiting: it just restarts the wait
+                self.tracker.touch(folder)
+                return
+            path = folder
+        # Backpressure: the admission queue keeps priority order until the tracker has room
+        while self.running and (self.tracker.count() >= self.max_tracked
+                                or self.identify_stage.queue.qsize() >= self.max_tracked):
+            time.sleep(0.2)
+        self.tracked_at[path] = time.monotonic()
+        self.tracker.track(path)
+
+    def _on_stable(self, path):
+        started = self.tracked_at.pop(path, None)
+        if started is not None:
+            METRICS.observe("mediasorter_stability_wait_seconds", time.monotonic() - started)
+        with self.release_lock:
+            members = self.releases.pop(path, None)
+        if members is None:
+            self.queue_manager.mark(path, "stable")
+            self.identify_stage.put(path)
+            return
+        for member in members:
+            self.queue_manager.mark(member, "stable")
+        self.identify_stage.put((path, sorted(members)))
+
+    def _on_gone(self, path):
+        self.tracked_at.pop(path, None)
+        with self.release_lock:
+            members = self.releases.pop(path, None)
+        for member in members or [path]:
+            self.queue_manager.mark(member, "gone", "Removed before it finished downloading")
+
+    def _on_overdue(self, folder):
+        """A release folder that never settles (e.g. a slow torrent): track its files one by one"""
+        with self.release_lock:
+            self.overdue.add(folder)
+            members = self.releases.pop(folder, set())
+        self.tracked_at.pop(folder, None)
+        for member in members:
+            self.tracked_at[member] = time.monotonic()
+            self.tracker.track(member)
+
+    def _identify(self, item):
+        if isinstance(item, tuple):
+            return self.processor.identify_release(*item)
+        return self.processor.identify(item)
+
+    def _move(self, plan):
+        if "files" in plan:
+            return self.processor.move_release(plan)
+        return os.path.dirname(plan["source"]) if self.processor.move(plan) else None
+
+    def resume(self):
+        """Re-dispatches files the journal shows as unfinished, each to the stage it stopped in"""
+        resumed = 0
+        for path, state, category, target in self.queue_manager.journal.pending():
+            if state in ("discovered", "stable"):
+                # Never blocks: beyond the queue capacity the backlog spills to disk
+                if not self.queue_manager.requeue(path):
+                    continue
+            else:
+                if not self.queue_manager.claim(path):
+                    continue
+                plan = {"source": path, "target": target, "category": category}
+                if state == "moving":
+                    self.processor.discard_partials(target)
+                # A release renamed as a folder before its files got their final names
+                staged = os.path.join(os.path.dirname(target or ""), os.path.basename(path))
+                if (state == "moving" and staged != target and not os.path.exists(path)
+                        and os.path.exists(staged) and not os.path.exists(target)):
+                    try:
+                        self.processor.mover._place(staged, target, False)
+                        self.queue_manager.mark(path, "done", "Release rename completed after restart", target=target)
+                    except OSError as e:
+                        self.queue_manager.mark(path, "failed", f"Move error: {e}")
+                    continue
+                if os.path.exists(path):
+                    self.move_stage.put(plan)
+                elif state == "moving":
+                    self.queue_manager.mark(path, "done", "Move completed before restart")
+                    continue
+                else:
+                    self.queue_manager.mark(path, "gone", "Missing after restart")
+                    continue
+            resumed += 1
+        return resumed
 
     def _cleanup(self, folder):
         try:
-            junk = ['.txt', '.nfo', '.jpg', '.png', '.url', '.exe', '.srt']
-            if not self.processor.config.get("monitor"):
+            # Only download folders inside the monitor folder are ever emptied out
+            root = self.processor.config.get("monitor")
+            if not root or not is_inside(folder, root):
                 return
-            if os.path.abspath(folder) == os.path.abspath(self.processor.config["monitor"]): 
+            if not os.path.isdir(folder):
                 return
             for f in os.listdir(folder):
-                if os.path.splitext(f)[1].lower() in junk:
+                if os.path.splitext(f)[1].lower() in JUNK_EXTENSIONS:
                     try: 
                         os.remove(os.path.join(folder, f))
                     except: 
@@ -551,11 +3632,29 @@ class WorkerPool:
             print(f"Cleanup error: {e}")
 
 class HeartbeatEngine:
-    def __init__(self, config, queue_manager, log_func):
+    """Periodic safety-net scan of the monitor folder.
+
+    Keeps a snapshot of directory mtimes and file (size, mtime) so each pass only
+    re-lists directories whose entries changed and only queues new or changed
+    files. Every full_rescan_minutes the snapshot is dropped and everything is
+    offered again, which retries files an earlier attempt left behind. With
+    metadata_refresh on, files deferred while a provider was down (or offline
+    mode was on) are re-queued once lookups can be tried again.
+    """
+    MAX_DEPTH = 3
+    # Directories modified this recently are re-listed next pass (coarse mtime resolution)
+    SETTLE_SECONDS = 2
+
+    def __init__(self, config, queue_manager, log_func, ingest=None):
         self.config = config
         self.queue_manager = queue_manager
         self.log = log_func
+        self.ingest = ingest or IngestFilter(config)
         self.running = False
+        self.dirs = {}
+        self.files = {}
+        self.last_full = 0
+        self.last_refresh = 0
 
     def start(self):
         if self.running: 
@@ -567,60 +3666,363 @@ class HeartbeatEngine:
         self.running = False
 
     def _run(self):
+        full_every = float(self.config.get("full_rescan_minutes", 30)) * 60
         while self.running:
             p = self.config.get("monitor")
             if p and os.path.exists(p): 
+                if time.time() - self.last_full > full_every:
+                    self.dirs.clear()
+                    self.files.clear()
+                    self.last_full = time.time()
                 self._scan(p)
+            self._refresh_deferred()
             for _ in range(10): 
                 if not self.running: 
                     break
                 time.sleep(1)
 
+    def _refresh_deferred(self):
+        every = float(self.config.get("metadata_refresh_minutes", 5)) * 60
+        if not self.config.get("metadata_refresh", False) or time.time() - self.last_refresh < every:
+            return
+        if not BREAKERS.available():
+            return
+        self.last_refresh = time.time()
+        requeued = 0
+        for path in self.queue_manager.journal.deferred():
+            if not os.path.exists(path):
+                self.queue_manager.mark(path, "gone", "Removed while waiting for metadata")
+            elif self.queue_manager.requeue(path, "heartbeat"):
+                requeued += 1
+        if requeued:
+            self.log(f"Retrying {requeued} file(s) held back for metadata", "info")
+
     def _scan(self, folder, depth=0):
-        if depth > 3: 
+        if depth > self.MAX_DEPTH: 
             return
         try:
-            for item in os.listdir(folder):
-                p = os.path.join(folder, item)
-                if os.path.isfile(p): 
-                    self.queue_manager.add_file(p)
-                elif os.path.isdir(p): 
-                    self._scan(p, depth+1)
-        except: 
+            st = os.stat(folder)
+        except OSError:
+            self._forget(folder)
+            return
+        known = self.dirs.get(folder)
+        if known and known[0] == st.st_mtime_ns:
+            subdirs = known[1]
+        else:
+            subdirs = self._list(folder)
+            if known:
+                for gone in set(known[1]) - set(subdirs):
+                    self._forget(gone)
+            settled = time.time() - st.st_mtime > self.SETTLE_SECONDS
+            self.dirs[folder] = (st.st_mtime_ns if settled else None, subdirs)
+        for sub in subdirs:
+            self._scan(sub, depth + 1)
+
+    def _list(self, folder):
+        """Lists one directory, queueing files that are new or changed since the last listing"""
+        subdirs, seen = [], {}
+        previous = self.files.get(folder, {})
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            subdirs.append(entry.path)
+                        elif entry.is_file():
+                            est = entry.stat()
+                            sig = (est.st_size, est.st_mtime_ns)
+                            seen[entry.name] = sig
+                            if previous.get(entry.name) != sig and self.ingest.reason(entry.path) is None:
+                                self.queue_manager.add_file(entry.path, "heartbeat")
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        self.files[folder] = seen
+        return subdirs
+
+    def _forget(self, folder):
+        prefix = folder + os.sep
+        for d in [d for d in self.dirs if d == folder or d.startswith(prefix)]:
+            self.dirs.pop(d, None)
+            self.files.pop(d, None)
+
+# ===== MASS IMPORT =====
+class MassImport:
+    """Imports an existing folder through parallel identify -> move stages.
+
+    Directories are enumerated with os.scandir while files are already being
+    processed; a bounded queue keeps enumeration from running far ahead, so
+    memory stays flat on huge archives. The job can be paused, resumed and
+    cancelled, and is recorded in the journal: re-running an interrupted import
+    only sees what is left, since moved files are gone from the source and files
+    skipped before are not looked at again.
+    """
+    DEFAULT_WORKERS = {"identify": (2, 8), "move": (1, 4)}
+    REPORT_EVERY = 1.0
+    # Files of one directory are identified together, so a season pack or album costs one lookup
+    BATCH_SIZE = 50
+
+    def __init__(self, folder, processor, on_progress=None, journal=None):
+        self.folder = folder
+        self.processor = processor
+        self.log = processor.log
+        self.on_progress = on_progress
+        self.journal = journal or JOURNAL
+        # Entries are recorded as the import's, so the watch pipeline never resumes them
+        processor.journal = self
+        config = processor.config
+        sizes = dict(self.DEFAULT_WORKERS)
+        sizes.update(config.get("import_workers") or {})
+        identify, move = WorkerPool._bounds(sizes["identify"]), WorkerPool._bounds(sizes["move"])
+
+        self.queue = queue.Queue(maxsize=max(1, int(config.get("import_queue", 1000)) // self.BATCH_SIZE))
+        self.move_stage = PipelineStage("import-move", self._move, move[0], min_workers=move[0],
+                                        max_workers=move[1], weight=WorkerPool._move_weight)
+        self.identify_stage = PipelineStage("import-identify", self._identify, identify[0],
+                                            min_workers=identify[0], max_workers=identify[1],
+                                            input_queue=self.queue, weight=len)
+        self.scaler = StageScaler([self.identify_stage, self.move_stage], idle_seconds=10)
+
+        self.lock = threading.Lock()
+        self.unpaused = threading.Event()
+        self.unpaused.set()
+        self.cancelled = False
+        self.enumerating = False
+        self.state = "idle"
+        self.counts = {"found": 0, "done": 0, "moved": 0, "skipped": 0, "failed": 0}
+        self.categories = {k: 0 for k in STATS}
+        self.started = None
+        self.ended = None
+        self.paused_at = None
+        self.paused_total = 0.0
+
+    def start(self):
+        self.state = "running"
+        self.enumerating = True
+        self.started = time.monotonic()
+        self.journal.import_state(self.folder, "running")
+        self.log(f"Mass import started: {self.folder}", "info")
+        self.identify_stage.start()
+        self.move_stage.start()
+        self.scaler.start()
+        METRICS.register(self._samples)
+        self.thread = threading.Thread(target=self._run, name="mass-import", daemon=True)
+        self.thread.start()
+        threading.Thread(target=self._report, name="mass-import-progress", daemon=True).start()
+
+    def pause(self):
+        if self.state == "running":
+            self.unpaused.clear()
+            self.paused_at = time.monotonic()
+            self.state = "paused"
+            self.journal.import_state(self.folder, "paused")
+
+    def resume(self):
+        if self.state == "paused":
+            self.paused_total += time.monotonic() - self.paused_at
+            self.paused_at = None
+            self.state = "running"
+            self.journal.import_state(self.folder, "running")
+            self.unpaused.set()
+
+    def cancel(self):
+        if self.state in ("running", "paused"):
+            self.cancelled = True
+            self.state = "cancelling"
+            self.unpaused.set()
+
+    def active(self):
+        return self.state in ("running", "paused", "cancelling")
+
+    def progress(self):
+        with self.lock:
+            counts = dict(self.counts)
+            categories = dict(self.categories)
+        now = self.ended or self.paused_at or time.monotonic()
+        elapsed = max(0.0, now - self.started - self.paused_total) if self.started else 0.0
+        rate = counts["done"] / elapsed if elapsed else 0.0
+        remaining = counts["found"] - counts["done"]
+        return {
+            "folder": self.folder,
+            "state": self.state,
+            "enumerating": self.enumerating,
+            **counts,
+            "categories": categories,
+            "elapsed": round(elapsed),
+            "rate": round(rate, 1),
+            # While still enumerating this is a lower bound
+            "eta": round(remaining / rate) if rate else None,
+        }
+
+    def _samples(self):
+        return self.identify_stage.samples() + self.move_stage.samples()
+
+    def _run(self):
+        try:
+            self._enumerate()
+        except Exception as e:
+            self.log(f"Mass import enumeration error: {e}", "error")
+        self.enumerating = False
+        # Wait for the stages to work off what was queued
+        while not self.cancelled:
+            with self.lock:
+                if self.counts["done"] >= self.counts["found"]:
+                    break
+            time.sleep(0.2)
+        self.scaler.stop()
+        self.identify_stage.running = False
+        self.move_stage.running = False
+        self.identify_stage.stop()
+        self.move_stage.stop()
+        METRICS.unregister(self._samples)
+        if self.paused_at:
+            self.paused_total += time.monotonic() - self.paused_at
+            self.paused_at = None
+        self.ended = time.monotonic()
+        self.state = "cancelled" if self.cancelled else "finished"
+        self.journal.import_state(self.folder, self.state)
+        counts = self.counts
+        self.log(f"Mass import {self.state}. Moved {counts['moved']} of {counts['found']} files "
+                 f"({counts['skipped']} skipped, {counts['failed']} failed).",
+                 "warning" if self.cancelled else "success")
+        self._emit()
+
+    def _enumerate(self):
+        stack = [self.folder]
+        while stack and not self.cancelled:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            batch = []
+            for entry in entries:
+                if self.cancelled:
+                    return
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                except OSError:
+                    continue
+                previous = self.journal.state(entry.path)
+                if previous and previous[0] == "skipped":
+                    continue
+                with self.lock:
+                    self.counts["found"] += 1
+                batch.append(entry.path)
+                if len(batch) >= self.BATCH_SIZE:
+                    self._put(batch)
+                    batch = []
+            if batch:
+                self._put(batch)
+
+    def _put(self, batch):
+        while not self.cancelled:
+            try:
+                self.queue.put(batch, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def _wait(self):
+        """Blocks while paused; False once the job is cancelled"""
+        while not self.unpaused.wait(0.5):
             pass
+        return not self.cancelled
+
+    def mark(self, path, state, reason=None, **fields):
+        self.journal.mark(path, state, reason, owner="import", **fields)
+
+    def _finish(self, path, outcome, category=None):
+        with self.lock:
+            self.counts["done"] += 1
+            self.counts[outcome] += 1
+            if category in self.categories:
+                self.categories[category] += 1
+
+    def _identify(self, batch):
+        # Once cancelled the queue is just drained; those files stay put for a later run
+        if not self._wait():
+            return None
+        for path, plan in self.processor.identify_batch(batch):
+            if plan is None:
+                previous = self.journal.state(path)
+                self._finish(path, "failed" if previous and previous[0] == "failed" else "skipped")
+            else:
+                self.move_stage.put(plan)
+        return None
+
+    def _move(self, plan):
+        if not self._wait():
+            self.mark(plan["source"], "failed", "Import cancelled")
+            return None
+        if self.processor.move(plan):
+            self._finish(plan["source"], "moved", plan["category"])
+        else:
+            self._finish(plan["source"], "failed")
+        return None
+
+    def _report(self):
+        while self.state in ("running", "paused", "cancelling"):
+            self._emit()
+            time.sleep(self.REPORT_EVERY)
+
+    def _emit(self):
+        if self.on_progress:
+            try:
+                self.on_progress(self.progress())
+            except Exception:
+                pass
 
 # ===== CONTROLLER =====
 class MediaController:
     def __init__(self):
-        self.config = load_config()
+        # Settings given on the command line, which win over the config file on every reload
+        self.overrides = {}
+        # Read by reload_config() once the entry point knows which config file to use
+        self.config = {}
         self.queue = None
         self.workers = None
         self.heartbeat = None
+        self.mass_import = None
         self.observer = None
+        self.ingest = None
         self.monitoring = False
         self.processor = None
+        # Frontend updates are batched by the event bus; log_sink replaces console output
+        self.events = UIEventBus()
+        self.log_sink = None
+
+    def attach_ui(self, ui):
+        """ui(name, *args) calls a JavaScript function in the GUI"""
+        self.events.start(ui)
 
     def log(self, message, msg_type="info"):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"[{msg_type.upper()}] {message}")
-        try: 
-            eel.js_add_log(message, msg_type)
-        except: 
-            pass
+        if self.log_sink:
+            self.log_sink(message, msg_type)
+        else:
+            print(f"[{msg_type.upper()}] {message}")
+        self.events.publish("log", message, msg_type, datetime.now().strftime("%H:%M:%S"))
 
     def update_stat(self, category):
-        if category in STATS:
-            STATS[category] += 1
-            try: 
-                eel.js_update_stats(STATS['tv'], STATS['movies'], STATS['music'], STATS['other'])
-            except: 
-                pass
+        if STATS.incr(category):
+            self.events.update("stats", STATS.snapshot())
+
+    def reload_config(self):
+        self.config = load_config()
+        self.config.update(self.overrides)
+        self.events.configure(self.config)
+        return self.config
 
     def start_monitoring(self):
         if self.monitoring: 
             return False
         
-        self.config = load_config()
+        self.reload_config()
         monitor_path = self.config.get("monitor", "")
         if not monitor_path:
             self.log("Monitor folder not configured", "error")
@@ -633,47 +4035,68 @@ class MediaController:
         self.log("Starting monitoring...", "info")
         
         try:
-            self.queue = ProcessingQueue()
+            self.queue = ProcessingQueue(config=self.config)
             self.processor = Processor(self.config, self.log, self.update_stat)
+            self.processor.journal = self.queue
             
             self.workers = WorkerPool(self.processor, self.queue)
             self.workers.start()
             
-            self.heartbeat = HeartbeatEngine(self.config, self.queue, self.log)
+            # Unfinished work from the last run resumes in the stage it stopped in, before any scan
+            try:
+                resumed = self.workers.resume()
+                if resumed:
+                    self.log(f"Resumed {resumed} unfinished files from the journal", "info")
+            except Exception as e:
+                self.log(f"Journal recovery error: {e}", "error")
+            
+            self.ingest = IngestFilter(self.config)
+            self.heartbeat = HeartbeatEngine(self.config, self.queue, self.log, self.ingest)
             self.heartbeat.start()
             
-            if "watchdog" not in MISSING_LIBS:
+            if has_module("watchdog"):
                 try:
                     from watchdog.observers import Observer
                     from watchdog.events import FileSystemEventHandler
                     
                     class MediaHandler(FileSystemEventHandler):
-                        def __init__(self, queue, config): 
+                        def __init__(self, queue, ingest, tracker): 
                             self.q = queue
-                            self.c = config
+                            self.ingest = ingest
+                            self.tracker = tracker
                         
                         def on_created(self, e): 
                             self._handle_event(e)
                         
                         def on_moved(self, e): 
+                            if e.is_directory:
+                                return
+                            # 'x.mkv.part' -> 'x.mkv' is the downloader finishing, not a new file
+                            if os.path.splitext(e.src_path)[1].lower() in PARTIAL_EXTENSIONS:
+                                self.tracker.finished(e.dest_path)
                             self._handle_event(e, True)
                         
+                        def on_modified(self, e):
+                            if not e.is_directory and self.ingest.touch_due(e.src_path):
+                                self.tracker.touch(e.src_path)
+                        
+                        def on_closed(self, e):
+                            if not e.is_directory:
+                                self.tracker.closed(e.src_path)
+                        
+                        def on_deleted(self, e):
+                            if not e.is_directory:
+                                self.tracker.discard(e.src_path)
+                        
                         def _handle_event(self, e, moved=False):
                             if e.is_directory: 
                                 return
                             p = e.dest_path if moved else e.src_path
-                            
-                            # Anti-loop
-                            for key in ["tv", "movie", "music", "other"]:
-                                d = self.c.get(key)
-                                if d and os.path.commonpath([os.path.abspath(p), os.path.abspath(d)]) == os.path.abspath(d): 
-                                    return
-
-                            if not p.endswith('.tmp'): 
+                            if self.ingest.accept(p):
                                 self.q.add_file(p)
                     
                     self.observer = Observer()
-                    handler = MediaHandler(self.queue, self.config)
+                    handler = MediaHandler(self.queue, self.ingest, self.workers.tracker)
                     self.observer.schedule(handler, monitor_path, recursive=True)
                     self.observer.start()
                     self.log("File system observer started", "success")
@@ -721,56 +4144,103 @@ class MediaController:
         if not folder or not os.path.exists(folder): 
             return
         count = 0
+        # Each folder's releases are looked up while its files wait out the stability check
+        batches = queue.Queue()
+        threading.Thread(target=self._prefetch, args=(batches,), name="sweep-prefetch", daemon=True).start()
         try:
             for root, _, files in os.walk(folder):
+                queued = []
                 for file in files:
-                    if self.queue.add_file(os.path.join(root, file)): 
+                    if self.ingest.reason(os.path.join(root, file)) is not None:
+                        continue
+                    # The sweep is bulk backlog: wait for room rather than flooding the queue
+                    if self.queue.add_file(os.path.join(root, file), "sweep", block=True, timeout=5): 
                         count += 1
+                        queued.append(os.path.join(root, file))
+                if queued:
+                    batches.put(queued)
             if count > 0:
                 self.log(f"Initial sweep queued {count} files", "info")
         except Exception as e:
             self.log(f"Sweep error: {e}", "error")
+        finally:
+            batches.put(None)
+
+    def _prefetch(self, batches):
+        for batch in iter(batches.get, None):
+            try:
+                self.processor.prefetch(batch)
+            except Exception as e:
+                self.log(f"Sweep prefetch error: {e}", "error")
 
 # ===== GLOBAL CONTROLLER =====
 controller = MediaController()
 
 # ===== EEL EXPOSED FUNCTIONS =====
-@eel.expose
+@expose
 def get_config():
     return controller.config
 
-@eel.expose
+@expose
 def get_initial_data():
     return {
         "config": controller.config,
-        "stats": STATS,
+        "stats": STATS.snapshot(),
         "is_monitoring": controller.monitoring,
-        "missing_libs": MISSING_LIBS,
-        "ffmpeg_installed": FFMPEG_AVAILABLE
+        "missing_libs": missing_libs(),
+        "ffmpeg_installed": check_ffmpeg()
     }
 
-@eel.expose
+@expose
 def save_config_from_js(data):
     try:
+        # Command-line overrides are for this run only: the form echoes them back, so they
+        # are only written if the user changed them, which also lifts the override
+        data = dict(data)
+        for key, value in list(controller.overrides.items()):
+            if key in data and data[key] == value:
+                del data[key]
+            elif key in data:
+                del controller.overrides[key]
+        persisted = load_config()
+        persisted.update(data)
+        save_config_file(persisted)
         controller.config.update(data)
-        save_config_file(controller.config)
         return {"success": True, "message": "Configuration saved"}
     except Exception as e:
         return {"success": False, "message": str(e)}
 
-@eel.expose
+def ask_directory():
+    """Native folder picker; GUI only"""
+    import tkinter as tk
+    from tkinter import filedialog
+    root = tk.Tk()
+    root.withdraw()
+    root.attributes('-topmost', True)
+    folder = filedialog.askdirectory()
+    root.destroy()
+    return folder
+
+def ask_files():
+    """Native multi-file picker; GUI only"""
+    import tkinter as tk
+    from tkinter import filedialog
+    root = tk.Tk()
+    root.withdraw()
+    root.attributes('-topmost', True)
+    files = filedialog.askopenfilenames()
+    root.destroy()
+    return list(files)
+
+@expose
 def select_folder():
     try:
-        root = tk.Tk()
-        root.withdraw()
-        root.attributes('-topmost', True)
-        folder = filedialog.askdirectory()
-        root.destroy()
+        folder = ask_directory()
         return normalize_windows_path(folder) if folder else ""
     except:
         return ""
 
-@eel.expose
+@expose
 def start_monitoring():
     try:
         success = controller.start_monitoring()
@@ -778,7 +4248,7 @@ def start_monitoring():
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-@eel.expose
+@expose
 def stop_monitoring():
     try:
         controller.stop_monitoring()
@@ -786,69 +4256,178 @@ def stop_monitoring():
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-@eel.expose
-def run_mass_import():
+@expose
+def sort_files(paths=None):
+    """Sorts files the user picked ahead of any watch, heartbeat or sweep backlog"""
+    try:
+        if not controller.monitoring:
+            return {"success": False, "message": "Start monitoring first"}
+        if not paths:
+            paths = ask_files()
+        files = [os.path.abspath(p) for p in paths if os.path.isfile(p)]
+        if not files:
+            return {"success": False, "message": "No files selected"}
+        # The pipeline cleans up the folder a file came from, so only the monitor folder is fair game
+        root = controller.config.get("monitor")
+        outside = [f for f in files if not is_inside(f, root)]
+        if outside:
+            return {"success": False, "message": f"Not in the monitor folder: {os.path.basename(outside[0])}"}
+        queued = sum(1 for f in files if controller.queue.add_file(f, "interactive"))
+        return {"success": True, "queued": queued, "message": f"Queued {queued} of {len(files)} files"}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+def _import_progress(progress):
+    controller.events.update("progress", progress)
+    if progress["state"] in ("finished", "cancelled"):
+        controller.events.publish("toast", f"Import {progress['state'].title()}: {progress['moved']} files", "success")
+
+@expose
+def run_mass_import(folder=None):
     try:
-        root = tk.Tk()
-        root.withdraw()
-        root.attributes('-topmost', True)
-        folder = filedialog.askdirectory()
-        root.destroy()
+        if controller.mass_import and controller.mass_import.active():
+            return {"success": False, "message": "A mass import is already running"}
+        if not folder:
+            folder = ask_directory()
         
         if folder and os.path.exists(folder):
-            def mass_worker():
-                count = 0
-                proc = Processor(controller.config, controller.log, controller.update_stat)
-                for root, _, files in os.walk(folder):
-                    for file in files:
-                        if proc.process_file(os.path.join(root, file)): 
-                            count += 1
-                controller.log(f"Mass import finished. Moved {count} files.", "success")
-                eel.js_show_toast(f"Import Complete: {count} files", "success")
-            
-            threading.Thread(target=mass_worker, daemon=True).start()
+            folder = os.path.abspath(folder)
+            proc = Processor(controller.config, controller.log, controller.update_stat)
+            controller.mass_import = MassImport(folder, proc, on_progress=_import_progress)
+            controller.mass_import.start()
             return {"success": True, "message": f"Starting mass import from {folder}"}
         else:
             return {"success": False, "message": "No folder selected"}
     except Exception as e:
         return {"success": False, "message": str(e)}
 
-@eel.expose
-def test_parser(filename):
+@expose
+def control_mass_import(action):
     try:
-        parser = IntelligentParser()
-        classifier = MediaClassifier(controller.config)
-        
-        clean = parser.clean_filename_aggressive(filename)
-        
-        # Test TV detection
-        is_tv = bool(re.search(r'(s\d+|season)', filename, re.IGNORECASE))
-        result = {"original": filename, "cleaned": clean, "is_tv": is_tv}
-        
-        if is_tv:
-            name, year, season, episode, title = classifier.get_tv_details(filename)
+        job = controller.mass_import
+        if not job or not job.active():
+            return {"success": False, "message": "No mass import is running"}
+        if action not in ("pause", "resume", "cancel"):
+            return {"success": False, "message": f"Unknown action: {action}"}
+        getattr(job, action)()
+        return {"success": True, "progress": job.progress()}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+@expose
+def get_mass_import_status():
+    try:
+        job = controller.mass_import
+        return {"success": True, "progress": job.progress() if job else None,
+                "unfinished": [f for f in JOURNAL.unfinished_imports() if not (job and job.active() and f == job.folder)]}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def parse_releases(filenames, config):
+    """Shows how file names would be cleaned and identified; names of one release share a lookup"""
+    parser = IntelligentParser()
+    details = MediaClassifier(config).classify_batch(filenames)
+    results = []
+    for filename in filenames:
+        d = details.get(filename, {})
+        result = {"original": filename, "cleaned": parser.clean_filename_aggressive(filename),
+                  "is_tv": parser.is_tv(filename)}
+        if "error" in d:
+            result["error"] = d["error"]
+        if d.get("category") == "tv":
             result.update({
                 "type": "tv",
-                "series_name": name,
-                "year": year,
-                "season": season,
-                "episode": episode,
-                "episode_title": title
+                "series_name": d.get("name"),
+                "year": d.get("year"),
+                "season": d.get("season"),
+                "episode": d.get("episode"),
+                "episode_title": d.get("episode_title")
             })
-        else:
-            name, year = classifier.get_movie_details(filename)
+        elif d.get("category") == "movie":
             result.update({
                 "type": "movie",
-                "movie_name": name,
-                "year": year
+                "movie_name": d.get("name"),
+                "year": d.get("year")
             })
-        
-        return {"success": True, "result": result}
+        else:
+            result.update({key: d.get(key) for key in ("artist", "album", "title", "track", "disc")},
+                          type="music")
+        results.append(result)
+    return results
+
+def parse_release(filename, config):
+    """Shows how a file name would be cleaned and identified"""
+    return parse_releases([filename], config)[0]
+
+@expose
+def test_parser(filename):
+    """Parses one name, or a batch given as a list or one name per line"""
+    try:
+        names = filename if isinstance(filename, list) else [n.strip() for n in str(filename).splitlines()]
+        results = parse_releases([n for n in names if n], controller.config)
+        return {"success": True, "result": results[0] if len(results) == 1 else results}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@expose
+def get_cache_stats():
+    try:
+        return {"success": True, "stats": METADATA_CACHE.stats()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@expose
+def purge_cache(mode="all"):
+    try:
+        removed = METADATA_CACHE.purge(mode)
+        controller.log(f"Metadata cache purged ({mode}): {removed} entries", "info")
+        return {"success": True, "removed": removed, "stats": METADATA_CACHE.stats()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@expose
+def get_worker_status():
+    try:
+        workers = controller.workers if controller.monitoring else None
+        return {"success": True, "running": workers is not None,
+                "stages": workers.status() if workers else {}}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@expose
+def get_metrics():
+    """Stage, API and move metrics; the same data the Prometheus endpoint serves"""
+    try:
+        return {"success": True, **METRICS.snapshot()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@expose
+def get_event_backlog(since=0):
+    """What a reconnecting frontend missed: buffered log lines and toasts, plus current stats"""
+    try:
+        job = controller.mass_import
+        return {"success": True, **controller.events.backlog(int(since or 0)),
+                "stats": STATS.snapshot(), "progress": job.progress() if job else None}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@expose
+def get_journal_summary():
+    try:
+        return {"success": True, "summary": JOURNAL.summary()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@expose
+def get_file_history(path):
+    try:
+        return {"success": True, "path": path, "history": JOURNAL.history(path)}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 # ===== TEST FUNCTION =====
-@eel.expose
+@expose
 def test_connection():
     return "Python backend is working!"
 
@@ -880,8 +4459,107 @@ def get_windows_browser():
     
     return None
 
+# ===== HEADLESS CLI =====
+def _json_writer(stream):
+    lock = threading.Lock()
+    def emit(record):
+        line = json.dumps(record, default=str)
+        with lock:
+            stream.write(line + "\n")
+            stream.flush()
+    return emit
+
+def _on_shutdown_signal(handler):
+    """Routes SIGINT and SIGTERM (systemd stop) to handler"""
+    import signal
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: handler())
+
+def cli_watch(args, emit):
+    stop = threading.Event()
+    _on_shutdown_signal(stop.set)
+    if not controller.start_monitoring():
+        return 1
+    while not stop.wait(1):
+        pass
+    controller.stop_monitoring()
+    return 0
+
+def cli_import(args, emit):
+    folder = os.path.abspath(args.folder)
+    if not os.path.isdir(folder):
+        controller.log(f"Not a folder: {folder}", "error")
+        return 2
+    last = [0.0]
+    def progress(p):
+        if p["state"] in ("finished", "cancelled") or time.monotonic() - last[0] >= args.progress_every:
+            last[0] = time.monotonic()
+            emit({"ts": datetime.now().isoformat(timespec="seconds"), "event": "import_progress", **p})
+    proc = Processor(controller.config, controller.log, controller.update_stat)
+    job = MassImport(folder, proc, on_progress=progress)
+    controller.mass_import = job
+    _on_shutdown_signal(job.cancel)
+    job.start()
+    while job.thread.is_alive():
+        job.thread.join(0.5)
+    return 0 if job.state == "finished" else 1
+
+def cli_parse(args, emit):
+    for result in parse_releases(args.names, controller.config):
+        emit(result)
+    return 0
+
+def cli_stats(args, emit):
+    METADATA_CACHE.configure(controller.config)
+    emit({"journal": JOURNAL.summary(), "cache": METADATA_CACHE.stats(),
+          "unfinished_imports": JOURNAL.unfinished_imports()})
+    return 0
+
+def run_cli(argv):
+    """Headless entry point: no Eel, no tkinter, results and logs as JSON lines on stdout"""
+    global CONFIG_FILE
+    import argparse
+    ap = argparse.ArgumentParser(prog="MediaSorter", description="Media Sorter Pro (headless mode)")
+    ap.add_argument("--config", help=f"config file (default: ./{CONFIG_FILE})")
+    ap.add_argument("--log-format", choices=("json", "text"), default="json")
+    ap.add_argument("--offline", action="store_true",
+                    help="no metadata lookups: sort from file names, tags and local caches only")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("gui", help="start the desktop interface")
+    sub.add_parser("watch", help="monitor the configured folder until stopped")
+    p = sub.add_parser("import", help="sort every file in a folder")
+    p.add_argument("folder")
+    p.add_argument("--progress-every", type=float, default=10.0, metavar="SECONDS")
+    p = sub.add_parser("parse", help="show how release names are identified")
+    p.add_argument("names", nargs="+", metavar="name")
+    sub.add_parser("stats", help="print journal and cache statistics")
+    args = ap.parse_args(argv)
+
+    if args.config:
+        CONFIG_FILE = os.path.abspath(args.config)
+    if args.offline:
+        controller.overrides["offline_mode"] = True
+    if args.command == "gui":
+        return run_gui()
+
+    # stdout carries only JSON; stray prints from deeper code go to stderr
+    emit = _json_writer(sys.stdout)
+    sys.stdout = sys.stderr
+    controller.reload_config()
+    if args.log_format == "json":
+        controller.log_sink = lambda message, level: emit(
+            {"ts": datetime.now().isoformat(timespec="seconds"), "level": level, "msg": message})
+    commands = {"watch": cli_watch, "import": cli_import, "parse": cli_parse, "stats": cli_stats}
+    return commands[args.command](args, emit)
+
 # ===== SIMPLIFIED MAIN =====
-if __name__ == "__main__":
+def run_gui():
+    import eel
+    controller.reload_config()
+    for name, func in EXPOSED.items():
+        eel.expose(func)
+    controller.attach_ui(lambda name, *args: getattr(eel, name)(*args))
+
     print("=" * 60)
     print("Media Sorter Pro - Starting...")
     print(f"Python version: {sys.version}")
@@ -1030,10 +4708,6 @@ if __name__ == "__main__":
             
             # Try manual access
             print(f"\nYou can try accessing manually at: http://127.0.0.1:{port}")
-            print("Or try running with a different browser:")
-            print("  python MediaSorter.py --mode=edge")
-            print("  python MediaSorter.py --mode=chrome")
-            print("  python MediaSorter.py --mode=default")
         
         # Keep console open
         try:
@@ -1041,4 +4715,13 @@ if __name__ == "__main__":
         except:
             pass
         
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+if __name__ == "__main__":
+    # Fingerprinting runs in a process pool, which a frozen Windows build must support
+    import multiprocessing
+    multiprocessing.freeze_support()
+    # Any arguments select the headless CLI; a bare start opens the GUI as before
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+    run_gui()
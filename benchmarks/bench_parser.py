@@ -0,0 +1,118 @@
+"""Parser microbenchmark.
+
+Generates realistic release names and times IntelligentParser against the
+original per-term regex implementation, checking both produce the same output.
+
+    python benchmarks/bench_parser.py --count 300000 --min-speedup 2
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SHOWS = ["Game of Thrones", "The Office US", "Breaking Bad", "Doctor Who 2005", "The Expanse",
+         "Stranger Things", "Better Call Saul", "Top Gear", "Blue Planet II", "Shogun"]
+MOVIES = ["The Matrix", "Blade Runner 2049", "Spirited Away", "Heat", "Alien", "Arrival",
+          "The Godfather Part II", "Mad Max Fury Road", "Dune Part One", "Parasite"]
+QUALITY = ["1080p", "720p", "2160p", "4K", "HDR", "BluRay", "WEB-DL", "WEBRip", "HDTV", "DVDRip"]
+CODEC = ["x264", "x265", "H264", "HEVC", "AAC", "AC3", "DTS", "Atmos", "TrueHD"]
+GROUP = ["RARBG", "YIFY", "YTS", "EZTV", "PSA", "TGx", "NTb", "FLUX", "SPARKS"]
+EXTRA = ["", "", "", "EXTENDED", "UNRATED", "REMASTERED", "PROPER", "REPACK"]
+EXTS = [".mkv", ".mp4", ".avi", ".m4v"]
+
+
+def generate_names(count, seed=1):
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        sep = rng.choice([".", ".", " ", "_"])
+        tags = rng.sample(QUALITY, 2) + rng.sample(CODEC, rng.randint(1, 2))
+        if rng.random() < 0.5:
+            show = rng.choice(SHOWS)
+            marker = rng.choice([f"S{rng.randint(1, 12):02d}E{rng.randint(1, 24):02d}",
+                                 f"{rng.randint(1, 9)}x{rng.randint(1, 24):02d}"])
+            parts = show.split() + [marker] + tags
+        else:
+            parts = rng.choice(MOVIES).split()
+            if rng.random() < 0.8:
+                parts.append(f"({rng.randint(1950, 2024)})" if rng.random() < 0.3 else str(rng.randint(1950, 2024)))
+            parts += [rng.choice(EXTRA)] + tags
+        name = sep.join(p for p in parts if p) + "-" + rng.choice(GROUP)
+        if rng.random() < 0.2:
+            name = f"[{rng.choice(GROUP)}] " + name
+        names.append(name + rng.choice(EXTS))
+    return names
+
+
+def legacy_clean(patterns, filename):
+    """The original clean_filename_aggressive, kept as the baseline"""
+    name = os.path.splitext(filename)[0]
+    name = name.replace('.', ' ').replace('_', ' ').replace('-', ' ')
+    year_match = re.search(r'\b(19|20)\d{2}\b', name)
+    if year_match:
+        name = name[:year_match.end()]
+    for category in patterns.values():
+        for term in category:
+            name = re.sub(rf'\b{term}\b', '', name, flags=re.IGNORECASE)
+
+    def paren_handler(match):
+        content = match.group(1)
+        keep = [r'^\d{4}$', r'^US$', r'^UK$', r'^Extended$']
+        if any(re.match(p, content, re.IGNORECASE) for p in keep):
+            return f" ({content})"
+        return ""
+
+    name = re.sub(r'\((.*?)\)', paren_handler, name)
+    name = re.sub(r'\[.*?\]', '', name)
+    return re.sub(r'\s+', ' ', name).strip()
+
+
+def legacy_is_tv(filename):
+    return bool(re.search(r'(s\d+|season)', filename, re.IGNORECASE))
+
+
+def timed(label, func, names):
+    start = time.perf_counter()
+    out = [func(n) for n in names]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.3f}s  {len(names) / elapsed:12,.0f} names/s")
+    return out, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--count", type=int, default=300000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--min-speedup", type=float, default=0,
+                    help="exit non-zero if the compiled parser is not at least this much faster")
+    args = ap.parse_args()
+
+    from MediaSorter import IntelligentParser
+
+    parser = IntelligentParser()
+    names = generate_names(args.count, args.seed)
+    print(f"{len(names):,} release names\n")
+
+    legacy, legacy_time = timed("legacy clean", lambda n: legacy_clean(parser.patterns, n), names)
+    current, current_time = timed("compiled clean", parser.clean_filename_aggressive, names)
+    legacy_tv, _ = timed("legacy is_tv", legacy_is_tv, names)
+    current_tv, _ = timed("compiled is_tv", parser.is_tv, names)
+
+    mismatches = [(n, a, b) for n, a, b in zip(names, legacy, current) if a != b]
+    mismatches += [(n, a, b) for n, a, b in zip(names, legacy_tv, current_tv) if a != b]
+    speedup = legacy_time / current_time
+    print(f"\nclean speedup: {speedup:.2f}x, mismatches: {len(mismatches)}")
+    for n, a, b in mismatches[:10]:
+        print(f"  {n!r}: {a!r} != {b!r}")
+
+    if mismatches or speedup < args.min_speedup:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
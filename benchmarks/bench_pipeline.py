@@ -0,0 +1,471 @@
+"""End-to-end pipeline benchmark.
+
+Builds a synthetic download tree - TV season packs, loose episodes, movies,
+tagged and untagged audio, sidecar junk and partial downloads - and sorts it
+through the real watch and mass-import paths. TVMaze, TMDB, MusicBrainz and
+AcoustID are replaced by local stub servers with configurable latency and 429
+responses. Reports throughput, p50/p99 per-file latency, per-stage latency and
+API calls per provider.
+
+    python benchmarks/bench_pipeline.py --scale 4 --latency 80 --throttle-every 25 --tmdb
+
+Each mode runs in a fresh interpreter with its own working directory, so the
+metadata cache, journal and hash index start cold every time.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SHOWS = ["The Expanse", "Breaking Bad", "Doctor Who 2005", "Stranger Things", "Better Call Saul",
+         "Top Gear", "Blue Planet II", "Shogun"]
+MOVIES = [("The Matrix", 1999), ("Blade Runner 2049", 2017), ("Spirited Away", 2001), ("Heat", 1995),
+          ("Arrival", 2016), ("Mad Max Fury Road", 2015), ("Dune Part One", 2021), ("Parasite", 2019)]
+ARTISTS = ["Radiohead", "Massive Attack", "Bonobo", "Portishead", "Boards of Canada", "Air"]
+QUALITY = ["1080p.WEB-DL.x264-NTb", "720p.HDTV.x264-FLUX", "2160p.BluRay.x265-SPARKS", "1080p.BluRay.x264-RARBG"]
+JUNK = [".nfo", ".txt", ".jpg", ".url"]
+MEDIA_KINDS = ("video", "tagged", "untagged")
+TERMINAL = ("done", "failed", "skipped", "gone")
+
+# One MPEG-1 Layer III frame (128 kbit/s, 44.1 kHz) of silence, so mutagen can read the files
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+
+
+# ----- synthetic corpus -----
+
+def build_manifest(scale, seed):
+    """Returns [(relative path, kind, tags)] for a download folder scale times the base size"""
+    rng = random.Random(seed)
+    files = []
+    for n in range(scale):
+        for show in rng.sample(SHOWS, 2):
+            season = rng.randint(1, 6)
+            dotted = show.replace(" ", ".")
+            quality = rng.choice(QUALITY)
+            pack = f"{dotted}.S{season:02d}.{quality}"
+            for ep in range(1, 7):
+                files.append((f"{pack}/{dotted}.S{season:02d}E{ep:02d}.{quality}.mkv", "video", None))
+            files.append((f"{pack}/{dotted}.S{season:02d}.{quality}.nfo", "junk", None))
+            files.append((f"{dotted}.S{season + 1:02d}E{rng.randint(1, 12):02d}.{rng.choice(QUALITY)}.mkv",
+                          "video", None))
+        for title, year in rng.sample(MOVIES, 3):
+            release = f"{title.replace(' ', '.')}.{year}.{rng.choice(QUALITY)}"
+            files.append((f"{release}/{release}.mkv", "video", None))
+            for ext in rng.sample(JUNK, 2):
+                files.append((f"{release}/{release}{ext}", "junk", None))
+        artist = rng.choice(ARTISTS)
+        album = f"{artist} - Album {n + 1} ({rng.randint(1995, 2023)})"
+        for track in range(1, 7):
+            tags = {"artist": artist, "title": f"Song {n + 1}-{track}", "album": f"Album {n + 1}",
+                    "tracknumber": f"{track}/6"}
+            files.append((f"{album}/{track:02d} - Song {n + 1}-{track}.mp3", "tagged", tags))
+        files.append((f"{album}/cover.jpg", "junk", None))
+        for i in range(2):
+            files.append((f"{rng.choice(ARTISTS)} - Loose Song {n + 1}-{i}.mp3", "untagged", None))
+            files.append((f"AUDIO_{n:02d}{i:02d}.mp3", "untagged", None))
+        # Abandoned downloads that never complete
+        files.append((f"{rng.choice(MOVIES)[0].replace(' ', '.')}.{n}.mkv.part", "partial", None))
+    return files
+
+
+def file_bytes(rel, kind, tags, size):
+    """Unique content per file, so duplicate detection never merges two synthetic files"""
+    marker = hashlib.sha1(rel.encode("utf-8")).digest() * 4
+    if kind in ("tagged", "untagged"):
+        return MP3_FRAME * max(1, size // len(MP3_FRAME))
+    if kind == "junk":
+        return marker
+    body = marker * max(1, size // len(marker))
+    return body[:size - len(marker)] + marker
+
+
+def tag_audio(path, rel, kind, tags):
+    try:
+        from mutagen.id3 import ID3, COMM, TALB, TIT2, TPE1, TRCK
+    except ImportError:
+        # Without mutagen the files stay unique through a trailing marker instead
+        with open(path, "ab") as f:
+            f.write(hashlib.sha1(rel.encode("utf-8")).digest())
+        return
+    id3 = ID3()
+    # A comment keeps 'untagged' files unique without giving them artist/title tags
+    id3.add(COMM(encoding=3, lang="eng", desc="bench", text=rel))
+    if kind == "tagged":
+        id3.add(TPE1(encoding=3, text=tags["artist"]))
+        id3.add(TIT2(encoding=3, text=tags["title"]))
+        id3.add(TALB(encoding=3, text=tags["album"]))
+        id3.add(TRCK(encoding=3, text=tags["tracknumber"]))
+    id3.save(path)
+
+
+def write_file(path, rel, kind, tags, size, download_seconds=0.0, chunks=4):
+    """Writes one file, optionally in chunks spread over download_seconds like a slow download"""
+    data = file_bytes(rel, kind, tags, size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    step = max(1, -(-len(data) // chunks))
+    with open(path, "wb") as f:
+        for i in range(0, len(data), step):
+            f.write(data[i:i + step])
+            f.flush()
+            if download_seconds:
+                time.sleep(download_seconds / chunks)
+    if kind in ("tagged", "untagged"):
+        tag_audio(path, rel, kind, tags)
+
+
+# ----- stub API servers -----
+
+class StubProvider:
+    """One fake metadata API on its own loopback address, with latency and periodic 429s"""
+    def __init__(self, name, latency, jitter, throttle_every, retry_after, address):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.server = ThreadingHTTPServer((address, 0), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}" + ("/3" if self.name == "tmdb" else "")
+
+    def reset(self):
+        with self.lock:
+            counts = {"requests": self.requests, "throttled": self.throttled}
+            self.requests = self.throttled = 0
+        return counts
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._respond(parse_qs(urlsplit(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._respond(parse_qs(self.rfile.read(length).decode("utf-8")))
+
+            def _respond(self, params):
+                with stub.lock:
+                    stub.requests += 1
+                    throttle = stub.throttle_every and stub.requests % stub.throttle_every == 0
+                    if throttle:
+                        stub.throttled += 1
+                time.sleep((stub.latency + random.uniform(0, stub.jitter)) / 1000.0)
+                if throttle:
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(stub.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps(getattr(stub, f"_{stub.name}")(urlsplit(self.path).path, params)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @staticmethod
+    def _id(text):
+        return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:6], 16)
+
+    def _tvmaze(self, path, params):
+        name = params.get("q", [""])[0].title()
+        return {"id": self._id(name), "name": name, "premiered": "2011-04-17"}
+
+    def _tmdb(self, path, params):
+        query = params.get("query", [""])[0].title()
+        if path.endswith("/search/tv"):
+            results = [{"id": self._id(query), "name": query, "first_air_date": "2011-04-17"}]
+        elif path.endswith("/search/movie"):
+            results = [{"id": self._id(query), "title": query, "release_date": "2001-01-01"}]
+        else:
+            return {"id": self._id(path), "name": f"Episode {path.rstrip('/').rsplit('/', 1)[-1]}"}
+        return {"page": 1, "results": results, "total_pages": 1, "total_results": 1}
+
+    def _musicbrainz(self, path, params):
+        query = params.get("query", [""])[0]
+        return {"recordings": [{"title": query.title(), "artist-credit": [{"name": "Stub Artist"}]}]}
+
+    def _acoustid(self, path, params):
+        def results(fp):
+            return [{"id": fp[:8], "score": 0.95, "recordings": [
+                {"id": fp[:12], "title": f"Track {fp[:6]}", "artists": [{"name": "Fingerprinted Artist"}]}]}]
+        indexes = sorted(int(k.split(".")[1]) for k in params if k.startswith("fingerprint."))
+        if not indexes:
+            return {"status": "ok", "results": results(params.get("fingerprint", [""])[0])}
+        return {"status": "ok", "fingerprints": [
+            {"index": i, "results": results(params[f"fingerprint.{i}"][0])} for i in indexes]}
+
+
+def start_stubs(args):
+    stubs = {}
+    for i, name in enumerate(("tvmaze", "tmdb", "musicbrainz", "acoustid")):
+        # Separate loopback addresses keep each provider's client-side rate limit separate
+        for address in (f"127.0.0.{11 + i}", "127.0.0.1"):
+            try:
+                stubs[name] = StubProvider(name, args.latency, args.jitter, args.throttle_every,
+                                           args.retry_after, address)
+                break
+            except OSError:
+                continue
+    return stubs
+
+
+# ----- one run, in a fresh interpreter -----
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))]
+
+
+def child(spec_path):
+    with open(spec_path, encoding="utf-8") as f:
+        spec = json.load(f)
+    sys.path.insert(0, ROOT)
+    import MediaSorter as M
+    M.controller.reload_config()
+
+    errors = []
+    M.controller.log_sink = lambda message, level: errors.append(message) if level == "error" else None
+    if spec["simulate_fpcalc"]:
+        # No fpcalc on this machine: stand in a deterministic fingerprint with the given cost
+        cost = spec["simulate_fpcalc"] / 1000.0
+
+        def fake_fingerprint(path):
+            time.sleep(cost)
+            return 180.0, hashlib.sha1(os.path.basename(path).encode("utf-8")).hexdigest()
+        M._fingerprint_file = fake_fingerprint
+        M.check_ffmpeg = lambda: True
+
+    manifest = spec["manifest"]
+    source = spec["source"]
+    media = [os.path.join(source, rel) for rel, kind, _ in manifest if kind in MEDIA_KINDS]
+    started_at = {}
+    processor = None
+
+    def terminal_times():
+        with M.JOURNAL.lock:
+            conn = M.JOURNAL._connect()
+            rows = conn.execute("SELECT path, state, MAX(at) FROM history WHERE state IN (?, ?, ?, ?) "
+                                "GROUP BY path", TERMINAL).fetchall()
+        return {path: (state, at) for path, state, at in rows}
+
+    def wait_for(paths, deadline):
+        while time.time() < deadline:
+            done = terminal_times()
+            if all(p in done for p in paths):
+                return done
+            time.sleep(0.25)
+        return terminal_times()
+
+    t0 = time.time()
+    if spec["mode"] == "import":
+        for rel, kind, tags in manifest:
+            write_file(os.path.join(source, rel), rel, kind, tags, spec["size"])
+        processor = M.Processor(M.controller.config, M.controller.log, M.controller.update_stat)
+        job = M.MassImport(source, processor)
+        put = job._put
+
+        def timed_put(batch):
+            started_at.update((path, time.time()) for path in batch)
+            put(batch)
+        job._put = timed_put
+        t0 = time.time()
+        job.start()
+        job.thread.join(spec["timeout"])
+        finished = terminal_times()
+    else:
+        if not M.controller.start_monitoring():
+            print(json.dumps({"error": "monitoring did not start", "log": errors[-5:]}))
+            return 1
+        processor = M.controller.processor
+        t0 = time.time()
+        pause = 1.0 / spec["arrival_rate"] if spec["arrival_rate"] else 0
+        for rel, kind, tags in manifest:
+            final = os.path.join(source, rel)
+            if kind == "partial":
+                write_file(final, rel, kind, tags, spec["size"])
+                continue
+            # Downloads land under a .part name and are renamed once complete
+            write_file(final + ".part", rel, kind, tags, spec["size"], spec["download_seconds"])
+            os.replace(final + ".part", final)
+            started_at[final] = time.time()
+            if pause:
+                time.sleep(pause)
+        finished = wait_for(media, t0 + spec["timeout"])
+        M.controller.stop_monitoring()
+
+    outcomes = {}
+    latencies = []
+    last = t0
+    for path in media:
+        state, at = finished.get(path, ("pending", None))
+        outcomes[state] = outcomes.get(state, 0) + 1
+        if at is not None:
+            last = max(last, at)
+            if path in started_at:
+                latencies.append(at - started_at[path])
+    wall = max(last - t0, 1e-9)
+    snapshot = M.METRICS.snapshot()
+    moved = sum(s["value"] for s in snapshot["counters"].get("mediasorter_moved_bytes_total", []))
+    completed = sum(n for state, n in outcomes.items() if state in TERMINAL)
+    print(json.dumps({
+        "mode": spec["mode"], "files": len(media), "completed": completed, "outcomes": outcomes,
+        "wall": wall, "files_per_sec": completed / wall, "bytes_per_sec": moved / wall,
+        "p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99),
+        "stages": {h["labels"]["stage"]: h for h in snapshot["histograms"].get("mediasorter_stage_seconds", [])},
+        "api": {h["labels"]["provider"]: h
+                for h in snapshot["histograms"].get("mediasorter_api_request_seconds", [])},
+        "music": processor.classifier.music.counts if processor else {},
+        "errors": len(errors),
+    }))
+    return 0
+
+
+# ----- driver -----
+
+def run_mode(mode, args, manifest, stubs, workdir):
+    run = os.path.join(workdir, mode)
+    dirs = {name: os.path.join(run, name) for name in ("downloads", "tv", "movie", "music", "other")}
+    for d in dirs.values():
+        os.makedirs(d)
+    config = {"monitor": dirs["downloads"], "tv": dirs["tv"], "movie": dirs["movie"],
+              "music": dirs["music"], "other": dirs["other"], "use_ai_correction": True,
+              "stable_seconds": args.stable_seconds,
+              "api_endpoints": {name: stub.url for name, stub in stubs.items()}}
+    if args.tmdb:
+        config["api_key"] = "bench"
+    if args.acoustid:
+        config["acoustid_key"] = "bench"
+        if args.simulate_fpcalc:
+            config["fingerprint_workers"] = 0
+    with open(os.path.join(run, "sorter_config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    spec = {"mode": mode, "manifest": manifest, "source": dirs["downloads"], "size": args.size_kb * 1024,
+            "download_seconds": args.download_ms / 1000.0, "arrival_rate": args.arrival_rate,
+            "simulate_fpcalc": args.simulate_fpcalc if args.acoustid else 0, "timeout": args.timeout}
+    spec_path = os.path.join(run, "spec.json")
+    with open(spec_path, "w", encoding="utf-8") as f:
+        json.dump(spec, f)
+
+    for stub in stubs.values():
+        stub.reset()
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", spec_path],
+                         cwd=run, capture_output=True, text=True, timeout=args.timeout + 60)
+    lines = out.stdout.strip().splitlines()
+    if out.returncode != 0 or not lines:
+        raise RuntimeError(f"{mode} run failed:\n{out.stderr[-2000:]}")
+    result = json.loads(lines[-1])
+    result["stubs"] = {name: stub.reset() for name, stub in stubs.items()}
+    return result
+
+
+def ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+
+def report(result):
+    print(f"\n== {result['mode']}: {result['completed']}/{result['files']} media files in {result['wall']:.2f}s "
+          f"-> {result['files_per_sec']:.1f} files/s, {result['bytes_per_sec'] / 1048576:.1f} MB/s")
+    print(f"   per-file latency p50 {ms(result['p50'])}  p99 {ms(result['p99'])}   "
+          f"outcomes {result['outcomes']}   logged errors {result['errors']}")
+    print(f"   {'stage':<18}{'items':>7}{'p50':>10}{'p99':>10}")
+    for name, h in sorted(result["stages"].items()):
+        print(f"   {name:<18}{h['count']:>7}{ms(h['p50']):>10}{ms(h['p99']):>10}")
+    print(f"   {'provider':<18}{'calls':>7}{'429s':>7}{'p50':>10}{'p99':>10}")
+    for name, counts in result["stubs"].items():
+        h = result["api"].get(name, {})
+        print(f"   {name:<18}{counts['requests']:>7}{counts['throttled']:>7}"
+              f"{ms(h.get('p50')):>10}{ms(h.get('p99')):>10}")
+    print(f"   music tiers {result['music']}")
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        sys.exit(child(sys.argv[2]))
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--mode", choices=("watch", "import", "both"), default="both")
+    ap.add_argument("--scale", type=int, default=2, help="corpus size multiplier (~45 files each)")
+    ap.add_argument("--size-kb", type=int, default=256, help="size of each media file")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--latency", type=float, default=50, help="stub response time in ms")
+    ap.add_argument("--jitter", type=float, default=20, help="extra random stub delay, up to this many ms")
+    ap.add_argument("--throttle-every", type=int, default=0, metavar="N",
+                    help="every Nth request to a provider gets a 429 (0 = never)")
+    ap.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with a 429")
+    ap.add_argument("--tmdb", action="store_true", help="configure a TMDB key so TMDB is queried first")
+    ap.add_argument("--acoustid", action="store_true", help="configure an AcoustID key")
+    ap.add_argument("--simulate-fpcalc", type=float, default=0, metavar="MS",
+                    help="with --acoustid and no fpcalc installed, fake a fingerprint costing MS each")
+    ap.add_argument("--stable-seconds", type=float, default=1.0)
+    ap.add_argument("--arrival-rate", type=float, default=0, help="watch mode: files/s (0 = as fast as possible)")
+    ap.add_argument("--download-ms", type=float, default=100, help="watch mode: time to write each file")
+    ap.add_argument("--timeout", type=float, default=600)
+    ap.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    ap.add_argument("--keep", action="store_true", help="keep the working directory")
+    ap.add_argument("--min-files-per-sec", type=float, default=0,
+                    help="exit non-zero if any mode sustains less than this")
+    args = ap.parse_args()
+
+    manifest = build_manifest(args.scale, args.seed)
+    media = sum(1 for _, kind, _ in manifest if kind in MEDIA_KINDS)
+    print(f"corpus: {len(manifest)} files ({media} media), {args.size_kb} KB each; "
+          f"stub latency {args.latency:.0f}+{args.jitter:.0f}ms, 429 every {args.throttle_every or '-'} requests")
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    stubs = start_stubs(args)
+    results = []
+    try:
+        for mode in (("import", "watch") if args.mode == "both" else (args.mode,)):
+            result = run_mode(mode, args, manifest, stubs, workdir)
+            report(result)
+            results.append(result)
+    finally:
+        for stub in stubs.values():
+            stub.close()
+        if args.keep:
+            print(f"\nworking directory: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if any(r["completed"] < r["files"] for r in results):
+        sys.exit(1)
+    if args.min_files_per_sec and any(r["files_per_sec"] < args.min_files_per_sec for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Startup benchmark.
+
+Measures time-to-ready in fresh interpreters for the headless CLI and the GUI
+(up to the point where Eel would open the browser), and reports which optional
+libraries each path ended up importing.
+
+    python benchmarks/bench_startup.py --runs 7 --max-headless-ms 150
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPTIONAL = ["requests", "tmdbv3api", "mutagen", "acoustid", "watchdog", "eel", "tkinter"]
+
+# Each probe runs in a new interpreter and prints its timings as JSON
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import MediaSorter
+imported = time.perf_counter()
+MediaSorter.controller.reload_config()
+mode = {mode!r}
+if mode == "headless":
+    # What 'watch' and 'import' do before touching any file
+    MediaSorter.controller.log_sink = lambda message, level: None
+    MediaSorter.Processor(MediaSorter.controller.config, MediaSorter.controller.log, MediaSorter.controller.update_stat)
+else:
+    import eel
+    for name, func in MediaSorter.EXPOSED.items():
+        eel.expose(func)
+    eel.init({web!r})
+    MediaSorter.get_initial_data()
+ready = time.perf_counter()
+print(json.dumps({{"import_ms": (imported - start) * 1000, "ready_ms": (ready - start) * 1000,
+                  "loaded": [m for m in {optional!r} if m in sys.modules]}}))
+"""
+
+
+def run_probe(mode, workdir, web):
+    code = PROBE.format(root=ROOT, mode=mode, web=web, optional=OPTIONAL)
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, capture_output=True, text=True)
+    wall = (time.perf_counter() - started) * 1000
+    if out.returncode != 0:
+        raise RuntimeError(f"{mode} probe failed:\n{out.stderr}")
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["wall_ms"] = wall
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--no-gui", action="store_true", help="skip the GUI path (e.g. eel not installed)")
+    ap.add_argument("--api-keys", action="store_true",
+                    help="configure dummy TMDB/AcoustID keys so the metadata backends are set up too")
+    ap.add_argument("--max-headless-ms", type=float, default=0,
+                    help="exit non-zero if the median headless time-to-ready exceeds this")
+    args = ap.parse_args()
+
+    # The probes read their config from, and create their databases in, a scratch working directory
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    web = os.path.join(workdir, "web")
+    os.makedirs(web)
+    for name in ("index.html", "main.js", "styles.css"):
+        shutil.copy(os.path.join(ROOT, name), web)
+    config = {"use_ai_correction": True}
+    if args.api_keys:
+        config.update(api_key="bench", acoustid_key="bench")
+    with open(os.path.join(workdir, "sorter_config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+    modes = ["headless"] + ([] if args.no_gui else ["gui"])
+    # One warm-up run each so the OS file cache does not skew the first sample
+    for mode in modes:
+        run_probe(mode, workdir, web)
+
+    print(f"{'path':<10} {'import':>10} {'ready':>10} {'wall':>10}   optional libs loaded")
+    medians = {}
+    for mode in modes:
+        runs = [run_probe(mode, workdir, web) for _ in range(args.runs)]
+        med = {k: statistics.median(r[k] for r in runs) for k in ("import_ms", "ready_ms", "wall_ms")}
+        medians[mode] = med
+        print(f"{mode:<10} {med['import_ms']:8.1f}ms {med['ready_ms']:8.1f}ms {med['wall_ms']:8.1f}ms   "
+              f"{', '.join(runs[-1]['loaded']) or '-'}")
+
+    headless = medians["headless"]["ready_ms"]
+    if "gui" in medians:
+        print(f"\nheadless is ready in {headless / medians['gui']['ready_ms']:.0%} of the GUI time")
+    shutil.rmtree(workdir, ignore_errors=True)
+    if args.max_headless_ms and headless > args.max_headless_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
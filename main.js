@@ -4,7 +4,9 @@ console.log("Media Sorter Pro loading...");
 let isMonitoring = false;
 let isConnected = false;
 let aiEnabled = true;
+let offlineMode = false;
 let elements = {};
+let lastEventSeq = 0;
 
 document.addEventListener('DOMContentLoaded', function() {
     initialize();
@@ -26,6 +28,7 @@ function cacheElements() {
         statusDot: document.getElementById('status-dot'),
         statusText: document.getElementById('status-text'),
         toggleAI: document.getElementById('toggle-ai'),
+        toggleOffline: document.getElementById('toggle-offline'),
         logContainer: document.getElementById('log-container'),
         toastContainer: document.getElementById('toast-container'),
         ffmpegWarning: document.getElementById('ffmpeg-warning'), // FFmpeg Warning
@@ -47,7 +50,34 @@ function cacheElements() {
         
         // System info
         sysMonitoringStatus: document.getElementById('sys-monitoring-status'),
-        sysMissingLibs: document.getElementById('sys-missing-libs')
+        sysMissingLibs: document.getElementById('sys-missing-libs'),
+        
+        // Metadata cache
+        cacheEntries: document.getElementById('cache-entries'),
+        cacheNegative: document.getElementById('cache-negative'),
+        cacheSize: document.getElementById('cache-size'),
+        cacheHitRate: document.getElementById('cache-hit-rate'),
+        
+        // Worker stages
+        workerStages: {
+            stability: document.getElementById('worker-stability'),
+            identify: document.getElementById('worker-identify'),
+            move: document.getElementById('worker-move'),
+            cleanup: document.getElementById('worker-cleanup')
+        },
+        // Metrics
+        metricsThroughput: document.getElementById('metrics-throughput'),
+        metricsMoved: document.getElementById('metrics-moved'),
+        metricsApiCalls: document.getElementById('metrics-api-calls'),
+        metricsApiErrors: document.getElementById('metrics-api-errors'),
+        metricsDetail: document.getElementById('metrics-detail'),
+        
+        // Work journal
+        journalPending: document.getElementById('journal-pending'),
+        journalDone: document.getElementById('journal-done'),
+        journalFailed: document.getElementById('journal-failed'),
+        journalSkipped: document.getElementById('journal-skipped'),
+        journalFailures: document.getElementById('journal-failures')
     };
 }
 
@@ -55,7 +85,7 @@ function setupEventListeners() {
     if (elements.startBtn) {
         elements.startBtn.addEventListener('click', toggleMonitoring);
     }
-    document.querySelectorAll('.input-field').forEach(input => {
+    document.querySelectorAll('input.input-field').forEach(input => {
         input.addEventListener('keypress', function(e) {
             if (e.key === 'Enter') saveConfig();
         });
@@ -94,6 +124,10 @@ function connectToBackend() {
                 elements.ffmpegWarning.classList.add('hidden');
             }
             
+            await loadEventBacklog();
+            loadCacheStats();
+            loadImportStatus();
+            
             showToast("Connected to backend", "success");
             addLog("System initialized", "success");
             
@@ -145,6 +179,10 @@ function populateConfig(config) {
         aiEnabled = config.use_ai_correction !== false;
         elements.toggleAI.classList.toggle('active', aiEnabled);
     }
+    if (elements.toggleOffline) {
+        offlineMode = config.offline_mode === true;
+        elements.toggleOffline.classList.toggle('active', offlineMode);
+    }
 }
 
 function updateStats(stats) {
@@ -201,6 +239,14 @@ function switchTab(tabId) {
     document.querySelectorAll('.tab-content').forEach(content => {
         content.classList.toggle('active', content.id === `tab-${tabId}`);
     });
+    if (tabId === 'tools' && isConnected) {
+        loadCacheStats();
+        loadJournalSummary();
+        loadWorkerStatus();
+        loadMetrics();
+    }
+    clearInterval(workerStatusTimer);
+    workerStatusTimer = tabId === 'tools' ? setInterval(() => { loadWorkerStatus(); loadMetrics(); }, 3000) : null;
 }
 
 function toggleAI() {
@@ -210,6 +256,13 @@ function toggleAI() {
     showToast(`AI Correction ${aiEnabled ? 'enabled' : 'disabled'}`, "info");
 }
 
+function toggleOffline() {
+    if (!elements.toggleOffline) return;
+    offlineMode = !offlineMode;
+    elements.toggleOffline.classList.toggle('active', offlineMode);
+    showToast(`Offline mode ${offlineMode ? 'enabled' : 'disabled'}`, "info");
+}
+
 async function browseFolder(key) {
     if (!isConnected) return showToast("Not connected to backend", "error");
     try {
@@ -236,7 +289,8 @@ async function saveConfig() {
             other: elements.cfgOther?.value || '',
             api_key: elements.cfgApiKey?.value || '',
             acoustid_key: elements.cfgAcoustidKey?.value || '',
-            use_ai_correction: aiEnabled
+            use_ai_correction: aiEnabled,
+            offline_mode: offlineMode
         };
         const result = await eel.save_config_from_js(config)();
         if (result.success) {
@@ -275,17 +329,83 @@ async function toggleMonitoring() {
     finally { if (btn) btn.disabled = false; }
 }
 
-async function runMassImport() {
+async function runMassImport(folder = null) {
     if (!isConnected) return showToast("Not connected to backend", "error");
     try {
-        const result = await eel.run_mass_import()();
+        const result = await eel.run_mass_import(folder)();
         if (result.success) {
             showToast("Mass import started", "info");
             addLog("Mass import started", "info");
+            document.getElementById('import-unfinished')?.classList.add('hidden');
         } else { showToast("Import failed: " + result.message, "error"); }
     } catch (error) { showToast("Import failed", "error"); }
 }
 
+async function sortFiles() {
+    if (!isConnected) return showToast("Not connected to backend", "error");
+    try {
+        const result = await eel.sort_files()();
+        if (result.success) {
+            showToast(result.message, "info");
+            addLog(result.message, "info");
+        } else { showToast("Sort failed: " + result.message, "error"); }
+    } catch (error) { showToast("Sort failed", "error"); }
+}
+
+function formatDuration(seconds) {
+    if (seconds === null || seconds === undefined) return '-';
+    const h = Math.floor(seconds / 3600), m = Math.floor(seconds % 3600 / 60), s = seconds % 60;
+    return h ? `${h}h ${m}m` : m ? `${m}m ${s}s` : `${s}s`;
+}
+
+function updateImportProgress(p) {
+    const panel = document.getElementById('import-panel');
+    if (!panel || !p) return;
+    panel.classList.remove('hidden');
+    const set = (id, text) => { const el = document.getElementById(id); if (el) el.textContent = text; };
+    const c = p.categories || {};
+    set('import-state', p.state + (p.enumerating ? ' (scanning)' : ''));
+    set('import-done', `${p.done} / ${p.found}${p.enumerating ? '+' : ''}`);
+    set('import-rate', `${p.rate} files/s · ${p.enumerating && p.eta !== null ? '≥ ' : ''}${formatDuration(p.eta)}`);
+    set('import-categories', `${c.tv || 0} / ${c.movies || 0} / ${c.music || 0} / ${c.other || 0}`);
+    set('import-skipped', `${p.skipped} / ${p.failed}`);
+    const fill = document.getElementById('import-bar-fill');
+    if (fill) fill.style.width = p.found ? `${Math.round(p.done * 100 / p.found)}%` : '0';
+    const active = ['running', 'paused'].includes(p.state);
+    document.getElementById('import-pause')?.classList.toggle('hidden', p.state !== 'running');
+    document.getElementById('import-resume')?.classList.toggle('hidden', p.state !== 'paused');
+    document.getElementById('import-cancel')?.classList.toggle('hidden', !active);
+}
+
+async function controlImport(action) {
+    if (!isConnected) return showToast("Not connected to backend", "error");
+    if (action === 'cancel' && !confirm("Cancel the running import?")) return;
+    try {
+        const result = await eel.control_mass_import(action)();
+        if (result.success) updateImportProgress(result.progress);
+        else showToast(result.message, "error");
+    } catch (error) { showToast("Import control failed", "error"); }
+}
+
+async function loadImportStatus() {
+    if (!isConnected) return;
+    try {
+        const result = await eel.get_mass_import_status()();
+        if (!result.success) return;
+        if (result.progress) updateImportProgress(result.progress);
+        const unfinished = result.unfinished || [];
+        const box = document.getElementById('import-unfinished');
+        const label = document.getElementById('import-unfinished-folder');
+        if (label) label.textContent = unfinished[0] || '';
+        if (box) box.classList.toggle('hidden', unfinished.length === 0);
+    } catch (error) { console.error(error); }
+}
+
+function resumeUnfinishedImport() {
+    const folder = document.getElementById('import-unfinished-folder')?.textContent;
+    if (folder) runMassImport(folder);
+}
+
 async function testParser() {
     const filename = document.getElementById('test-filename')?.value;
     if (!filename) return showToast("Enter a filename", "warning");
@@ -305,6 +425,143 @@ async function testParser() {
     } catch (error) { showToast("Parser test failed", "error"); }
 }
 
+function updateCacheStats(stats) {
+    if (!stats) return;
+    if (elements.cacheEntries) elements.cacheEntries.textContent = stats.entries || 0;
+    if (elements.cacheNegative) elements.cacheNegative.textContent = stats.negative || 0;
+    if (elements.cacheSize) elements.cacheSize.textContent = `${stats.size_mb || 0} / ${stats.max_mb || 0} MB`;
+    if (elements.cacheHitRate) elements.cacheHitRate.textContent = `${stats.hit_rate || 0}% (${stats.hits || 0} hits)`;
+}
+
+async function loadCacheStats() {
+    if (!isConnected) return;
+    try {
+        const result = await eel.get_cache_stats()();
+        if (result.success) updateCacheStats(result.stats);
+    } catch (error) { console.error(error); }
+}
+
+async function purgeCache(mode) {
+    if (!isConnected) return showToast("Not connected to backend", "error");
+    if (mode === 'all' && !confirm("Clear the entire metadata cache?")) return;
+    try {
+        const result = await eel.purge_cache(mode)();
+        if (result.success) {
+            updateCacheStats(result.stats);
+            showToast(`Removed ${result.removed} cache entries`, "success");
+        } else { showToast("Purge failed: " + result.error, "error"); }
+    } catch (error) { showToast("Purge failed", "error"); }
+}
+
+let workerStatusTimer = null;
+
+async function loadWorkerStatus() {
+    if (!isConnected) return;
+    try {
+        const result = await eel.get_worker_status()();
+        if (!result.success) return;
+        for (const [name, el] of Object.entries(elements.workerStages || {})) {
+            if (!el) continue;
+            const stage = result.stages[name];
+            if (!stage) { el.textContent = '-'; continue; }
+            const range = stage.min === stage.max ? '' : ` (${stage.min}-${stage.max})`;
+            const flag = stage.saturated ? ', saturated' : '';
+            el.textContent = `${stage.workers}${range} · ${stage.queued} queued · ${stage.latency_ms} ms${flag}`;
+        }
+    } catch (error) { console.error(error); }
+}
+
+let lastMetrics = null;
+
+function metricSum(series, filter = () => true) {
+    return (series || []).filter(s => filter(s.labels)).reduce((sum, s) => sum + s.value, 0);
+}
+
+function formatBytes(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+    let i = 0;
+    while (bytes >= 1024 && i < units.length - 1) { bytes /= 1024; i++; }
+    return `${bytes.toFixed(i ? 1 : 0)} ${units[i]}`;
+}
+
+function formatSeconds(seconds) {
+    if (seconds === null || seconds === undefined) return '-';
+    return seconds < 1 ? `${Math.round(seconds * 1000)} ms` : `${seconds.toFixed(1)} s`;
+}
+
+async function loadMetrics() {
+    if (!isConnected) return;
+    try {
+        const result = await eel.get_metrics()();
+        if (!result.success) return;
+        const counters = result.counters, gauges = result.gauges, histograms = result.histograms;
+        const moved = metricSum(counters.mediasorter_moved_bytes_total);
+        const calls = metricSum(counters.mediasorter_api_requests_total);
+        const errors = metricSum(counters.mediasorter_api_errors_total);
+        const busy = {};
+        for (const s of counters.mediasorter_stage_busy_seconds_total || []) busy[s.labels.stage] = s.value;
+
+        // Rates are worked out between polls, like rate() would in Prometheus
+        const elapsed = lastMetrics ? result.time - lastMetrics.time : 0;
+        if (elements.metricsThroughput) {
+            elements.metricsThroughput.textContent = elapsed > 0
+                ? `${formatBytes(Math.max(0, moved - lastMetrics.moved) / elapsed)}/s` : '-';
+        }
+        if (elements.metricsMoved) elements.metricsMoved.textContent = formatBytes(moved);
+        if (elements.metricsApiCalls) elements.metricsApiCalls.textContent = calls;
+        if (elements.metricsApiErrors) {
+            elements.metricsApiErrors.textContent = calls || errors
+                ? `${errors} (${(errors / Math.max(calls, 1) * 100).toFixed(1)}%)` : '0';
+        }
+
+        const lines = [];
+        for (const h of histograms.mediasorter_stage_seconds || []) {
+            const stage = h.labels.stage;
+            const workers = metricSum(gauges.mediasorter_stage_workers, l => l.stage === stage);
+            const queued = metricSum(gauges.mediasorter_stage_queue_depth, l => l.stage === stage);
+            let util = '';
+            if (elapsed > 0 && workers && lastMetrics.busy[stage] !== undefined && busy[stage] !== undefined) {
+                util = ` · ${Math.min(100, Math.round((busy[stage] - lastMetrics.busy[stage]) / elapsed / workers * 100))}% busy`;
+            }
+            lines.push(`${stage.padEnd(16)} ${String(h.count).padStart(6)} items · p50 ${formatSeconds(h.p50)} · `
+                + `p95 ${formatSeconds(h.p95)} · p99 ${formatSeconds(h.p99)} · ${queued} queued${util}`);
+        }
+        for (const h of histograms.mediasorter_api_request_seconds || []) {
+            const provider = h.labels.provider;
+            const failed = metricSum(counters.mediasorter_api_errors_total, l => l.provider === provider);
+            const open = metricSum(gauges.mediasorter_circuit_open, l => l.provider === provider);
+            lines.push(`${provider.padEnd(16)} ${String(h.count).padStart(6)} calls · p50 ${formatSeconds(h.p50)} · `
+                + `p95 ${formatSeconds(h.p95)} · p99 ${formatSeconds(h.p99)} · ${failed} errors`
+                + (open ? ' · circuit open' : ''));
+        }
+        if (elements.metricsDetail) {
+            elements.metricsDetail.textContent = lines.join('\n');
+            elements.metricsDetail.classList.toggle('hidden', lines.length === 0);
+        }
+        lastMetrics = { time: result.time, moved, busy };
+    } catch (error) { console.error(error); }
+}
+
+async function loadJournalSummary() {
+    if (!isConnected) return;
+    try {
+        const result = await eel.get_journal_summary()();
+        if (!result.success) return;
+        const summary = result.summary;
+        const counts = summary.counts || {};
+        if (elements.journalPending) elements.journalPending.textContent = summary.pending || 0;
+        if (elements.journalDone) elements.journalDone.textContent = counts.done || 0;
+        if (elements.journalFailed) elements.journalFailed.textContent = counts.failed || 0;
+        if (elements.journalSkipped) elements.journalSkipped.textContent = counts.skipped || 0;
+        if (elements.journalFailures) {
+            const failures = summary.recent_failures || [];
+            elements.journalFailures.textContent = failures
+                .map(f => `[${f.at}] ${f.path}\n    ${f.reason || ''}`).join('\n');
+            elements.journalFailures.classList.toggle('hidden', failures.length === 0);
+        }
+    } catch (error) { console.error(error); }
+}
+
 function copyResults() {
     const output = document.getElementById('parser-output');
     if (output && output.textContent) {
@@ -318,7 +575,7 @@ function resetConfig() {
     if (confirm("Reset all settings to defaults?")) {
         populateConfig({
             monitor: '', tv: '', movie: '', music: '', other: '',
-            api_key: '', acoustid_key: '', use_ai_correction: true
+            api_key: '', acoustid_key: '', use_ai_correction: true, offline_mode: false
         });
         showToast("Settings reset", "info");
         addLog("Settings reset", "info");
@@ -338,14 +595,14 @@ function clearLogs() {
     }
 }
 
-function addLog(message, type = 'info') {
+function addLog(message, type = 'info', time = null) {
     if (!elements.logContainer) return;
     const empty = elements.logContainer.querySelector('.empty-log');
     if (empty) elements.logContainer.innerHTML = '';
     
     const entry = document.createElement('div');
     entry.className = `log-entry ${type}`;
-    const time = new Date().toLocaleTimeString();
+    time = time || new Date().toLocaleTimeString();
     entry.innerHTML = `<span class="log-time">[${time}]</span><span class="log-message">${message}</span>`;
     elements.logContainer.prepend(entry);
     
@@ -367,14 +624,36 @@ function showToast(message, type = 'info') {
 }
 
 // ===== PYTHON CALLBACKS =====
-eel.expose(js_add_log);
-function js_add_log(message, type = "info") { addLog(message, type); }
+function applyEvents(events) {
+    const fresh = (events || []).filter(e => e[0] > lastEventSeq);
+    if (!fresh.length) return;
+    lastEventSeq = fresh[fresh.length - 1][0];
+    // Only the newest 50 lines stay on screen, so don't build the rest
+    fresh.filter(e => e[1] === 'log').slice(-50)
+        .forEach(([, , message, type, time]) => addLog(message, type, time));
+    fresh.filter(e => e[1] === 'toast').slice(-3)
+        .forEach(([, , message, type]) => showToast(message, type));
+}
 
-eel.expose(js_update_stats);
-function js_update_stats(tv, movies, music, other) { updateStats({ tv, movies, music, other }); }
+async function loadEventBacklog() {
+    try {
+        const result = await eel.get_event_backlog(lastEventSeq)();
+        if (!result.success) return;
+        if (result.dropped) addLog(`${result.dropped} earlier log lines are no longer buffered`, "warning");
+        applyEvents(result.events);
+        updateStats(result.stats);
+        if (result.progress) updateImportProgress(result.progress);
+    } catch (error) { console.error(error); }
+}
 
-eel.expose(js_show_toast);
-function js_show_toast(message, type = "info") { showToast(message, type); }
+// Batched updates from the backend event bus, a few times a second at most
+eel.expose(js_events);
+function js_events(batch) {
+    if (batch.dropped) addLog(`${batch.dropped} log lines skipped (too many to show)`, "warning");
+    applyEvents(batch.events);
+    if (batch.stats) updateStats(batch.stats);
+    if (batch.progress) updateImportProgress(batch.progress);
+}
 
 // ===== GLOBAL EXPORTS =====
 window.switchTab = switchTab;
@@ -383,7 +662,14 @@ window.browseFolder = browseFolder;
 window.saveConfig = saveConfig;
 window.toggleMonitoring = toggleMonitoring;
 window.runMassImport = runMassImport;
+window.controlImport = controlImport;
+window.resumeUnfinishedImport = resumeUnfinishedImport;
 window.testParser = testParser;
 window.copyResults = copyResults;
 window.resetConfig = resetConfig;
-window.clearLogs = clearLogs;
\ No newline at end of file
+window.clearLogs = clearLogs;
+window.loadCacheStats = loadCacheStats;
+window.purgeCache = purgeCache;
+window.loadJournalSummary = loadJournalSummary;
+window.loadWorkerStatus = loadWorkerStatus;
+window.loadMetrics = loadMetrics;
\ No newline at end of file